@@ -1,12 +1,12 @@
 from django.contrib import admin
 from django.core.exceptions import ValidationError
 #import cv2
-from .models import News, CurrencyRate, BackgroundImage, NewsSource, CurrencyRateHistory
+from .models import News, CurrencyRate, BackgroundImage, NewsSource, CurrencyRateHistory, CurrencyDailyRate, CurrencyRateRollup, ForexSnapshot, TrackedCoin, JobRun
 from django.contrib import messages
 
 @admin.register(News)
 class NewsAdmin(admin.ModelAdmin):
-    list_display = ('title', 'date_published', 'source')
+    list_display = ('title', 'date_published', 'source', 'likes_count', 'dislikes_count', 'comments_count')
     search_fields = ('title', 'source__name')
     list_filter = ('source',)
     fields = ('title', 'description', 'date_published', 'image', 'background_image', 'source')
@@ -16,8 +16,15 @@ class NewsSourceAdmin(admin.ModelAdmin):
     list_display = ('name', 'feed_url', 'is_active')
     list_filter = ('is_active',)
     search_fields = ('name', 'feed_url')
+    readonly_fields = ('etag', 'modified')
     actions = ['update_news_from_sources']
 
+    def save_model(self, request, obj, form, change):
+        # Валидаторы относятся к прежнему адресу канала: новый канал загружаем полностью
+        if 'feed_url' in form.changed_data:
+            obj.etag = obj.modified = ''
+        super().save_model(request, obj, form, change)
+
     @admin.action(description="Обновить новости из выбранных источников")
     def update_news_from_sources(self, request, queryset):
         try:
@@ -82,4 +89,74 @@ class CurrencyRateHistoryAdmin(admin.ModelAdmin):
     
     def has_delete_permission(self, request, obj=None):
         # Разрешаем удаление только для очистки старых записей
-        return True
\ No newline at end of file
+        return True
+
+
+@admin.register(CurrencyDailyRate)
+class CurrencyDailyRateAdmin(admin.ModelAdmin):
+    list_display = ('currency_name', 'rate', 'date', 'source')
+    list_filter = ('currency_name', 'source')
+    search_fields = ('currency_name',)
+    date_hierarchy = 'date'
+    readonly_fields = ('currency_name', 'rate', 'date', 'source')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CurrencyRateRollup)
+class CurrencyRateRollupAdmin(admin.ModelAdmin):
+    list_display = ('currency_name', 'resolution', 'bucket_start', 'open', 'high', 'low', 'close', 'samples')
+    list_filter = ('currency_name', 'resolution')
+    search_fields = ('currency_name',)
+    date_hierarchy = 'bucket_start'
+    readonly_fields = ('currency_name', 'resolution', 'bucket_start', 'open', 'high', 'low', 'close', 'samples')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ForexSnapshot)
+class ForexSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('fetched_at', 'base', 'source')
+    list_filter = ('base', 'source')
+    date_hierarchy = 'fetched_at'
+    exclude = ('rates',)
+    readonly_fields = ('base', 'currencies', 'source', 'fetched_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TrackedCoin)
+class TrackedCoinAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'symbol', 'coingecko_id', 'fallback_price', 'is_active', 'sort_order')
+    list_editable = ('is_active', 'sort_order')
+    list_filter = ('is_active',)
+    search_fields = ('code', 'name', 'coingecko_id')
+
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ('job_name', 'status', 'started_at', 'duration', 'rows_upserted', 'rows_deleted', 'error_class')
+    list_filter = ('job_name', 'status')
+    date_hierarchy = 'started_at'
+    readonly_fields = (
+        'job_name', 'status', 'started_at', 'finished_at', 'duration',
+        'rows_upserted', 'rows_deleted', 'provider_latencies', 'error_class'
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+# Окна индикаторов по умолчанию (в точках ряда)
+DEFAULT_SMA_WINDOWS = (7, 30)
+DEFAULT_EMA_WINDOWS = (12,)
+DEFAULT_VOLATILITY_WINDOW = 7
+
+# Ограничения параметров, чтобы один запрос не мог заставить считать сотни индикаторов
+MAX_WINDOW = 365
+MAX_WINDOWS_PER_INDICATOR = 5
+
+
+def parse_windows(value, default):
+    """
+    Разбирает список окон вида "7,30". Пустое значение дает окна по умолчанию.
+    Некорректные окна вызывают ValueError.
+    """
+    if value in (None, ''):
+        return tuple(default)
+    try:
+        windows = tuple(sorted({int(item) for item in str(value).split(',') if item.strip()}))
+    except ValueError:
+        raise ValueError(f"Некорректные окна индикатора: {value}")
+    if not windows or len(windows) > MAX_WINDOWS_PER_INDICATOR or not all(2 <= window <= MAX_WINDOW for window in windows):
+        raise ValueError(f"Окна индикатора должны быть от 2 до {MAX_WINDOW}, не более {MAX_WINDOWS_PER_INDICATOR} шт.")
+    return windows
+
+
+def _to_list(values):
+    """Переводит массив в список для JSON: значения округляются, пропуски (NaN) становятся None"""
+    array = np.round(np.asarray(values, dtype='float64'), 6)
+    result = array.astype(object)
+    result[np.isnan(array)] = None
+    return result.tolist()
+
+
+def compute_analytics(columns, sma_windows=DEFAULT_SMA_WINDOWS, ema_windows=DEFAULT_EMA_WINDOWS,
+                      volatility_window=DEFAULT_VOLATILITY_WINDOW):
+    """
+    Считает индикаторы по ряду в столбцовом виде {'t': [...], 'v': [...]}.
+    Все вычисления векторные: доходности (в процентах к предыдущей точке), скользящие средние SMA и EMA,
+    скользящая волатильность (стандартное отклонение доходностей) и сводка по всему ряду.
+    Ряды индикаторов выровнены по 't' и содержат None там, где окно еще не заполнено.
+    """
+    values = pd.Series(columns['v'], dtype='float64')
+    result = {
+        't': list(columns['t']),
+        'returns': [],
+        'sma': {str(window): [] for window in sma_windows},
+        'ema': {str(window): [] for window in ema_windows},
+        'volatility': [],
+        'summary': None,
+    }
+    if values.empty:
+        return result
+
+    returns = values.pct_change() * 100
+    result['returns'] = _to_list(returns)
+    for window in sma_windows:
+        result['sma'][str(window)] = _to_list(values.rolling(window).mean())
+    for window in ema_windows:
+        result['ema'][str(window)] = _to_list(values.ewm(span=window, adjust=False).mean())
+    result['volatility'] = _to_list(returns.rolling(volatility_window).std())
+
+    first, last = values.iloc[0], values.iloc[-1]
+    min_index, max_index = int(values.idxmin()), int(values.idxmax())
+    result['summary'] = {
+        'first': float(first),
+        'last': float(last),
+        'min': float(values.iloc[min_index]),
+        'min_t': columns['t'][min_index],
+        'max': float(values.iloc[max_index]),
+        'max_t': columns['t'][max_index],
+        'change': round(float(last - first), 6),
+        'percent_change': round(float((last / first - 1) * 100), 6) if first else None,
+        'mean_return': _to_list([returns.mean()])[0],
+        'volatility': _to_list([returns.std()])[0],
+    }
+    return result
+
+
+def select_points(analytics, indices):
+    """Оставляет в рядах индикаторов только точки с заданными индексами (после прореживания графика)"""
+    if indices is None:
+        return analytics
+
+    def pick(series):
+        return [series[index] for index in indices] if series else series
+
+    return {
+        **analytics,
+        't': pick(analytics['t']),
+        'returns': pick(analytics['returns']),
+        'sma': {window: pick(series) for window, series in analytics['sma'].items()},
+        'ema': {window: pick(series) for window, series in analytics['ema'].items()},
+        'volatility': pick(analytics['volatility']),
+    }
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 from django.db.models.signals import post_migrate
 from django.contrib import admin
 import sys
@@ -8,20 +9,17 @@ class AdConfig(AppConfig):
     name = 'Ad'
 
     def ready(self):
-        # Инициализируем планировщик только когда запускается runserver
-        # или когда запускается WSGI/ASGI сервер
+        # Фоновые задачи выполняет отдельный процесс (manage.py run_scheduler).
+        # Веб-процессы запускают планировщик, только если это явно включено в SCHEDULER_IN_WEB_PROCESS
         is_server_command = 'runserver' in sys.argv or 'gunicorn' in sys.argv[0] or 'uvicorn' in sys.argv[0]
         
-        if is_server_command:
+        if is_server_command and settings.SCHEDULER_IN_WEB_PROCESS:
             from .tasks import SchedulerSingleton
             SchedulerSingleton.get_instance()
 
-        # Отмена регистрации моделей Django APScheduler
-        from django_apscheduler.models import DjangoJobExecution, DjangoJob
-        try:
-            admin.site.unregister(DjangoJobExecution)
-        except admin.sites.NotRegistered:
-            pass
+        # Отмена регистрации задач Django APScheduler: расписание задается в коде (SchedulerSingleton.SCHEDULED_JOBS).
+        # История выполнения задач (DjangoJobExecution) остается в админке
+        from django_apscheduler.models import DjangoJob
         try:
             admin.site.unregister(DjangoJob)
         except admin.sites.NotRegistered:
@@ -0,0 +1,360 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+import logging
+import threading
+import time
+
+from .currency_history import to_columns
+
+logger = logging.getLogger(__name__)
+
+# Время, в течение которого закешированная история считается свежей (в секундах).
+# Дневной график строится по почасовым данным, поэтому свежим остается не дольше часа
+CURRENCY_CACHE_TTL = getattr(settings, 'CURRENCY_CACHE_TTL', {
+    'day': 60 * 60,
+    'week': 6 * 60 * 60,
+    'month': 12 * 60 * 60,
+    'year': 24 * 60 * 60,
+})
+DEFAULT_CURRENCY_CACHE_TTL = 60 * 60
+
+# Сколько секунд после устаревания историю еще можно отдавать, обновляя ее в фоне.
+# Более старые данные не отдаются: пользователь ждет синхронного обновления
+CURRENCY_CACHE_MAX_STALE = getattr(settings, 'CURRENCY_CACHE_MAX_STALE', {
+    'day': 3 * 60 * 60,
+    'week': 24 * 60 * 60,
+    'month': 2 * 24 * 60 * 60,
+    'year': 7 * 24 * 60 * 60,
+})
+DEFAULT_CURRENCY_CACHE_MAX_STALE = 3 * 60 * 60
+
+# Отметки свежести данных в ответе API
+FRESHNESS_FRESH = 'fresh'
+FRESHNESS_STALE = 'stale'
+
+# Поколение кеша: при обновлении курсов увеличивается, и все записи прошлых поколений считаются устаревшими
+GENERATION_KEY = 'currency_history_generation'
+
+# Сколько секунд ждать результат чужого запроса к внешнему API, прежде чем выполнить свой
+SINGLE_FLIGHT_WAIT_TIMEOUT = getattr(settings, 'CURRENCY_SINGLE_FLIGHT_WAIT_TIMEOUT', 15)
+SINGLE_FLIGHT_POLL_INTERVAL = 0.1
+
+# Сколько промахов пакетного запроса загружать параллельно
+BATCH_MAX_WORKERS = getattr(settings, 'CURRENCY_BATCH_MAX_WORKERS', 4)
+
+
+def _get_generation():
+    """Возвращает текущее поколение кеша истории курсов"""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+        generation = cache.get(GENERATION_KEY, 0)
+    return generation
+
+
+# Попадания и промахи кеша истории в текущем процессе. Счетчики хранятся в памяти,
+# чтобы запросы не записывали общий кеш и не теряли обновления при одновременной записи
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _count_lookup(entry):
+    """Учитывает попадание или промах кеша истории"""
+    with _stats_lock:
+        _stats['hits' if entry is not None else 'misses'] += 1
+
+
+def history_cache_key(currency_code, period):
+    """Ключ истории курса в кеше"""
+    return f"currency_history:{currency_code}:{period}"
+
+
+def _fresh_until(period, fetched_at):
+    """
+    Момент (unix time), до которого загруженная история считается свежей.
+    Дневные данные устаревают не позже начала следующего часа, когда в БД появляются новые курсы.
+    """
+    fresh_until = fetched_at + CURRENCY_CACHE_TTL.get(period, DEFAULT_CURRENCY_CACHE_TTL)
+    if period == 'day':
+        next_hour = datetime.fromtimestamp(fetched_at).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        fresh_until = min(fresh_until, next_hour.timestamp())
+    return fresh_until
+
+
+def _is_fresh(entry):
+    """Проверяет, что запись кеша не устарела по времени и относится к текущему поколению"""
+    return entry['generation'] == _get_generation() and time.time() < entry['fresh_until']
+
+
+def _is_servable(entry, period):
+    """Проверяет, что устаревшую запись еще можно отдать пользователю, пока она обновляется в фоне"""
+    max_stale = CURRENCY_CACHE_MAX_STALE.get(period, DEFAULT_CURRENCY_CACHE_MAX_STALE)
+    return time.time() < entry['fresh_until'] + max_stale
+
+
+def get_cached_history(currency_code, period, key=None):
+    """Возвращает запись истории курса из кеша или None, учитывая попадания и промахи"""
+    entry = cache.get(key or history_cache_key(currency_code, period))
+    _count_lookup(entry)
+    return entry
+
+
+def set_cached_history(currency_code, period, data, key=None):
+    """
+    Сохраняет историю курса в кеш вместе со временем загрузки и поколением.
+    Запись хранится, пока ее еще можно отдавать в устаревшем виде.
+    """
+    fetched_at = time.time()
+    entry = {
+        'data': data,
+        # Столбцовое представление считается один раз при загрузке, а не при каждом ответе
+        'columns': to_columns(data),
+        'fetched_at': fetched_at,
+        'fresh_until': _fresh_until(period, fetched_at),
+        'generation': _get_generation(),
+    }
+    max_stale = CURRENCY_CACHE_MAX_STALE.get(period, DEFAULT_CURRENCY_CACHE_MAX_STALE)
+    cache.set(
+        key or history_cache_key(currency_code, period), entry,
+        timeout=int(entry['fresh_until'] - fetched_at + max_stale)
+    )
+    return entry
+
+
+class _InFlightCall:
+    """Выполняющийся запрос к источнику данных, результат которого ждут остальные потоки"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_in_flight_calls = {}
+_in_flight_lock = threading.Lock()
+
+
+def single_flight(key, func):
+    """
+    Объединяет одновременные вызовы func с одинаковым ключом внутри процесса:
+    первый поток выполняет func, остальные ждут и получают тот же результат (или ту же ошибку).
+    """
+    with _in_flight_lock:
+        call = _in_flight_calls.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = _InFlightCall()
+            _in_flight_calls[key] = call
+
+    if not is_leader:
+        if call.event.wait(SINGLE_FLIGHT_WAIT_TIMEOUT):
+            if call.error is not None:
+                raise call.error
+            return call.result
+        # Запрос выполняется слишком долго - не ждем его дальше
+        logger.warning(f"Не дождались результата запроса {key}, выполняем собственный")
+        return func()
+
+    try:
+        call.result = func()
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight_calls.pop(key, None)
+        call.event.set()
+
+
+def _load_with_shared_lock(key, currency_code, period, loader):
+    """
+    Загружает историю, допуская только один запрос к внешнему API на ключ среди всех воркеров.
+    Воркеры, не получившие блокировку, ждут, пока в общем кеше появится свежая запись.
+    """
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, timeout=SINGLE_FLIGHT_WAIT_TIMEOUT):
+        try:
+            return set_cached_history(currency_code, period, loader(currency_code, period), key=key)
+        finally:
+            cache.delete(lock_key)
+
+    # Данные уже загружает другой воркер
+    deadline = time.monotonic() + SINGLE_FLIGHT_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and _is_fresh(entry):
+            return entry
+        if cache.get(lock_key) is None:
+            # Блокировка снята, но свежих данных нет - загрузка у другого воркера завершилась ошибкой
+            break
+
+    return set_cached_history(currency_code, period, loader(currency_code, period), key=key)
+
+
+def _refresh_in_background(key, currency_code, period, loader):
+    """
+    Обновляет устаревшую запись в кеше.
+    Если обновление уже выполняет другой поток или воркер, ничего не делает.
+    """
+    lock_key = f"{key}:lock"
+    try:
+        if not cache.add(lock_key, 1, timeout=SINGLE_FLIGHT_WAIT_TIMEOUT):
+            return
+        try:
+            set_cached_history(currency_code, period, loader(currency_code, period), key=key)
+        finally:
+            cache.delete(lock_key)
+    except Exception as e:
+        logger.error(f"Ошибка фонового обновления истории {currency_code} за период {period}: {str(e)}")
+    finally:
+        with _in_flight_lock:
+            _background_refreshes.discard(key)
+
+
+_background_refreshes = set()
+
+
+def _run_in_background(func):
+    """Запускает функцию в отдельном фоновом потоке"""
+    def target():
+        try:
+            func()
+        finally:
+            # Поток не принадлежит Django, поэтому закрываем открытые им соединения с БД сами
+            connections.close_all()
+
+    threading.Thread(target=target, daemon=True).start()
+
+
+def _schedule_refresh(key, currency_code, period, loader):
+    """Запускает фоновое обновление записи, если оно еще не запущено в этом процессе"""
+    with _in_flight_lock:
+        if key in _background_refreshes:
+            return
+        _background_refreshes.add(key)
+    _run_in_background(lambda: _refresh_in_background(key, currency_code, period, loader))
+
+
+def _describe(entry, freshness):
+    """Формирует результат запроса истории с отметкой свежести данных"""
+    return {
+        'data': entry['data'],
+        'columns': entry.get('columns') or to_columns(entry['data']),
+        'freshness': freshness,
+        'fetched_at': datetime.fromtimestamp(entry['fetched_at'], tz=dt_timezone.utc).isoformat(),
+    }
+
+
+def get_or_load_history_entry(currency_code, period, loader):
+    """
+    Возвращает историю курса вместе с отметкой свежести ('fresh' или 'stale') и временем загрузки.
+    Свежая запись отдается из кеша. Устаревшая отдается сразу, а в фоне запускается ее обновление.
+    Если записи нет или она старше допустимого, история загружается функцией loader(currency_code, period),
+    причем одновременные запросы по одному ключу приводят к единственному запросу к внешнему API.
+    """
+    key = history_cache_key(currency_code, period)
+    entry = get_cached_history(currency_code, period, key=key)
+    if entry is not None:
+        if _is_fresh(entry):
+            return _describe(entry, FRESHNESS_FRESH)
+        if _is_servable(entry, period):
+            _schedule_refresh(key, currency_code, period, loader)
+            return _describe(entry, FRESHNESS_STALE)
+
+    entry = single_flight(key, lambda: _load_with_shared_lock(key, currency_code, period, loader))
+    return _describe(entry, FRESHNESS_FRESH)
+
+
+def _load_in_worker(key, currency_code, period, loader):
+    """Загружает историю в потоке пула и закрывает открытые им соединения с БД"""
+    try:
+        return single_flight(key, lambda: _load_with_shared_lock(key, currency_code, period, loader))
+    finally:
+        connections.close_all()
+
+
+def get_or_load_many(pairs, loader):
+    """
+    Возвращает историю для списка пар (currency_code, period) в виде {пара: результат get_or_load_history_entry}.
+    Закешированные записи читаются из кеша одним запросом, а промахи загружаются параллельно.
+    """
+    keys = {pair: history_cache_key(*pair) for pair in pairs}
+    cached = cache.get_many(list(keys.values()))
+
+    results = {}
+    missing = []
+    for pair, key in keys.items():
+        currency_code, period = pair
+        entry = cached.get(key)
+        _count_lookup(entry)
+        if entry is not None and _is_fresh(entry):
+            results[pair] = _describe(entry, FRESHNESS_FRESH)
+        elif entry is not None and _is_servable(entry, period):
+            _schedule_refresh(key, currency_code, period, loader)
+            results[pair] = _describe(entry, FRESHNESS_STALE)
+        else:
+            missing.append(pair)
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(len(missing), BATCH_MAX_WORKERS)) as executor:
+            futures = {
+                pair: executor.submit(_load_in_worker, keys[pair], pair[0], pair[1], loader)
+                for pair in missing
+            }
+        for pair, future in futures.items():
+            results[pair] = _describe(future.result(), FRESHNESS_FRESH)
+    return results
+
+
+def get_or_compute_derived(currency_code, period, history, name, compute):
+    """
+    Возвращает результат вычисления над рядом истории, закешированный рядом с самим рядом.
+    В ключ входит время загрузки ряда, поэтому после обновления ряда результат пересчитывается,
+    а живет он столько же, сколько может храниться сам ряд.
+    """
+    key = f"{history_cache_key(currency_code, period)}:{name}:{history['fetched_at']}"
+    result = cache.get(key)
+    if result is None:
+        result = compute(history)
+        timeout = (
+            CURRENCY_CACHE_TTL.get(period, DEFAULT_CURRENCY_CACHE_TTL)
+            + CURRENCY_CACHE_MAX_STALE.get(period, DEFAULT_CURRENCY_CACHE_MAX_STALE)
+        )
+        cache.set(key, result, timeout=timeout)
+    return result
+
+
+def invalidate_currency_cache():
+    """
+    Помечает всю закешированную историю курсов устаревшей: при следующем запросе
+    она будет отдана с отметкой 'stale' и обновлена в фоне.
+    Поколение хранится в общем кеше, поэтому сброс виден всем воркерам.
+    """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+    logger.debug("Кеш истории курсов валют сброшен")
+
+
+def get_cache_stats():
+    """Возвращает количество попаданий и промахов кеша истории курсов в текущем процессе"""
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def reset_cache_stats():
+    """Сбрасывает счетчики попаданий и промахов кеша истории курсов"""
+    with _stats_lock:
+        _stats['hits'] = _stats['misses'] = 0
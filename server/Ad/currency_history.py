@@ -0,0 +1,476 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+import xml.etree.ElementTree as ET
+import logging
+
+from . import http_client
+from .models import CurrencyDailyRate, CurrencyRate, CurrencyRateHistory, CurrencyRateRollup, TrackedCoin
+
+logger = logging.getLogger(__name__)
+
+# Длина периодов графиков, которые строятся по дневным курсам (в днях)
+PERIOD_DAYS = {
+    'week': 7,
+    'month': 30,
+    'year': 365,
+}
+
+# На сколько дней раньше недостающего диапазона запрашивать курсы.
+# ЦБ РФ не публикует курсы в выходные и праздники, поэтому первые дни диапазона
+# заполняются последним курсом, опубликованным до них
+BACKFILL_LOOKBACK_DAYS = 10
+
+# Через сколько секунд повторять запрос диапазона, за который источник не вернул курсов
+BACKFILL_EMPTY_RETRY_TIMEOUT = getattr(settings, 'BACKFILL_EMPTY_RETRY_TIMEOUT', 6 * 60 * 60)
+
+# Сколько дней хранить почасовую свернутую историю. Дневная свертка строится из почасовой
+# и хранится бессрочно
+HOURLY_ROLLUP_RETENTION_DAYS = getattr(settings, 'HOURLY_ROLLUP_RETENTION_DAYS', 90)
+
+# Множитель, переводящий значения в целые числа при разностном кодировании (4 знака после запятой)
+DELTA_SCALE = 10000
+
+# Коды валют для API ЦБ РФ
+# Полный список кодов: http://www.cbr.ru/scripts/XML_val.asp?d=0
+CB_CURRENCY_CODES = {
+    'USD': 'R01235',  # Доллар США
+    'EUR': 'R01239',  # Евро
+    'CNY': 'R01375',  # Китайский юань
+    'GBP': 'R01035',  # Фунт стерлингов
+}
+
+
+def get_coin(currency_code):
+    """
+    Возвращает описание криптовалюты из реестра отслеживаемых монет или None для остальных валют.
+    Валюты ЦБ РФ известны заранее, поэтому для них реестр не запрашивается.
+    """
+    if currency_code in CB_CURRENCY_CODES:
+        return None
+    return TrackedCoin.get_registry().get(currency_code)
+
+
+def is_crypto(currency_code):
+    """Является ли валюта отслеживаемой криптовалютой"""
+    return get_coin(currency_code) is not None
+
+
+def period_bounds(period, today=None):
+    """
+    Возвращает первую и последнюю дату таблицы дневных курсов за период.
+    Курс за текущий день еще меняется, поэтому в таблицу попадают только завершенные дни.
+    """
+    today = today or date.today()
+    return today - timedelta(days=PERIOD_DAYS[period]), today - timedelta(days=1)
+
+
+def missing_ranges(currency_code, start, end):
+    """
+    Возвращает диапазоны дат [(с, по), ...] внутри [start, end], которых нет в таблице.
+    Таблица заполняется непрерывно, поэтому недостающими могут быть только начало и конец диапазона.
+    """
+    bounds = CurrencyDailyRate.objects.filter(currency_name=currency_code).aggregate(
+        first=Min('date'), last=Max('date')
+    )
+    first, last = bounds['first'], bounds['last']
+    if first is None:
+        return [(start, end)]
+
+    ranges = []
+    if start < first:
+        ranges.append((start, min(end, first - timedelta(days=1))))
+    if last < end:
+        ranges.append((max(start, last + timedelta(days=1)), end))
+    return ranges
+
+
+def fetch_cb_daily_rates(currency_code, date_from, date_to):
+    """Получает курсы валюты из ЦБ РФ за диапазон дат в виде {дата: курс}"""
+    cb_code = CB_CURRENCY_CODES.get(currency_code)
+    if not cb_code:
+        raise ValueError(f"Неизвестный код валюты для ЦБ РФ: {currency_code}")
+
+    # Документация: http://www.cbr.ru/development/SXML/
+    response = http_client.get(
+        "http://www.cbr.ru/scripts/XML_dynamic.asp",
+        params={
+            'date_req1': date_from.strftime("%d/%m/%Y"),
+            'date_req2': date_to.strftime("%d/%m/%Y"),
+            'VAL_NM_RQ': cb_code,
+        },
+        provider='cbr'
+    )
+    response.raise_for_status()
+
+    rates = {}
+    for record in ET.fromstring(response.content).findall('Record'):
+        record_date = datetime.strptime(record.get('Date'), "%d.%m.%Y").date()
+        value = Decimal(record.find('Value').text.replace(',', '.'))
+        # Курс в ЦБ РФ указывается за номинал (например, за 10 юаней)
+        nominal = record.find('Nominal')
+        if nominal is not None and nominal.text:
+            value = value / Decimal(nominal.text)
+        rates[record_date] = value.quantize(Decimal('0.0001'))
+    return rates
+
+
+def fetch_coingecko_daily_rates(currency_code, date_from, date_to):
+    """Получает цены закрытия криптовалюты в долларах из CoinGecko за диапазон дат в виде {дата: цена}"""
+    coin = get_coin(currency_code)
+    if not coin:
+        raise ValueError(f"Неизвестный код криптовалюты: {currency_code}")
+
+    response = http_client.get(
+        f"https://api.coingecko.com/api/v3/coins/{coin['coingecko_id']}/market_chart/range",
+        params={
+            'vs_currency': 'usd',
+            'from': int(datetime.combine(date_from, dt_time.min).timestamp()),
+            'to': int(datetime.combine(date_to, dt_time.max).timestamp()),
+        },
+        provider='coingecko'
+    )
+    response.raise_for_status()
+
+    # Для коротких диапазонов CoinGecko отдает почасовые цены - берем последнюю цену каждого дня
+    rates = {}
+    for timestamp, price in sorted(response.json().get('prices', [])):
+        rates[datetime.fromtimestamp(timestamp / 1000).date()] = Decimal(str(round(price, 4)))
+    return rates
+
+
+def fetch_cryptocompare_daily_rates(currency_code, date_from, date_to):
+    """Получает цены закрытия криптовалюты в долларах из CryptoCompare за диапазон дат в виде {дата: цена}"""
+    coin = get_coin(currency_code)
+    if not coin:
+        raise ValueError(f"Неизвестный код криптовалюты: {currency_code}")
+
+    response = http_client.get(
+        "https://min-api.cryptocompare.com/data/v2/histoday",
+        params={
+            'fsym': coin['cryptocompare_symbol'],
+            'tsym': 'USD',
+            'limit': (date_to - date_from).days,
+            'toTs': int(datetime.combine(date_to, dt_time(12), tzinfo=dt_timezone.utc).timestamp()),
+        },
+        provider='cryptocompare'
+    )
+    response.raise_for_status()
+    data = response.json()
+    if data.get('Response') == 'Error':
+        raise Exception(data.get('Message'))
+
+    rates = {}
+    for point in data['Data']['Data']:
+        point_date = datetime.fromtimestamp(point['time'], tz=dt_timezone.utc).date()
+        rates[point_date] = Decimal(str(round(point['close'], 4)))
+    return rates
+
+
+def fetch_daily_rates(currency_code, date_from, date_to):
+    """
+    Получает дневные курсы из внешнего источника.
+    Возвращает пару ({дата: курс}, название источника).
+    """
+    if not is_crypto(currency_code):
+        return fetch_cb_daily_rates(currency_code, date_from, date_to), 'ЦБ РФ'
+
+    try:
+        return fetch_coingecko_daily_rates(currency_code, date_from, date_to), 'CoinGecko'
+    except Exception as e:
+        logger.error(f"Ошибка при получении дневных цен {currency_code} из CoinGecko: {str(e)}")
+        return fetch_cryptocompare_daily_rates(currency_code, date_from, date_to), 'CryptoCompare'
+
+
+def _empty_range_key(currency_code, range_start, range_end):
+    return f"currency_daily_empty:{currency_code}:{range_start.isoformat()}:{range_end.isoformat()}"
+
+
+def backfill_daily_rates(currency_code, start, end):
+    """
+    Догружает в таблицу дневные курсы, которых не хватает в диапазоне [start, end].
+    Дни без опубликованного курса (выходные, праздники) заполняются последним известным курсом,
+    поэтому таблица остается непрерывной. Дни до первого известного курса не заполняются.
+    Диапазон, который источник не покрыл, повторно запрашивается не раньше чем через
+    BACKFILL_EMPTY_RETRY_TIMEOUT секунд. Возвращает количество добавленных записей.
+    """
+    created = 0
+    for range_start, range_end in missing_ranges(currency_code, start, end):
+        empty_key = _empty_range_key(currency_code, range_start, range_end)
+        if cache.get(empty_key):
+            continue
+
+        rates, source = fetch_daily_rates(
+            currency_code, range_start - timedelta(days=BACKFILL_LOOKBACK_DAYS), range_end
+        )
+        if not rates or min(rates) > range_start:
+            # Источник не покрыл начало диапазона (нет данных или валюта появилась позже)
+            cache.set(empty_key, True, timeout=BACKFILL_EMPTY_RETRY_TIMEOUT)
+        if not rates:
+            logger.warning(f"Нет дневных курсов {currency_code} за {range_start} - {range_end}")
+            continue
+
+        records = []
+        last_rate = None
+        day = min(rates)
+        while day <= range_end:
+            last_rate = rates.get(day, last_rate)
+            if day >= range_start:
+                records.append(CurrencyDailyRate(
+                    currency_name=currency_code, date=day, rate=last_rate, source=source
+                ))
+            day += timedelta(days=1)
+
+        CurrencyDailyRate.objects.bulk_create(records, ignore_conflicts=True)
+        created += len(records)
+        logger.info(f"Загружено {len(records)} дневных курсов {currency_code} за {range_start} - {range_end}")
+    return created
+
+
+def get_daily_history(currency_code, period):
+    """
+    Возвращает историю курса за неделю, месяц или год из таблицы дневных курсов.
+    Таблицу заполняет плановая задача (SchedulerSingleton.backfill_daily_history),
+    поэтому запрос страницы не обращается к внешним API.
+    """
+    start, end = period_bounds(period)
+    rows = CurrencyDailyRate.objects.filter(
+        currency_name=currency_code,
+        date__gte=start,
+        date__lte=end
+    ).order_by('date').values_list('date', 'rate')
+    result = [{'date': day.strftime("%Y-%m-%d"), 'value': float(rate)} for day, rate in rows]
+
+    # Текущий день берем из последнего обновления курса
+    if result:
+        current = CurrencyRate.objects.filter(currency_name=currency_code).order_by('-updated_at').first()
+        if current:
+            result.append({'date': (end + timedelta(days=1)).strftime("%Y-%m-%d"), 'value': float(current.rate)})
+    return result
+
+
+def _hour_start(timestamp):
+    """Начало часа, в который попадает момент времени (по местному времени)"""
+    return timezone.localtime(timestamp).replace(minute=0, second=0, microsecond=0)
+
+
+def _day_start(timestamp):
+    """Начало дня, в который попадает момент времени (по местному времени)"""
+    return timezone.localtime(timestamp).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _after_last_bucket(resolution, field, step):
+    """
+    Условие на записи, которые еще не свернуты в интервалы resolution: для каждой валюты
+    только записи после ее последнего свернутого интервала, у новой валюты - все записи.
+    """
+    last_buckets = dict(
+        CurrencyRateRollup.objects.filter(resolution=resolution)
+        .values('currency_name').annotate(last=Max('bucket_start')).values_list('currency_name', 'last')
+    )
+    condition = ~Q(currency_name__in=list(last_buckets))
+    for currency_name, last_bucket in last_buckets.items():
+        condition |= Q(currency_name=currency_name, **{f'{field}__gte': last_bucket + step})
+    return condition
+
+
+def _save_buckets(buckets):
+    """Записывает интервалы OHLC, перезаписывая уже свернутые"""
+    if buckets:
+        CurrencyRateRollup.objects.bulk_create(
+            buckets,
+            update_conflicts=True,
+            unique_fields=['currency_name', 'resolution', 'bucket_start'],
+            update_fields=['open', 'high', 'low', 'close', 'samples'],
+            batch_size=500
+        )
+    return len(buckets)
+
+
+def _rollup_hours(now):
+    """Сворачивает записи CurrencyRateHistory в OHLC за каждый завершенный час"""
+    resolution = CurrencyRateRollup.RESOLUTION_HOUR
+    rows = CurrencyRateHistory.objects.filter(
+        _after_last_bucket(resolution, 'timestamp', timedelta(hours=1)),
+        timestamp__lt=_hour_start(now)
+    )
+
+    buckets = {}
+    for currency_name, timestamp, rate in rows.order_by('timestamp').values_list(
+        'currency_name', 'timestamp', 'rate'
+    ).iterator():
+        key = (currency_name, _hour_start(timestamp))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = CurrencyRateRollup(
+                currency_name=currency_name, resolution=resolution, bucket_start=key[1],
+                open=rate, high=rate, low=rate, close=rate, samples=1
+            )
+        else:
+            bucket.high = max(bucket.high, rate)
+            bucket.low = min(bucket.low, rate)
+            bucket.close = rate
+            bucket.samples += 1
+    return _save_buckets(list(buckets.values()))
+
+
+def _rollup_days(now):
+    """Сворачивает завершенные часы в OHLC за каждый завершенный день"""
+    resolution = CurrencyRateRollup.RESOLUTION_DAY
+    hours = CurrencyRateRollup.objects.filter(
+        _after_last_bucket(resolution, 'bucket_start', timedelta(days=1)),
+        resolution=CurrencyRateRollup.RESOLUTION_HOUR,
+        bucket_start__lt=_day_start(now)
+    )
+
+    buckets = {}
+    for hour in hours.order_by('bucket_start').iterator():
+        key = (hour.currency_name, _day_start(hour.bucket_start))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = CurrencyRateRollup(
+                currency_name=hour.currency_name, resolution=resolution, bucket_start=key[1],
+                open=hour.open, high=hour.high, low=hour.low, close=hour.close, samples=hour.samples
+            )
+        else:
+            bucket.high = max(bucket.high, hour.high)
+            bucket.low = min(bucket.low, hour.low)
+            bucket.close = hour.close
+            bucket.samples += hour.samples
+    return _save_buckets(list(buckets.values()))
+
+
+def rollup_currency_history(now=None):
+    """
+    Сжимает историю курсов по уровням: записи CurrencyRateHistory сворачиваются в OHLC за завершенные часы,
+    а завершенные часы - в OHLC за завершенные дни. Почасовая свертка хранится HOURLY_ROLLUP_RETENTION_DAYS дней,
+    дневная - бессрочно. Для каждой валюты обрабатываются только данные после ее последнего свернутого интервала,
+    поэтому задачу можно запускать при каждом обновлении курсов перед удалением старой истории.
+    Возвращает количество записанных интервалов.
+    """
+    now = now or timezone.now()
+    rolled_up = _rollup_hours(now) + _rollup_days(now)
+
+    CurrencyRateRollup.objects.filter(
+        resolution=CurrencyRateRollup.RESOLUTION_HOUR,
+        bucket_start__lt=now - timedelta(days=HOURLY_ROLLUP_RETENTION_DAYS)
+    ).delete()
+    return rolled_up
+
+
+def get_hourly_history(currency_code, period):
+    """
+    Возвращает почасовую историю (курсы закрытия) из свернутых данных
+    или пустой список, если свертка не покрывает весь период.
+    """
+    start = timezone.now() - timedelta(days=PERIOD_DAYS[period])
+    rows = list(CurrencyRateRollup.objects.filter(
+        currency_name=currency_code,
+        resolution=CurrencyRateRollup.RESOLUTION_HOUR,
+        bucket_start__gte=start - timedelta(hours=1)
+    ).order_by('bucket_start').values_list('bucket_start', 'close'))
+    if not rows or rows[0][0] > start:
+        return []
+    return [
+        {'date': timezone.localtime(bucket_start).strftime("%Y-%m-%d %H:%M"), 'value': float(close)}
+        for bucket_start, close in rows
+    ]
+
+
+def get_daily_rollup_history(currency_code, period):
+    """
+    Возвращает историю за неделю, месяц или год по дневной свертке (курсы закрытия)
+    или пустой список, если свертка не покрывает весь период. Используется, когда в таблице
+    дневных курсов нет данных валюты: дневная свертка хранится бессрочно и строится из собственной истории.
+    """
+    start, end = period_bounds(period)
+    rows = list(CurrencyRateRollup.objects.filter(
+        currency_name=currency_code,
+        resolution=CurrencyRateRollup.RESOLUTION_DAY,
+        bucket_start__date__gte=start,
+        bucket_start__date__lte=end
+    ).order_by('bucket_start').values_list('bucket_start', 'close'))
+    if not rows or timezone.localtime(rows[0][0]).date() > start:
+        return []
+    result = [
+        {'date': timezone.localtime(bucket_start).strftime("%Y-%m-%d"), 'value': float(close)}
+        for bucket_start, close in rows
+    ]
+
+    # Текущий день берем из последнего обновления курса
+    current = CurrencyRate.objects.filter(currency_name=currency_code).order_by('-updated_at').first()
+    if current:
+        result.append({'date': (end + timedelta(days=1)).strftime("%Y-%m-%d"), 'value': float(current.rate)})
+    return result
+
+
+def lttb_indices(xs, ys, threshold):
+    """
+    Выбирает индексы threshold точек ряда алгоритмом Largest-Triangle-Three-Buckets:
+    из каждой корзины остается точка, образующая треугольник наибольшей площади
+    с предыдущей выбранной точкой и средним следующей корзины.
+    Первая и последняя точки сохраняются, поэтому форма графика и текущий курс не меняются.
+    Возвращает None, если прореживать ряд не нужно.
+    """
+    count = len(xs)
+    if threshold < 3 or count <= threshold:
+        return None
+
+    indices = [0]
+    bucket_size = (count - 2) / (threshold - 2)
+    selected = 0
+    for bucket in range(threshold - 2):
+        # Среднее следующей корзины - третья вершина треугольника
+        next_start = int((bucket + 1) * bucket_size) + 1
+        next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        best_area = -1
+        best_index = start = int(bucket * bucket_size) + 1
+        for index in range(start, int((bucket + 1) * bucket_size) + 1):
+            area = abs(
+                (xs[selected] - avg_x) * (ys[index] - ys[selected])
+                - (xs[selected] - xs[index]) * (avg_y - ys[selected])
+            )
+            if area > best_area:
+                best_area = area
+                best_index = index
+
+        indices.append(best_index)
+        selected = best_index
+
+    indices.append(count - 1)
+    return indices
+
+
+def to_columns(points):
+    """
+    Преобразует ряд [{'date', 'value'}, ...] в столбцы {'t': [секунды эпохи], 'v': [значения]}.
+    Даты без часового пояса считаются заданными в часовом поясе проекта.
+    """
+    default_timezone = timezone.get_default_timezone()
+    epochs = []
+    for point in points:
+        moment = datetime.fromisoformat(point['date'])
+        if timezone.is_naive(moment):
+            moment = moment.replace(tzinfo=default_timezone)
+        epochs.append(int(moment.timestamp()))
+    return {'t': epochs, 'v': [point['value'] for point in points]}
+
+
+def delta_encode(columns, scale=DELTA_SCALE):
+    """
+    Кодирует столбцы разностями: первый элемент хранится как есть, остальные - как разность с предыдущим.
+    Значения переводятся в целые числа умножением на scale, чтобы разности не накапливали ошибку округления.
+    """
+    epochs = columns['t']
+    values = [round(value * scale) for value in columns['v']]
+    return {
+        't': epochs[:1] + [current - previous for previous, current in zip(epochs, epochs[1:])],
+        'v': values[:1] + [current - previous for previous, current in zip(values, values[1:])],
+        'scale': scale,
+    }
@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from decimal import Decimal
+from typing import NamedTuple
+import logging
+import threading
+
+import numpy as np
+
+from .models import ForexSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Ключ id последнего снимка курсов в общем кеше
+LATEST_SNAPSHOT_KEY = 'forex_latest_snapshot'
+
+# Сколько дней хранить снимки курсов
+FOREX_SNAPSHOT_RETENTION_DAYS = getattr(settings, 'FOREX_SNAPSHOT_RETENTION_DAYS', 90)
+
+
+class RateVector(NamedTuple):
+    """Курсы последнего снимка, подготовленные для векторных вычислений"""
+    snapshot_id: int
+    base: str
+    source: str
+    fetched_at: object
+    index: dict
+    rates: np.ndarray
+
+
+# Разобранный последний снимок в памяти процесса: пока снимок не сменился, БД не запрашивается
+_current_vector = None
+_vector_lock = threading.Lock()
+
+
+def store_snapshot(rates, base='USD', source=None, fetched_at=None):
+    """
+    Сохраняет снимок курсов одной строкой и делает его текущим для всех процессов.
+    rates - словарь {код валюты: количество единиц валюты за единицу базовой}.
+    """
+    snapshot = ForexSnapshot.from_rates(rates, base=base, source=source, fetched_at=fetched_at)
+    snapshot.save()
+    # Другие процессы должны увидеть снимок только после фиксации транзакции
+    transaction.on_commit(lambda: cache.set(LATEST_SNAPSHOT_KEY, snapshot.id, timeout=None))
+    logger.info(f"Сохранен снимок курсов {len(rates)} валют от {source}")
+    return snapshot
+
+
+def store_cbr_snapshot(exchange_rates):
+    """Сохраняет снимок курсов ЦБ РФ (pycbrf.ExchangeRates) с рублем в качестве базовой валюты"""
+    rates = {'RUB': Decimal(1)}
+    for rate in exchange_rates.rates:
+        if rate.code and rate.rate:
+            rates[rate.code] = Decimal(1) / rate.rate
+    return store_snapshot(rates, base='RUB', source='ЦБ РФ')
+
+
+def get_rate_vector():
+    """Возвращает курсы последнего снимка (RateVector) или None, если снимков еще нет"""
+    global _current_vector
+
+    snapshot_id = cache.get(LATEST_SNAPSHOT_KEY)
+    if snapshot_id is None:
+        snapshot_id = ForexSnapshot.objects.order_by('-fetched_at', '-id').values_list('id', flat=True).first()
+        if snapshot_id is None:
+            return None
+        cache.set(LATEST_SNAPSHOT_KEY, snapshot_id, timeout=None)
+
+    vector = _current_vector
+    if vector is not None and vector.snapshot_id == snapshot_id:
+        return vector
+
+    snapshot = ForexSnapshot.objects.filter(pk=snapshot_id).first()
+    if snapshot is None:
+        # Снимок удален - при следующем запросе возьмем актуальный из БД
+        cache.delete(LATEST_SNAPSHOT_KEY)
+        return None
+
+    codes, rates = snapshot.rate_vector()
+    vector = RateVector(
+        snapshot_id=snapshot.id,
+        base=snapshot.base,
+        source=snapshot.source,
+        fetched_at=snapshot.fetched_at,
+        index={code: position for position, code in enumerate(codes)},
+        rates=rates,
+    )
+    with _vector_lock:
+        _current_vector = vector
+    return vector
+
+
+def cross_rates(from_code, to_codes, vector=None):
+    """
+    Возвращает курсы {код: сколько единиц валюты дают за единицу from_code} для списка валют.
+    Все пары считаются одной векторной операцией над курсами снимка.
+    Неизвестная валюта вызывает ValueError.
+    """
+    vector = vector or get_rate_vector()
+    if vector is None:
+        raise LookupError('Нет сохраненных курсов валют')
+
+    unknown = [code for code in [from_code, *to_codes] if code not in vector.index]
+    if unknown:
+        raise ValueError(f"Неизвестные валюты: {', '.join(unknown)}")
+
+    positions = np.fromiter((vector.index[code] for code in to_codes), dtype=np.intp, count=len(to_codes))
+    values = vector.rates[positions] / vector.rates[vector.index[from_code]]
+    return dict(zip(to_codes, values.tolist()))
@@ -0,0 +1,296 @@
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+import logging
+import threading
+import time
+
+import requests
+
+from . import job_telemetry, rate_limit
+
+logger = logging.getLogger(__name__)
+
+# Таймауты внешних запросов по умолчанию (в секундах): установка соединения и чтение ответа
+CONNECT_TIMEOUT = getattr(settings, 'HTTP_CONNECT_TIMEOUT', 3.05)
+READ_TIMEOUT = getattr(settings, 'HTTP_READ_TIMEOUT', 10)
+
+# Повторы при сетевых ошибках и ответах 5xx: не больше RETRY_TOTAL раз с экспоненциальной
+# задержкой и случайным разбросом, чтобы воркеры не повторяли запросы одновременно
+RETRY_TOTAL = getattr(settings, 'HTTP_RETRY_TOTAL', 2)
+RETRY_BACKOFF_FACTOR = 0.3
+RETRY_BACKOFF_JITTER = 0.3
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+# Количество соединений, которые держатся открытыми для одного хоста
+POOL_MAXSIZE = getattr(settings, 'HTTP_POOL_MAXSIZE', 10)
+
+# Автомат отключения (circuit breaker): после CIRCUIT_FAILURE_THRESHOLD ошибок подряд провайдер считается
+# недоступным и запросы к нему сразу завершаются ошибкой, без ожидания таймаутов. Через CIRCUIT_RESET_TIMEOUT
+# секунд пропускается один пробный запрос: при успехе провайдер снова доступен, при ошибке - отключается заново
+CIRCUIT_FAILURE_THRESHOLD = getattr(settings, 'HTTP_CIRCUIT_FAILURE_THRESHOLD', 5)
+CIRCUIT_RESET_TIMEOUT = getattr(settings, 'HTTP_CIRCUIT_RESET_TIMEOUT', 60)
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+# Внешние сервисы, состояние которых показывается на странице статуса
+KNOWN_PROVIDERS = ('openexchangerates', 'cbr', 'coingecko', 'cryptocompare', 'openweathermap')
+
+# Ответы, которые считаются отказом провайдера
+CIRCUIT_FAILURE_STATUS_CODES = (429, *RETRY_STATUS_CODES)
+
+_sessions = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Провайдер отключен автоматом: запрос не выполнялся"""
+
+    def __init__(self, provider, retry_at):
+        self.provider = provider
+        self.retry_at = retry_at
+        super().__init__(f"Провайдер {provider} временно отключен после серии ошибок")
+
+
+def _create_session(retries=True):
+    """Создает сессию с пулом keep-alive соединений и политикой повторов (без повторов, если retries=False)"""
+    retry = 0 if not retries else Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        backoff_jitter=RETRY_BACKOFF_JITTER,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(host, retries=True):
+    """Возвращает сессию хоста. Соединения с хостом переиспользуются между запросами всего процесса"""
+    key = (host, retries)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = _create_session(retries)
+    return session
+
+
+def _record(provider, latency, error=None):
+    """Учитывает запрос к провайдеру: количество, ошибки и время ответа (в том числе в телеметрии текущей задачи)"""
+    job_telemetry.record_request(provider, latency, error)
+    with _lock:
+        stats = _stats.setdefault(provider, {
+            'requests': 0,
+            'errors': 0,
+            'total_latency': 0.0,
+            'max_latency': 0.0,
+            'last_error': None,
+        })
+        stats['requests'] += 1
+        stats['total_latency'] += latency
+        stats['max_latency'] = max(stats['max_latency'], latency)
+        if error is not None:
+            stats['errors'] += 1
+            stats['last_error'] = error
+
+
+def _failures_key(provider):
+    return f"http_circuit_failures:{provider}"
+
+
+def _opened_key(provider):
+    return f"http_circuit_opened:{provider}"
+
+
+def _last_error_key(provider):
+    return f"http_circuit_error:{provider}"
+
+
+def _probe_key(provider):
+    return f"http_circuit_probe:{provider}"
+
+
+def _circuit_keys(provider):
+    return [_failures_key(provider), _opened_key(provider), _last_error_key(provider), _probe_key(provider)]
+
+
+def _increment_failures(provider):
+    """Атомарно увеличивает счетчик ошибок подряд и возвращает новое значение"""
+    key = _failures_key(provider)
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Счетчик удалили между add и incr (успешный запрос из другого процесса)
+        cache.add(key, 1, timeout=None)
+        return 1
+
+
+def before_call(provider):
+    """
+    Проверяет автомат провайдера перед запросом. Если провайдер отключен, вызывает CircuitOpenError.
+    Когда время отключения истекло, пропускает ровно один пробный запрос на все процессы.
+    """
+    opened_at = cache.get(_opened_key(provider))
+    if opened_at is None:
+        return
+
+    retry_at = opened_at + CIRCUIT_RESET_TIMEOUT
+    if time.time() < retry_at or not cache.add(_probe_key(provider), 1, timeout=CONNECT_TIMEOUT + READ_TIMEOUT):
+        raise CircuitOpenError(provider, retry_at)
+    logger.info(f"Пробный запрос к провайдеру {provider} после отключения")
+
+
+def record_success(provider):
+    """
+    Отмечает успешный запрос: серия ошибок прерывается, отключенный провайдер снова доступен.
+    Пока ошибок нет, успешный запрос только читает счетчик и ничего не записывает в кеш.
+    """
+    if cache.get(_failures_key(provider)):
+        was_open = cache.get(_opened_key(provider)) is not None
+        cache.delete_many(_circuit_keys(provider))
+        if was_open:
+            logger.info(f"Провайдер {provider} снова доступен")
+
+
+def record_failure(provider, error):
+    """Отмечает отказ провайдера. После CIRCUIT_FAILURE_THRESHOLD отказов подряд провайдер отключается"""
+    failures = _increment_failures(provider)
+    cache.set(_last_error_key(provider), error, timeout=None)
+    if failures >= CIRCUIT_FAILURE_THRESHOLD:
+        # Неудачный пробный запрос снова отключает провайдера на CIRCUIT_RESET_TIMEOUT
+        if cache.get(_opened_key(provider)) is None:
+            logger.warning(f"Провайдер {provider} отключен после {failures} ошибок подряд: {error}")
+        cache.set(_opened_key(provider), time.time(), timeout=None)
+    cache.delete(_probe_key(provider))
+
+
+def call(provider, func, *args, **kwargs):
+    """
+    Выполняет обращение к провайдеру не через request (например, через клиентскую библиотеку)
+    с учетом его автомата отключения: любое исключение func считается отказом.
+    """
+    try:
+        before_call(provider)
+    except CircuitOpenError as e:
+        job_telemetry.record_request(provider, error=type(e).__name__)
+        raise
+    started = time.monotonic()
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        _record(provider, time.monotonic() - started, error=type(e).__name__)
+        record_failure(provider, type(e).__name__)
+        raise
+    _record(provider, time.monotonic() - started)
+    record_success(provider)
+    return result
+
+
+def request(method, url, provider=None, timeout=None, priority=rate_limit.PRIORITY_LOW, max_wait=0, retries=True,
+            **kwargs):
+    """
+    Выполняет внешний HTTP-запрос через пул соединений хоста.
+    provider - имя внешнего сервиса для статистики, автомата отключения и лимита запросов (по умолчанию хост из url).
+    Таймауты по умолчанию - (CONNECT_TIMEOUT, READ_TIMEOUT). При retries=True сетевые ошибки и ответы 5xx
+    повторяются до RETRY_TOTAL раз, поэтому запрос может длиться дольше таймаута; retries=False - одна попытка.
+    Если провайдер отключен после серии ошибок, сразу вызывает CircuitOpenError (подкласс RequestException).
+    Для провайдеров с лимитом запрос берет токен из общей корзины с приоритетом priority, ожидая его
+    не дольше max_wait секунд, иначе вызывает RateLimitExceeded (подкласс RequestException).
+    """
+    host = urlsplit(url).netloc
+    provider = provider or host
+    try:
+        before_call(provider)
+        rate_limit.acquire(provider, priority=priority, max_wait=max_wait)
+    except requests.exceptions.RequestException as e:
+        # Запрос не выполнялся: в телеметрии задачи это ошибка провайдера без времени ответа
+        job_telemetry.record_request(provider, error=type(e).__name__)
+        raise
+    started = time.monotonic()
+    try:
+        response = get_session(host, retries).request(
+            method, url, timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs
+        )
+    except requests.exceptions.RequestException as e:
+        _record(provider, time.monotonic() - started, error=type(e).__name__)
+        record_failure(provider, type(e).__name__)
+        raise
+
+    error = f"HTTP {response.status_code}" if response.status_code >= 500 else None
+    _record(provider, time.monotonic() - started, error=error)
+    if response.status_code == 429:
+        rate_limit.drain(provider)
+    if response.status_code in CIRCUIT_FAILURE_STATUS_CODES:
+        record_failure(provider, f"HTTP {response.status_code}")
+    else:
+        record_success(provider)
+    return response
+
+
+def get(url, params=None, **kwargs):
+    """Выполняет GET-запрос (см. request)"""
+    return request('GET', url, params=params, **kwargs)
+
+
+def get_stats():
+    """Возвращает статистику внешних запросов процесса по провайдерам"""
+    with _lock:
+        return {
+            provider: {
+                'requests': stats['requests'],
+                'errors': stats['errors'],
+                'avg_latency_ms': round(stats['total_latency'] / stats['requests'] * 1000, 1),
+                'max_latency_ms': round(stats['max_latency'] * 1000, 1),
+                'last_error': stats['last_error'],
+            }
+            for provider, stats in _stats.items()
+        }
+
+
+def get_circuit_states(providers=None):
+    """Возвращает состояние автоматов провайдеров (общее для всех процессов)"""
+    providers = list(providers or dict.fromkeys([*KNOWN_PROVIDERS, *_stats]))
+    circuits = cache.get_many([
+        key for provider in providers
+        for key in (_failures_key(provider), _opened_key(provider), _last_error_key(provider))
+    ])
+    now = time.time()
+    states = {}
+    for provider in providers:
+        opened_at = circuits.get(_opened_key(provider))
+        if opened_at is None:
+            state = CIRCUIT_CLOSED
+        elif now < opened_at + CIRCUIT_RESET_TIMEOUT:
+            state = CIRCUIT_OPEN
+        else:
+            state = CIRCUIT_HALF_OPEN
+        states[provider] = {
+            'state': state,
+            'failures': circuits.get(_failures_key(provider), 0),
+            'last_error': circuits.get(_last_error_key(provider)),
+            'retry_in': max(0, round(opened_at + CIRCUIT_RESET_TIMEOUT - now)) if opened_at is not None else None,
+        }
+    return states
+
+
+def reset_circuit(provider):
+    """Вручную возвращает провайдера в рабочее состояние"""
+    cache.delete_many(_circuit_keys(provider))
+
+
+def reset_stats():
+    """Сбрасывает статистику внешних запросов"""
+    with _lock:
+        _stats.clear()
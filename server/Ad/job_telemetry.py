@@ -0,0 +1,240 @@
+from contextlib import contextmanager
+from datetime import timedelta
+from django.db.models import Avg, Count, Max, Q
+from django.utils import timezone
+import bisect
+import contextvars
+import logging
+import threading
+import time
+
+from .models import JobRun
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы времени ответа провайдеров (в миллисекундах).
+# Последняя корзина гистограммы - запросы дольше последней границы
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Выполнение задачи, к которому относятся запросы и записи текущего потока
+_current_run = contextvars.ContextVar('job_run', default=None)
+
+
+class RunCollector:
+    """Метрики выполняющейся задачи. Запросы к провайдерам могут учитываться из нескольких потоков"""
+
+    def __init__(self):
+        self.rows_upserted = 0
+        self.rows_deleted = 0
+        self.error_class = ''
+        self.providers = {}
+        self._lock = threading.Lock()
+
+    def add_rows(self, upserted=0, deleted=0):
+        with self._lock:
+            self.rows_upserted += upserted
+            self.rows_deleted += deleted
+
+    def record_request(self, provider, latency=None, error=None):
+        with self._lock:
+            stats = self.providers.setdefault(provider, {
+                'requests': 0,
+                'errors': 0,
+                'last_error': None,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            })
+            if latency is not None:
+                latency_ms = latency * 1000
+                stats['requests'] += 1
+                stats['total_ms'] = round(stats['total_ms'] + latency_ms, 1)
+                stats['max_ms'] = round(max(stats['max_ms'], latency_ms), 1)
+                stats['histogram'][bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+            if error is not None:
+                stats['errors'] += 1
+                stats['last_error'] = error
+
+
+@contextmanager
+def track(job_name):
+    """
+    Записывает выполнение задачи job_name в JobRun: начало и конец, длительность, записанные и удаленные строки,
+    время ответа провайдеров и класс ошибки. Исключение задачи отмечается и передается дальше.
+    Ошибка записи телеметрии не прерывает задачу.
+    """
+    collector = RunCollector()
+    try:
+        run = JobRun.objects.create(job_name=job_name)
+    except Exception as e:
+        logger.error(f"Не удалось записать начало задачи {job_name}: {e}")
+        run = None
+
+    token = _current_run.set(collector)
+    started = time.monotonic()
+    try:
+        yield collector
+    except BaseException as e:
+        collector.error_class = type(e).__name__
+        raise
+    finally:
+        _current_run.reset(token)
+        if run is not None:
+            run.finished_at = timezone.now()
+            run.duration = round(time.monotonic() - started, 3)
+            run.status = JobRun.STATUS_ERROR if collector.error_class else JobRun.STATUS_SUCCESS
+            run.rows_upserted = collector.rows_upserted
+            run.rows_deleted = collector.rows_deleted
+            run.provider_latencies = collector.providers
+            run.error_class = collector.error_class
+            try:
+                run.save()
+            except Exception as e:
+                logger.error(f"Не удалось записать результат задачи {job_name}: {e}")
+
+
+def bind(func):
+    """
+    Привязывает func к текущему выполнению задачи, чтобы запросы и записи из потока пула
+    учитывались в его телеметрии. Каждый вызов bind создает отдельную копию контекста.
+    """
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+
+    return wrapper
+
+
+def record_request(provider, latency=None, error=None):
+    """Учитывает запрос к провайдеру в текущей задаче. latency=None - запрос не выполнялся (например, отклонен лимитом)"""
+    collector = _current_run.get()
+    if collector is not None:
+        collector.record_request(provider, latency, error)
+
+
+def add_rows(upserted=0, deleted=0):
+    """Учитывает записанные и удаленные задачей строки"""
+    collector = _current_run.get()
+    if collector is not None:
+        collector.add_rows(upserted, deleted)
+
+
+def record_error(error):
+    """Отмечает ошибку, которую задача обработала сама, не прерывая выполнение"""
+    collector = _current_run.get()
+    if collector is not None:
+        collector.error_class = type(error).__name__
+
+
+def _percentile_ms(histogram, max_ms, fraction):
+    """Оценка перцентиля по гистограмме: верхняя граница корзины, в которую он попадает"""
+    total = sum(histogram)
+    if not total:
+        return None
+    threshold = total * fraction
+    cumulative = 0
+    for position, count in enumerate(histogram):
+        cumulative += count
+        if cumulative >= threshold:
+            return LATENCY_BUCKETS_MS[position] if position < len(LATENCY_BUCKETS_MS) else max_ms
+    return max_ms
+
+
+def _merge_latencies(runs):
+    """Складывает время ответа провайдеров по нескольким выполнениям задачи"""
+    merged = {}
+    for latencies in runs:
+        for provider, stats in latencies.items():
+            total = merged.setdefault(provider, {
+                'requests': 0,
+                'errors': 0,
+                'last_error': None,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            })
+            total['requests'] += stats['requests']
+            total['errors'] += stats['errors']
+            total['last_error'] = total['last_error'] or stats['last_error']
+            total['total_ms'] += stats['total_ms']
+            total['max_ms'] = max(total['max_ms'], stats['max_ms'])
+            for position, count in enumerate(stats['histogram'][:len(total['histogram'])]):
+                total['histogram'][position] += count
+
+    return {
+        provider: {
+            'requests': stats['requests'],
+            'errors': stats['errors'],
+            'last_error': stats['last_error'],
+            'avg_ms': round(stats['total_ms'] / stats['requests'], 1) if stats['requests'] else None,
+            'p50_ms': _percentile_ms(stats['histogram'], stats['max_ms'], 0.5),
+            'p95_ms': _percentile_ms(stats['histogram'], stats['max_ms'], 0.95),
+            'max_ms': stats['max_ms'],
+            'histogram': stats['histogram'],
+        }
+        for provider, stats in merged.items()
+    }
+
+
+def _serialize_run(run):
+    return {
+        'status': run.status,
+        'started_at': run.started_at.isoformat(),
+        'finished_at': run.finished_at.isoformat() if run.finished_at else None,
+        'duration': run.duration,
+        'rows_upserted': run.rows_upserted,
+        'rows_deleted': run.rows_deleted,
+        'error_class': run.error_class or None,
+        'providers': run.provider_latencies,
+    }
+
+
+def get_job_summary(hours=24, job_names=None):
+    """
+    Сводка выполнения задач за последние hours часов: последнее выполнение, число запусков и ошибок,
+    средняя и максимальная длительность, записанные строки и время ответа провайдеров с перцентилями.
+    """
+    since = timezone.now() - timedelta(hours=hours)
+    runs = JobRun.objects.filter(started_at__gte=since)
+    if job_names is not None:
+        runs = runs.filter(job_name__in=job_names)
+
+    totals = {
+        row['job_name']: row
+        for row in runs.values('job_name').annotate(
+            runs=Count('id'),
+            errors=Count('id', filter=Q(status=JobRun.STATUS_ERROR)),
+            avg_duration=Avg('duration'),
+            max_duration=Max('duration'),
+        )
+    }
+    latencies = {}
+    for job_name, provider_latencies in runs.values_list('job_name', 'provider_latencies'):
+        latencies.setdefault(job_name, []).append(provider_latencies)
+
+    names = list(dict.fromkeys([*(job_names or []), *totals]))
+    last_runs = {}
+    for job_name in names:
+        last_run = JobRun.objects.filter(job_name=job_name).order_by('-started_at').first()
+        if last_run is not None:
+            last_runs[job_name] = _serialize_run(last_run)
+
+    summary = {}
+    for job_name in names:
+        row = totals.get(job_name, {})
+        summary[job_name] = {
+            'last_run': last_runs.get(job_name),
+            'runs': row.get('runs', 0),
+            'errors': row.get('errors', 0),
+            'avg_duration': round(row['avg_duration'], 3) if row.get('avg_duration') is not None else None,
+            'max_duration': row.get('max_duration'),
+            'providers': _merge_latencies(latencies.get(job_name, [])),
+        }
+    return summary
+
+
+def prune(days):
+    """Удаляет записи о выполнении задач старше days дней. Возвращает количество удаленных записей"""
+    deleted, _ = JobRun.objects.filter(started_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
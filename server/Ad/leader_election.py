@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import os
+import socket
+import uuid
+
+from .models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+# Срок аренды роли лидера (в секундах). Лидер продлевает аренду заранее, а если он завис или умер,
+# после истечения срока роль забирает другой процесс
+LEASE_TTL = getattr(settings, 'SCHEDULER_LEASE_TTL', 60)
+
+
+def make_holder_id():
+    """Уникальный идентификатор процесса: хост, pid и случайный суффикс (pid может повториться после перезапуска)"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def try_acquire(name, holder, ttl=LEASE_TTL):
+    """
+    Получает или продлевает аренду роли name. Возвращает True, если процесс holder - лидер.
+    Аренда переходит к другому процессу только после истечения срока. Захват - условный UPDATE,
+    поэтому из нескольких претендентов роль получает ровно один.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl)
+    leases = SchedulerLease.objects.filter(name=name)
+
+    # Продление своей аренды
+    if leases.filter(holder=holder).update(expires_at=expires_at):
+        return True
+
+    # Захват истекшей аренды
+    if leases.filter(expires_at__lt=now).update(holder=holder, acquired_at=now, expires_at=expires_at):
+        logger.info(f"Процесс {holder} стал лидером {name}")
+        return True
+
+    if leases.exists():
+        return False
+    try:
+        with transaction.atomic():
+            SchedulerLease.objects.create(name=name, holder=holder, acquired_at=now, expires_at=expires_at)
+        logger.info(f"Процесс {holder} стал лидером {name}")
+        return True
+    except IntegrityError:
+        # Строку одновременно создал другой процесс
+        return False
+
+
+def release(name, holder):
+    """Освобождает аренду, чтобы другой процесс мог стать лидером, не дожидаясь истечения срока"""
+    SchedulerLease.objects.filter(name=name, holder=holder).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+
+def get_lease(name):
+    """Возвращает текущую аренду роли или None"""
+    return SchedulerLease.objects.filter(name=name).first()
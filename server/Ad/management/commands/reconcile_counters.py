@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from Ad.models import News
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики лайков, дизлайков и комментариев у новостей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать количество новостей с расхождениями, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        drifted_count = News.reconcile_counters(dry_run=options['dry_run'])
+
+        if options['dry_run']:
+            message = f'Найдено {drifted_count} новостей с расхождением счетчиков'
+        else:
+            message = f'Исправлены счетчики у {drifted_count} новостей'
+
+        self.stdout.write(self.style.SUCCESS(message))
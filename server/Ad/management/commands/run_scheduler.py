@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from Ad.tasks import SchedulerSingleton
+import signal
+import threading
+
+
+class Command(BaseCommand):
+    help = 'Запускает планировщик фоновых задач (курсы валют, новости) в отдельном процессе'
+
+    # Кеши, которые не видны другим процессам: сброс кеша после обновления данных не дойдет до веб-воркеров
+    PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+    def handle(self, *args, **options):
+        if settings.CACHES['default']['BACKEND'] in self.PROCESS_LOCAL_CACHES:
+            raise CommandError(
+                'Планировщик в отдельном процессе требует общего кеша (CACHE_URL=filecache://... или dbcache://...): '
+                'с локальным кешем веб-воркеры не узнают об обновлении курсов и новостей'
+            )
+
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write(f'Получен сигнал {signal.Signals(signum).name}, останавливаем планировщик...')
+            stop.set()
+
+        previous_handlers = {
+            signum: signal.signal(signum, request_stop) for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        try:
+            SchedulerSingleton.get_instance()
+            self.stdout.write(self.style.SUCCESS('Планировщик запущен. Для остановки нажмите Ctrl+C'))
+            # Ждем с таймаутом, чтобы обработчик сигнала гарантированно выполнился в основном потоке
+            while not stop.wait(1):
+                pass
+        finally:
+            # Дожидаемся выполняющихся задач и освобождаем роль лидера для другого процесса
+            SchedulerSingleton.shutdown(wait=True)
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+        self.stdout.write(self.style.SUCCESS('Планировщик остановлен'))
@@ -0,0 +1,56 @@
+# Generated by Django 5.1a1 on 2026-10-18 16:17
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_news_counters(apps, schema_editor):
+    """Заполняет новые счетчики по уже существующим оценкам и комментариям"""
+    News = apps.get_model('Ad', 'News')
+    NewsRating = apps.get_model('Ad', 'NewsRating')
+    NewsComment = apps.get_model('Ad', 'NewsComment')
+
+    def count_subquery(model, **filters):
+        return Coalesce(
+            Subquery(
+                model.objects.filter(news=OuterRef('pk'), **filters)
+                .order_by()
+                .values('news')
+                .annotate(total=Count('pk'))
+                .values('total')
+            ),
+            0
+        )
+
+    News.objects.update(
+        likes_count=count_subquery(NewsRating, is_like=True),
+        dislikes_count=count_subquery(NewsRating, is_like=False),
+        comments_count=count_subquery(NewsComment),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ad', '0001_initial_squashed_0013_alter_weathercache_background_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество комментариев'),
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество дизлайков'),
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество лайков'),
+        ),
+        migrations.RunPython(fill_news_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1a1 on 2026-10-18 16:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ad', '0014_news_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['date_published', 'id'], name='Ad_news_date_pu_ee7a3c_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1a1 on 2026-10-18 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ad', '0015_news_feed_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyDailyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency_name', models.CharField(max_length=10, verbose_name='Название валюты')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('rate', models.DecimalField(decimal_places=4, max_digits=16, verbose_name='Курс')),
+                ('source', models.CharField(blank=True, max_length=50, null=True, verbose_name='Источник данных')),
+            ],
+            options={
+                'verbose_name': 'Дневной курс валюты',
+                'verbose_name_plural': 'Дневные курсы валют',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('currency_name', 'date'), name='unique_currency_daily_rate')],
+            },
+        ),
+    ]
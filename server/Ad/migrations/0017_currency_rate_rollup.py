@@ -0,0 +1,33 @@
+# Generated by Django 5.1a1 on 2026-10-18 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ad', '0016_currency_daily_rate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyRateRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency_name', models.CharField(max_length=10, verbose_name='Название валюты')),
+                ('resolution', models.CharField(choices=[('hour', 'Час'), ('day', 'День')], max_length=4, verbose_name='Интервал')),
+                ('bucket_start', models.DateTimeField(verbose_name='Начало интервала')),
+                ('open', models.DecimalField(decimal_places=4, max_digits=16, verbose_name='Курс открытия')),
+                ('high', models.DecimalField(decimal_places=4, max_digits=16, verbose_name='Максимальный курс')),
+                ('low', models.DecimalField(decimal_places=4, max_digits=16, verbose_name='Минимальный курс')),
+                ('close', models.DecimalField(decimal_places=4, max_digits=16, verbose_name='Курс закрытия')),
+                ('samples', models.PositiveIntegerField(default=0, verbose_name='Количество записей')),
+            ],
+            options={
+                'verbose_name': 'Свернутая история курса',
+                'verbose_name_plural': 'Свернутая история курсов',
+                'ordering': ['-bucket_start'],
+                'constraints': [models.UniqueConstraint(fields=('currency_name', 'resolution', 'bucket_start'), name='unique_currency_rate_rollup')],
+            },
+        ),
+    ]
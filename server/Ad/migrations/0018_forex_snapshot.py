@@ -0,0 +1,30 @@
+# Generated by Django 5.1a1 on 2026-10-18 16:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ad', '0017_currency_rate_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForexSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(default='USD', max_length=3, verbose_name='Базовая валюта')),
+                ('currencies', models.TextField(verbose_name='Коды валют')),
+                ('rates', models.BinaryField(verbose_name='Курсы')),
+                ('source', models.CharField(blank=True, max_length=50, null=True, verbose_name='Источник данных')),
+                ('fetched_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Время получения')),
+            ],
+            options={
+                'verbose_name': 'Снимок курсов валют',
+                'verbose_name_plural': 'Снимки курсов валют',
+                'ordering': ['-fetched_at'],
+            },
+        ),
+    ]
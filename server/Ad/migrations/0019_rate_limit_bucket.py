@@ -0,0 +1,27 @@
+# Generated by Django 5.1a1 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ad', '0018_forex_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Провайдер')),
+                ('tokens', models.FloatField(verbose_name='Доступно запросов')),
+                ('updated_at', models.FloatField(verbose_name='Время пересчета (unix)')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Лимит запросов',
+                'verbose_name_plural': 'Лимиты запросов',
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1a1 on 2026-10-18 16:44
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def seed_tracked_coins(apps, schema_editor):
+    """Добавляет в реестр монеты, которые раньше были заданы в коде"""
+    TrackedCoin = apps.get_model('Ad', 'TrackedCoin')
+    for sort_order, (code, name, symbol, coingecko_id, fallback_price) in enumerate([
+        ('BTC', 'Bitcoin', '₿', 'bitcoin', Decimal('30000')),
+        ('ETH', 'Ethereum', 'Ξ', 'ethereum', Decimal('1600')),
+    ]):
+        TrackedCoin.objects.get_or_create(code=code, defaults={
+            'name': name,
+            'symbol': symbol,
+            'coingecko_id': coingecko_id,
+            'fallback_price': fallback_price,
+            'sort_order': sort_order,
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ad', '0019_rate_limit_bucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackedCoin',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=10, unique=True, verbose_name='Код')),
+                ('name', models.CharField(max_length=50, verbose_name='Название')),
+                ('symbol', models.CharField(max_length=5, verbose_name='Символ')),
+                ('coingecko_id', models.CharField(max_length=100, unique=True, verbose_name='ID в CoinGecko')),
+                ('cryptocompare_symbol', models.CharField(blank=True, help_text='По умолчанию совпадает с кодом', max_length=10, verbose_name='Символ в CryptoCompare')),
+                ('fallback_price', models.DecimalField(decimal_places=4, help_text='Используется, если цену не удалось получить ни из одного источника', max_digits=20, verbose_name='Резервная цена, $')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Отслеживается')),
+                ('sort_order', models.PositiveIntegerField(default=0, verbose_name='Порядок')),
+            ],
+            options={
+                'verbose_name': 'Отслеживаемая криптовалюта',
+                'verbose_name_plural': 'Отслеживаемые криптовалюты',
+                'ordering': ['sort_order', 'code'],
+            },
+        ),
+        migrations.RunPython(seed_tracked_coins, migrations.RunPython.noop),
+    ]
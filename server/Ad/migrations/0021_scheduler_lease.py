@@ -0,0 +1,27 @@
+# Generated by Django 5.1a1 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ad', '0020_tracked_coin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Роль')),
+                ('holder', models.CharField(max_length=255, verbose_name='Процесс-владелец')),
+                ('acquired_at', models.DateTimeField(verbose_name='Получена')),
+                ('expires_at', models.DateTimeField(verbose_name='Истекает')),
+            ],
+            options={
+                'verbose_name': 'Аренда планировщика',
+                'verbose_name_plural': 'Аренды планировщика',
+            },
+        ),
+    ]
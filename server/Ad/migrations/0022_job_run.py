@@ -0,0 +1,35 @@
+# Generated by Django 5.1a1 on 2026-10-18 16:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ad', '0021_scheduler_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_name', models.CharField(max_length=100, verbose_name='Задача')),
+                ('status', models.CharField(choices=[('running', 'Выполняется'), ('success', 'Успешно'), ('error', 'Ошибка')], default='running', max_length=10, verbose_name='Статус')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Начало')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание')),
+                ('duration', models.FloatField(blank=True, null=True, verbose_name='Длительность (с)')),
+                ('rows_upserted', models.PositiveIntegerField(default=0, verbose_name='Записано строк')),
+                ('rows_deleted', models.PositiveIntegerField(default=0, verbose_name='Удалено строк')),
+                ('provider_latencies', models.JSONField(blank=True, default=dict, verbose_name='Время ответа провайдеров')),
+                ('error_class', models.CharField(blank=True, max_length=100, verbose_name='Класс ошибки')),
+            ],
+            options={
+                'verbose_name': 'Выполнение задачи',
+                'verbose_name_plural': 'Выполнения задач',
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['job_name', '-started_at'], name='Ad_jobrun_job_nam_a9cada_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1a1 on 2026-10-18 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ad', '0022_job_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newssource',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255, verbose_name='ETag канала'),
+        ),
+        migrations.AddField(
+            model_name='newssource',
+            name='modified',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Last-Modified канала'),
+        ),
+    ]
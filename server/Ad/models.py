@@ -1,9 +1,14 @@
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from .page_cache import bump_news_version
+import numpy as np
 
 # Модель новостей
 class News(models.Model):
@@ -20,18 +25,81 @@ class News(models.Model):
         blank=True,
         verbose_name="Источник"
     )
+    # Денормализованные счетчики, обновляются вместе с оценками и комментариями
+    likes_count = models.PositiveIntegerField(default=0, verbose_name="Количество лайков")
+    dislikes_count = models.PositiveIntegerField(default=0, verbose_name="Количество дизлайков")
+    comments_count = models.PositiveIntegerField(default=0, verbose_name="Количество комментариев")
 
     class Meta:
         verbose_name = "Новость"
         verbose_name_plural = "Новости"
+        indexes = [
+            # Индекс для keyset-пагинации ленты по (date_published, id)
+            models.Index(fields=['date_published', 'id']),
+        ]
 
     def __str__(self):
         return self.title
 
-    @property
-    def comments_count(self):
-        """Возвращает количество комментариев к новости"""
-        return self.comments.count()
+    @classmethod
+    def adjust_counters(cls, news_id, **deltas):
+        """
+        Атомарно изменяет счетчики новости через F()-выражения.
+        Вызывается внутри той же транзакции, что и запись оценки или комментария.
+        """
+        updates = {}
+        for field, delta in deltas.items():
+            if delta > 0:
+                updates[field] = F(field) + delta
+            elif delta < 0:
+                # Не даем счетчику уйти в минус, если он уже разошелся с реальными данными
+                updates[field] = Greatest(F(field) + delta, Value(0))
+        if updates:
+            cls.objects.filter(pk=news_id).update(**updates)
+            transaction.on_commit(bump_news_version)
+
+    @classmethod
+    def reconcile_counters(cls, dry_run=False):
+        """
+        Пересчитывает счетчики по таблицам оценок и комментариев.
+        Возвращает количество новостей, у которых счетчики разошлись с реальными данными.
+        """
+        actual = {
+            'likes_count': _news_count_subquery(NewsRating, is_like=True),
+            'dislikes_count': _news_count_subquery(NewsRating, is_like=False),
+            'comments_count': _news_count_subquery(NewsComment),
+        }
+        drifted = cls.objects.annotate(
+            actual_likes=actual['likes_count'],
+            actual_dislikes=actual['dislikes_count'],
+            actual_comments=actual['comments_count'],
+        ).exclude(
+            likes_count=F('actual_likes'),
+            dislikes_count=F('actual_dislikes'),
+            comments_count=F('actual_comments'),
+        )
+        drifted_ids = list(drifted.values_list('pk', flat=True))
+
+        if drifted_ids and not dry_run:
+            # Одним UPDATE с коррелированными подзапросами на пачку новостей
+            for start in range(0, len(drifted_ids), 500):
+                cls.objects.filter(pk__in=drifted_ids[start:start + 500]).update(**actual)
+            transaction.on_commit(bump_news_version)
+        return len(drifted_ids)
+
+
+def _news_count_subquery(model, **filters):
+    """Подзапрос количества записей модели, связанных с новостью из внешнего запроса"""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(news=OuterRef('pk'), **filters)
+            .order_by()
+            .values('news')
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0
+    )
 
 # Модель курсов валют
 class CurrencyRate(models.Model):
@@ -49,6 +117,62 @@ class CurrencyRate(models.Model):
         source_info = f" ({self.source})" if self.source else ""
         return f"{self.currency_name}{self.symbol}: {self.rate}₽{source_info}"
 
+    @classmethod
+    def with_crypto_flag(cls):
+        """
+        Курсы с признаком is_crypto: курсы криптовалют хранятся в долларах, остальных валют - в рублях.
+        Признак вычисляется в том же запросе по реестру отслеживаемых монет.
+        """
+        return cls.objects.annotate(
+            is_crypto=Exists(TrackedCoin.objects.filter(code=OuterRef('currency_name'), is_active=True))
+        )
+
+# Модель отслеживаемых криптовалют. Курсы и история загружаются для всех активных монет реестра
+class TrackedCoin(models.Model):
+    REGISTRY_CACHE_KEY = 'tracked_coins'
+
+    code = models.CharField(max_length=10, unique=True, verbose_name="Код")
+    name = models.CharField(max_length=50, verbose_name="Название")
+    symbol = models.CharField(max_length=5, verbose_name="Символ")
+    coingecko_id = models.CharField(max_length=100, unique=True, verbose_name="ID в CoinGecko")
+    cryptocompare_symbol = models.CharField(
+        max_length=10, blank=True, verbose_name="Символ в CryptoCompare", help_text="По умолчанию совпадает с кодом"
+    )
+    fallback_price = models.DecimalField(
+        max_digits=20, decimal_places=4, verbose_name="Резервная цена, $",
+        help_text="Используется, если цену не удалось получить ни из одного источника"
+    )
+    is_active = models.BooleanField(default=True, verbose_name="Отслеживается")
+    sort_order = models.PositiveIntegerField(default=0, verbose_name="Порядок")
+
+    class Meta:
+        verbose_name = "Отслеживаемая криптовалюта"
+        verbose_name_plural = "Отслеживаемые криптовалюты"
+        ordering = ['sort_order', 'code']
+
+    def __str__(self):
+        return f"{self.code} ({self.name})"
+
+    @classmethod
+    def get_registry(cls):
+        """
+        Возвращает активные монеты в виде {код: {'coingecko_id', 'cryptocompare_symbol', 'symbol', 'fallback_price'}}.
+        Реестр хранится в общем кеше и сбрасывается при изменении монет.
+        """
+        registry = cache.get(cls.REGISTRY_CACHE_KEY)
+        if registry is None:
+            registry = {
+                coin.code: {
+                    'coingecko_id': coin.coingecko_id,
+                    'cryptocompare_symbol': coin.cryptocompare_symbol or coin.code,
+                    'symbol': coin.symbol,
+                    'fallback_price': coin.fallback_price,
+                }
+                for coin in cls.objects.filter(is_active=True)
+            }
+            cache.set(cls.REGISTRY_CACHE_KEY, registry, timeout=None)
+        return registry
+
 # Модель для хранения истории курсов валют
 class CurrencyRateHistory(models.Model):
     currency_name = models.CharField(max_length=10, verbose_name="Название валюты")
@@ -69,6 +193,159 @@ class CurrencyRateHistory(models.Model):
         source_info = f" ({self.source})" if self.source else ""
         return f"{self.currency_name}: {self.rate}₽ - {self.timestamp.strftime('%d.%m.%Y %H:%M')}{source_info}"
 
+# Модель дневных курсов валют для недельных, месячных и годовых графиков
+class CurrencyDailyRate(models.Model):
+    currency_name = models.CharField(max_length=10, verbose_name="Название валюты")
+    date = models.DateField(verbose_name="Дата")
+    rate = models.DecimalField(max_digits=16, decimal_places=4, verbose_name="Курс")
+    source = models.CharField(max_length=50, verbose_name="Источник данных", blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Дневной курс валюты"
+        verbose_name_plural = "Дневные курсы валют"
+        ordering = ['-date']
+        # Уникальный индекс (currency_name, date) используется и для выборки графика по диапазону дат
+        constraints = [
+            models.UniqueConstraint(fields=['currency_name', 'date'], name='unique_currency_daily_rate'),
+        ]
+
+    def __str__(self):
+        source_info = f" ({self.source})" if self.source else ""
+        return f"{self.currency_name}: {self.rate} - {self.date.strftime('%d.%m.%Y')}{source_info}"
+
+# Модель свернутой истории курсов: OHLC за час или за день
+class CurrencyRateRollup(models.Model):
+    RESOLUTION_HOUR = 'hour'
+    RESOLUTION_DAY = 'day'
+    RESOLUTION_CHOICES = [
+        (RESOLUTION_HOUR, 'Час'),
+        (RESOLUTION_DAY, 'День'),
+    ]
+
+    currency_name = models.CharField(max_length=10, verbose_name="Название валюты")
+    resolution = models.CharField(max_length=4, choices=RESOLUTION_CHOICES, verbose_name="Интервал")
+    bucket_start = models.DateTimeField(verbose_name="Начало интервала")
+    open = models.DecimalField(max_digits=16, decimal_places=4, verbose_name="Курс открытия")
+    high = models.DecimalField(max_digits=16, decimal_places=4, verbose_name="Максимальный курс")
+    low = models.DecimalField(max_digits=16, decimal_places=4, verbose_name="Минимальный курс")
+    close = models.DecimalField(max_digits=16, decimal_places=4, verbose_name="Курс закрытия")
+    samples = models.PositiveIntegerField(default=0, verbose_name="Количество записей")
+
+    class Meta:
+        verbose_name = "Свернутая история курса"
+        verbose_name_plural = "Свернутая история курсов"
+        ordering = ['-bucket_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['currency_name', 'resolution', 'bucket_start'], name='unique_currency_rate_rollup'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.currency_name} ({self.get_resolution_display()}): {self.close} - {self.bucket_start.strftime('%d.%m.%Y %H:%M')}"
+
+# Модель снимка курсов всех валют, полученных за одно обращение к источнику.
+# Курсы хранятся одним массивом float64, а не отдельной строкой на каждую валюту
+class ForexSnapshot(models.Model):
+    base = models.CharField(max_length=3, default='USD', verbose_name="Базовая валюта")
+    currencies = models.TextField(verbose_name="Коды валют")
+    rates = models.BinaryField(verbose_name="Курсы")
+    source = models.CharField(max_length=50, verbose_name="Источник данных", blank=True, null=True)
+    fetched_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="Время получения")
+
+    class Meta:
+        verbose_name = "Снимок курсов валют"
+        verbose_name_plural = "Снимки курсов валют"
+        ordering = ['-fetched_at']
+
+    @classmethod
+    def from_rates(cls, rates, base='USD', source=None, fetched_at=None):
+        """
+        Создает (не сохраняя) снимок из словаря {код валюты: количество единиц валюты за единицу базовой}.
+        Коды хранятся через запятую в том же порядке, что и курсы в массиве.
+        """
+        codes = sorted(rates)
+        vector = np.array([float(rates[code]) for code in codes], dtype='<f8')
+        return cls(
+            base=base,
+            currencies=','.join(codes),
+            rates=vector.tobytes(),
+            source=source,
+            fetched_at=fetched_at or timezone.now()
+        )
+
+    def rate_vector(self):
+        """Возвращает пару (список кодов валют, массив курсов numpy)"""
+        return self.currencies.split(','), np.frombuffer(bytes(self.rates), dtype='<f8')
+
+    def __str__(self):
+        source_info = f" ({self.source})" if self.source else ""
+        return f"Курсы к {self.base} - {self.fetched_at.strftime('%d.%m.%Y %H:%M')}{source_info}"
+
+# Модель корзины токенов для ограничения частоты запросов к внешнему API.
+# Хранится в БД, поэтому лимит общий для всех процессов
+class RateLimitBucket(models.Model):
+    name = models.CharField(max_length=50, unique=True, verbose_name="Провайдер")
+    tokens = models.FloatField(verbose_name="Доступно запросов")
+    updated_at = models.FloatField(verbose_name="Время пересчета (unix)")
+    # Версия строки для атомарного списания токенов без блокировок
+    version = models.PositiveIntegerField(default=0, verbose_name="Версия")
+
+    class Meta:
+        verbose_name = "Лимит запросов"
+        verbose_name_plural = "Лимиты запросов"
+
+    def __str__(self):
+        return f"{self.name}: {self.tokens:.1f}"
+
+# Модель аренды роли лидера: фоновые задачи выполняет только процесс, который держит аренду
+class SchedulerLease(models.Model):
+    name = models.CharField(max_length=50, unique=True, verbose_name="Роль")
+    holder = models.CharField(max_length=255, verbose_name="Процесс-владелец")
+    acquired_at = models.DateTimeField(verbose_name="Получена")
+    expires_at = models.DateTimeField(verbose_name="Истекает")
+
+    class Meta:
+        verbose_name = "Аренда планировщика"
+        verbose_name_plural = "Аренды планировщика"
+
+    def __str__(self):
+        return f"{self.name}: {self.holder} до {timezone.localtime(self.expires_at).strftime('%d.%m.%Y %H:%M:%S')}"
+
+# Модель выполнения фоновой задачи: длительность, записанные строки и время ответа внешних сервисов
+class JobRun(models.Model):
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCESS = 'success'
+    STATUS_ERROR = 'error'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_SUCCESS, 'Успешно'),
+        (STATUS_ERROR, 'Ошибка'),
+    ]
+
+    job_name = models.CharField(max_length=100, verbose_name="Задача")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_RUNNING, verbose_name="Статус")
+    started_at = models.DateTimeField(default=timezone.now, verbose_name="Начало")
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name="Окончание")
+    duration = models.FloatField(blank=True, null=True, verbose_name="Длительность (с)")
+    rows_upserted = models.PositiveIntegerField(default=0, verbose_name="Записано строк")
+    rows_deleted = models.PositiveIntegerField(default=0, verbose_name="Удалено строк")
+    # {провайдер: {'requests', 'errors', 'last_error', 'total_ms', 'max_ms', 'histogram'}},
+    # histogram - количество запросов по корзинам времени ответа job_telemetry.LATENCY_BUCKETS_MS
+    provider_latencies = models.JSONField(default=dict, blank=True, verbose_name="Время ответа провайдеров")
+    error_class = models.CharField(max_length=100, blank=True, verbose_name="Класс ошибки")
+
+    class Meta:
+        verbose_name = "Выполнение задачи"
+        verbose_name_plural = "Выполнения задач"
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['job_name', '-started_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.job_name} ({self.get_status_display()}) - {timezone.localtime(self.started_at).strftime('%d.%m.%Y %H:%M:%S')}"
+
 # Модель фоновых изображений
 class BackgroundImage(models.Model):
     image = models.ImageField(upload_to='backgrounds/', verbose_name="Фоновое изображение")
@@ -85,6 +362,9 @@ class NewsSource(models.Model):
     name = models.CharField(max_length=255, verbose_name="Название источника")
     feed_url = models.URLField(max_length=1000, verbose_name="URL RSS канала")
     is_active = models.BooleanField(default=True, verbose_name="Активный источник")
+    # Валидаторы последнего загруженного канала для условного запроса (If-None-Match / If-Modified-Since)
+    etag = models.CharField(max_length=255, blank=True, verbose_name="ETag канала")
+    modified = models.CharField(max_length=64, blank=True, verbose_name="Last-Modified канала")
 
     class Meta:
         verbose_name = "Источник новостей"
@@ -216,3 +496,23 @@ def save_user_profile(sender, instance, **kwargs):
         instance.userprofile.save()
     except UserProfile.DoesNotExist:
         UserProfile.objects.create(user=instance)
+
+# Сигналы для сброса закешированной главной страницы при изменении ее данных
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+@receiver(post_save, sender=NewsSource)
+@receiver(post_delete, sender=NewsSource)
+@receiver(post_save, sender=BackgroundImage)
+@receiver(post_delete, sender=BackgroundImage)
+@receiver(post_save, sender=CurrencyRate)
+@receiver(post_delete, sender=CurrencyRate)
+def invalidate_main_page_cache(sender, **kwargs):
+    """Увеличивает версию ленты новостей, чтобы главная страница была отрисована заново"""
+    transaction.on_commit(bump_news_version)
+
+@receiver(post_save, sender=TrackedCoin)
+@receiver(post_delete, sender=TrackedCoin)
+def invalidate_tracked_coins(sender, **kwargs):
+    """Сбрасывает закешированный реестр монет во всех процессах"""
+    cache.delete(TrackedCoin.REGISTRY_CACHE_KEY)
+    transaction.on_commit(bump_news_version)
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.cache import cache
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Ключ версии ленты новостей в общем кеше
+NEWS_VERSION_KEY = 'news_version'
+
+# Время жизни закешированной главной страницы (в секундах)
+MAIN_PAGE_CACHE_TIMEOUT = getattr(settings, 'MAIN_PAGE_CACHE_TIMEOUT', 300)
+
+# Метка в шаблоне main.html, вместо которой подставляются оценки пользователя
+USER_RATINGS_PLACEHOLDER = '<!-- user-ratings-overlay -->'
+
+
+def get_news_version():
+    """
+    Возвращает текущую версию ленты новостей.
+    Версия хранится в общем кеше, поэтому ее изменение видно всем процессам.
+    """
+    version = cache.get(NEWS_VERSION_KEY)
+    if version is None:
+        # Начинаем с отметки времени, чтобы после очистки кеша не вернуться к старым версиям
+        cache.add(NEWS_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(NEWS_VERSION_KEY, 0)
+    return version
+
+
+def bump_news_version():
+    """
+    Увеличивает версию ленты новостей, делая недействительными все закешированные главные страницы.
+    Вызывается при добавлении и удалении новостей и при изменении счетчиков.
+    """
+    try:
+        cache.incr(NEWS_VERSION_KEY)
+    except ValueError:
+        # Ключа еще нет в кеше (или он был вытеснен) - создаем новую версию
+        cache.set(NEWS_VERSION_KEY, int(time.time() * 1000), timeout=None)
+
+
+def main_page_cache_key(path, is_authenticated):
+    """
+    Ключ общей закешированной главной страницы.
+    Страница зависит только от версии ленты, пути (используется в base.html)
+    и факта авторизации (меню и JS-флаг userAuthenticated), но не от конкретного пользователя.
+    """
+    return f"main_page:{get_news_version()}:{path}:{int(bool(is_authenticated))}"
+
+
+def get_cached_main_page(key):
+    """Возвращает закешированную страницу в виде словаря {'body': ..., 'news_ids': [...]} или None"""
+    return cache.get(key)
+
+
+def set_cached_main_page(key, body, news_ids):
+    """Сохраняет отрисованную главную страницу и список новостей на ней"""
+    cache.set(key, {'body': body, 'news_ids': news_ids}, timeout=MAIN_PAGE_CACHE_TIMEOUT)
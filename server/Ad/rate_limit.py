@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.db.models import F
+import logging
+import time
+
+import requests
+
+from .models import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов: плановые задачи могут расходовать весь лимит,
+# а запросы пользователей - только ту часть, что остается сверх резерва
+PRIORITY_HIGH = 'high'
+PRIORITY_LOW = 'low'
+
+# Лимиты провайдеров: capacity - размер корзины (допустимый всплеск), per_minute - скорость пополнения,
+# reserve - токены, которые запросы с низким приоритетом не могут забрать
+RATE_LIMITS = getattr(settings, 'HTTP_RATE_LIMITS', {
+    # Бесплатный тариф CoinGecko - около 30 запросов в минуту
+    'coingecko': {'capacity': 25, 'per_minute': 25, 'reserve': 5},
+})
+
+# Сколько раз повторять списание, если строку одновременно изменил другой процесс
+CAS_ATTEMPTS = 5
+
+
+class RateLimitExceeded(requests.exceptions.RequestException):
+    """Лимит запросов к провайдеру исчерпан: запрос не выполнялся"""
+
+    def __init__(self, provider, retry_after):
+        self.provider = provider
+        self.retry_after = retry_after
+        super().__init__(f"Исчерпан лимит запросов к {provider}, повтор через {retry_after:.1f} с")
+
+
+def _refill(bucket, limit, now):
+    """Количество токенов в корзине на момент now с учетом пополнения"""
+    elapsed = max(0.0, now - bucket.updated_at)
+    return min(limit['capacity'], bucket.tokens + elapsed * limit['per_minute'] / 60)
+
+
+def _try_acquire(provider, limit, priority):
+    """
+    Пытается списать токен. Возвращает 0 при успехе или время (в секундах),
+    через которое для запроса с этим приоритетом появится токен.
+    Списание - условный UPDATE по версии строки, поэтому два процесса не могут взять один токен.
+    """
+    floor = 0 if priority == PRIORITY_HIGH else limit['reserve']
+    rate = limit['per_minute'] / 60
+    for _ in range(CAS_ATTEMPTS):
+        now = time.time()
+        bucket, _ = RateLimitBucket.objects.get_or_create(
+            name=provider, defaults={'tokens': limit['capacity'], 'updated_at': now}
+        )
+        tokens = _refill(bucket, limit, now)
+        if tokens < floor + 1:
+            return (floor + 1 - tokens) / rate
+
+        updated = RateLimitBucket.objects.filter(pk=bucket.pk, version=bucket.version).update(
+            tokens=tokens - 1, updated_at=now, version=F('version') + 1
+        )
+        if updated:
+            return 0
+    # Корзину постоянно меняют другие процессы - попробуем чуть позже
+    return 1 / rate
+
+
+def acquire(provider, priority=PRIORITY_LOW, max_wait=0):
+    """
+    Берет токен из общей корзины провайдера. Если токенов нет, ждет не дольше max_wait секунд,
+    после чего вызывает RateLimitExceeded (подкласс RequestException), чтобы вызывающий код
+    перешел к резервному источнику. Для провайдеров без лимита ничего не делает.
+    """
+    limit = RATE_LIMITS.get(provider)
+    if limit is None:
+        return
+
+    deadline = time.monotonic() + max_wait
+    while True:
+        wait = _try_acquire(provider, limit, priority)
+        if wait == 0:
+            return
+        if time.monotonic() + wait > deadline:
+            logger.warning(f"Исчерпан лимит запросов к {provider} (приоритет {priority})")
+            raise RateLimitExceeded(provider, wait)
+        time.sleep(wait)
+
+
+def drain(provider):
+    """Обнуляет корзину, если провайдер сам ответил 429: его счетчик разошелся с нашим"""
+    if provider in RATE_LIMITS:
+        RateLimitBucket.objects.filter(name=provider).update(
+            tokens=0, updated_at=time.time(), version=F('version') + 1
+        )
+
+
+def get_bucket_states():
+    """Возвращает количество доступных запросов к провайдерам с лимитом"""
+    now = time.time()
+    buckets = {bucket.name: bucket for bucket in RateLimitBucket.objects.filter(name__in=list(RATE_LIMITS))}
+    return {
+        provider: {
+            'tokens': round(_refill(buckets[provider], limit, now), 1) if provider in buckets else float(limit['capacity']),
+            'capacity': limit['capacity'],
+            'per_minute': limit['per_minute'],
+            'reserve': limit['reserve'],
+        }
+        for provider, limit in RATE_LIMITS.items()
+    }
@@ -1,7 +1,21 @@
-from .models import CurrencyRate, News, NewsSource, CurrencyRateHistory
+from .models import CurrencyRate, News, NewsSource, CurrencyRateHistory, ForexSnapshot, TrackedCoin
+from .currency_cache import invalidate_currency_cache
+from .currency_history import rollup_currency_history
+from . import currency_history, http_client, job_telemetry, leader_election, rate_limit
+from .page_cache import bump_news_version
+from .forex import store_snapshot, store_cbr_snapshot, FOREX_SNAPSHOT_RETENTION_DAYS
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from django_apscheduler.jobstores import DjangoJobStore
+from django_apscheduler.models import DjangoJobExecution
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
 from django.utils import timezone
+import atexit
 import logging
+import threading
+import time
 from pycbrf import ExchangeRates
 import requests
 from decimal import Decimal
@@ -22,229 +36,458 @@ class SchedulerSingleton:
             cls._initialize_scheduler()
         return cls._instance
 
+    # Роль лидера: задачи выполняет только один из процессов с планировщиком
+    LEADER_LEASE_NAME = 'scheduler'
+    # Как часто лидер продлевает аренду, а остальные процессы пытаются ее получить (в секундах)
+    LEADER_RENEW_INTERVAL = max(1, leader_election.LEASE_TTL // 4)
+    _holder_id = None
+    _leader_until = None
+    _scheduler = None
+    _leader_thread = None
+    _stop_event = None
+
+    # Плановые задачи: имя метода -> (расписание cron, допустимое опоздание запуска в секундах).
+    # Если процесс-лидер был остановлен во время запуска, пропущенный запуск выполняется один раз
+    # (coalesce), если лидер вернулся или сменился в пределах допустимого опоздания
+    SCHEDULED_JOBS = {
+        'update_currency_job': ({'minute': 0}, 10 * 60),
+        'fetch_news': ({'hour': '*/6', 'minute': 5}, 60 * 60),
+        'backfill_daily_history': ({'hour': 0, 'minute': 20}, 6 * 60 * 60),
+        'prune_job_history': ({'hour': 3, 'minute': 30}, 6 * 60 * 60),
+    }
+
+    # Сколько дней хранить историю и телеметрию выполнения задач
+    JOB_HISTORY_RETENTION_DAYS = 14
+
     # Инициализация планировщика - Метод _initialize_scheduler:
-    # Данный метод создает и настраивает планировщик фоновых задач на основе библиотеки apscheduler.
-    # Он регистрирует все периодические задачи приложения с указанием интервалов их выполнения:
-    # - Обновление курсов валют (ежедневно в полночь)
+    # Данный метод запускает поток выбора лидера. Из всех процессов с планировщиком задачи выполняет только лидер -
+    # процесс, который держит аренду в БД. Если лидер умер, аренду после истечения срока забирает другой процесс.
+    # Лидер запускает планировщик apscheduler с задачами по расписанию cron (SCHEDULED_JOBS):
+    # - Обновление курсов валют (в начале каждого часа)
     # - Сбор новостей (каждые 6 часов)
-    # Также планировщик выполняет начальный запуск задач при старте приложения.
+    # - Догрузка дневных курсов для графиков за неделю, месяц и год (раз в сутки)
+    # Задачи и время их следующего запуска хранятся в БД (DjangoJobStore), поэтому перезапуск процесса
+    # не сбивает расписание, а каждое выполнение записывается в историю (DjangoJobExecution) с длительностью
+    # и в телеметрию (JobRun) с записанными строками и временем ответа внешних сервисов.
     @classmethod
     def _initialize_scheduler(cls):
-        cls._scheduler = BackgroundScheduler()
-        cls._initial_run = True
-        cls._scheduler.add_job(cls.update_currency_job, 'interval', hours=1, id='update_currency_job', replace_existing=True)
-        cls._scheduler.add_job(cls.fetch_news, 'interval', hours=6, id='fetch_news', replace_existing=True)
-        cls._scheduler.add_job(cls.update_currency_job, 'date', run_date=timezone.now(), id='update_currency_job_init', replace_existing=True)
-        cls._scheduler.add_job(cls.fetch_news, 'date', run_date=timezone.now() + timedelta(seconds=5), id='fetch_news_init', replace_existing=True)
-        cls._scheduler.start()
+        # Идентификатор создается здесь, а не при импорте, чтобы процессы после fork получили разные
+        cls._holder_id = leader_election.make_holder_id()
+        cls._stop_event = threading.Event()
+        cls._leader_thread = threading.Thread(target=cls._leadership_loop, name='scheduler-leader', daemon=True)
+        cls._leader_thread.start()
+        atexit.register(cls.release_leadership)
+
+    @classmethod
+    def _leadership_loop(cls):
+        """Продлевает аренду роли лидера и запускает планировщик, пока процесс - лидер"""
+        while True:
+            close_old_connections()
+            cls.renew_leadership()
+            if cls.is_leader():
+                cls._start_scheduler()
+            else:
+                cls._stop_scheduler(wait=False)
+            if cls._stop_event.wait(cls.LEADER_RENEW_INTERVAL):
+                return
+
+    @classmethod
+    def _create_scheduler(cls):
+        """Создает планировщик с хранилищем задач в БД"""
+        return BackgroundScheduler(
+            jobstores={'default': DjangoJobStore()},
+            job_defaults={'coalesce': True, 'max_instances': 1},
+            timezone=settings.TIME_ZONE,
+        )
+
+    @classmethod
+    def _start_scheduler(cls):
+        """Запускает планировщик в процессе, ставшем лидером"""
+        if cls._scheduler is not None:
+            return
+        try:
+            scheduler = cls._create_scheduler()
+            # Задачи сверяются с SCHEDULED_JOBS до того, как планировщик начнет их выполнять
+            scheduler.start(paused=True)
+            cls.sync_jobs(scheduler)
+            scheduler.resume()
+            cls._scheduler = scheduler
+        except Exception as e:
+            cls.logger.error(f"Ошибка при запуске планировщика: {e}")
+
+    @classmethod
+    def _stop_scheduler(cls, wait=True):
+        """Останавливает планировщик: новые задачи не запускаются, выполняющиеся (при wait=True) завершаются"""
+        scheduler, cls._scheduler = cls._scheduler, None
+        if scheduler is not None:
+            scheduler.shutdown(wait=wait)
+
+    @classmethod
+    def sync_jobs(cls, scheduler):
+        """
+        Приводит задачи в хранилище к SCHEDULED_JOBS. Задачи, которые уже есть с тем же расписанием,
+        не изменяются, чтобы не потерять время следующего (или пропущенного) запуска.
+        Новая задача запускается сразу, чтобы при первом развертывании данные появились без ожидания расписания.
+        """
+        for job_name, (cron, misfire_grace_time) in cls.SCHEDULED_JOBS.items():
+            trigger = CronTrigger(timezone=settings.TIME_ZONE, **cron)
+            existing = scheduler.get_job(job_name)
+            if existing is not None and str(existing.trigger) == str(trigger) \
+                    and existing.func == cls.run_scheduled and tuple(existing.args) == (job_name,) \
+                    and existing.misfire_grace_time == misfire_grace_time:
+                continue
+
+            options = {} if existing is not None else {'next_run_time': timezone.now()}
+            scheduler.add_job(
+                cls.run_scheduled, trigger, args=[job_name], id=job_name, name=job_name,
+                misfire_grace_time=misfire_grace_time, replace_existing=True, **options
+            )
+            cls.logger.info(f"Задача {job_name} запланирована: {trigger}")
+
+        # Удаляем задачи, которых больше нет в коде (например, разовые запуски при старте из прошлых версий)
+        for job in scheduler.get_jobs():
+            if job.id not in cls.SCHEDULED_JOBS:
+                scheduler.remove_job(job.id)
+
+    @classmethod
+    def shutdown(cls, wait=True):
+        """
+        Останавливает выбор лидера и планировщик: новые задачи не запускаются,
+        а выполняющиеся (при wait=True) завершаются. Затем освобождает роль лидера.
+        """
+        if cls._instance is None:
+            return
+        cls._stop_event.set()
+        cls._leader_thread.join()
+        cls._stop_scheduler(wait=wait)
+        cls.release_leadership()
+        cls._instance = None
+
+    @classmethod
+    def prune_job_history(cls):
+        """Удаляет историю и телеметрию выполнения задач старше JOB_HISTORY_RETENTION_DAYS дней"""
+        DjangoJobExecution.objects.delete_old_job_executions(cls.JOB_HISTORY_RETENTION_DAYS * 24 * 60 * 60)
+        job_telemetry.add_rows(deleted=job_telemetry.prune(cls.JOB_HISTORY_RETENTION_DAYS))
+
+    @classmethod
+    def renew_leadership(cls):
+        """Продлевает аренду роли лидера или пытается ее получить"""
+        was_leader = cls.is_leader()
+        started = time.monotonic()
+        try:
+            acquired = leader_election.try_acquire(cls.LEADER_LEASE_NAME, cls._holder_id)
+        except Exception as e:
+            # Не удалось обратиться к БД: роль сохраняется до истечения срока, известного процессу
+            cls.logger.error(f"Ошибка при продлении аренды планировщика: {e}")
+            return
+
+        if acquired:
+            # Считаем себя лидером на интервал продления меньше срока аренды,
+            # чтобы перестать выполнять задачи раньше, чем роль сможет получить другой процесс
+            cls._leader_until = started + leader_election.LEASE_TTL - cls.LEADER_RENEW_INTERVAL
+            if not was_leader:
+                cls.logger.info(f"Процесс {cls._holder_id} выполняет фоновые задачи")
+        else:
+            if was_leader:
+                cls.logger.warning(f"Процесс {cls._holder_id} потерял роль лидера планировщика")
+            cls._leader_until = None
+
+    @classmethod
+    def is_leader(cls):
+        """Держит ли этот процесс действующую аренду роли лидера"""
+        return cls._leader_until is not None and time.monotonic() < cls._leader_until
+
+    @classmethod
+    def release_leadership(cls):
+        """Освобождает роль лидера при остановке процесса, чтобы ее сразу забрал другой процесс"""
+        if not cls.is_leader():
+            return
+        cls._leader_until = None
+        try:
+            leader_election.release(cls.LEADER_LEASE_NAME, cls._holder_id)
+        except Exception as e:
+            cls.logger.error(f"Ошибка при освобождении аренды планировщика: {e}")
+
+    @classmethod
+    def run_scheduled(cls, job_name):
+        """Выполняет плановую задачу job_name, если этот процесс - лидер, и записывает ее телеметрию"""
+        if not cls.is_leader():
+            cls.logger.debug(f"Пропуск задачи {job_name}: процесс {cls._holder_id} не является лидером")
+            return
+        # Потоки планировщика переиспользуются между запусками: не держим между ними разорванные соединения с БД
+        close_old_connections()
+        try:
+            with job_telemetry.track(job_name):
+                getattr(cls, job_name)()
+        finally:
+            close_old_connections()
+
+    # Сколько секунд обновление курсов может ждать освобождения лимита запросов к CoinGecko
+    RATE_LIMIT_MAX_WAIT = 30
+
+    # Сколько монет запрашивать в одном запросе simple/price (ограничено длиной URL)
+    COINGECKO_BATCH_SIZE = 100
 
     @classmethod
     def get_crypto_rates(cls):
+        """
+        Получает цены всех отслеживаемых криптовалют в долларах.
+        Монеты запрашиваются пачками по COINGECKO_BATCH_SIZE в одном запросе simple/price,
+        поэтому добавление монет не увеличивает число запросов к CoinGecko.
+        Для монет, цену которых получить не удалось, используется резервная цена из реестра.
+        """
+        coins = TrackedCoin.get_registry()
+        result = {code: coin['fallback_price'] for code, coin in coins.items()}
+        codes = list(coins)
+        for offset in range(0, len(codes), cls.COINGECKO_BATCH_SIZE):
+            batch = {coins[code]['coingecko_id']: code for code in codes[offset:offset + cls.COINGECKO_BATCH_SIZE]}
+            result.update(cls.fetch_coingecko_prices(batch))
+        return result
+
+    @classmethod
+    def fetch_coingecko_prices(cls, batch):
+        """
+        Запрашивает цены пачки монет {ID в CoinGecko: код} одним запросом.
+        Возвращает {код: цена} только для монет, которые есть в ответе.
+        """
         try:
             url = "https://api.coingecko.com/api/v3/simple/price"
             params = {
-                "ids": "bitcoin,ethereum",
+                "ids": ",".join(batch),
                 "vs_currencies": "usd"
             }
             cls.logger.info(f"Запрос к CoinGecko API: {url} с параметрами {params}")
-            
-            response = requests.get(url, params=params, timeout=10)
+
+            # Плановое обновление не уступает лимит запросам графиков и при необходимости ждет токена
+            response = http_client.get(
+                url, params=params, provider='coingecko',
+                priority=rate_limit.PRIORITY_HIGH, max_wait=cls.RATE_LIMIT_MAX_WAIT
+            )
             cls.logger.info(f"Статус ответа CoinGecko: {response.status_code}")
-            
+
             if response.status_code != 200:
                 cls.logger.error(f"Ошибка API CoinGecko. Статус: {response.status_code}, Ответ: {response.text}")
-                # Возвращаем фиксированные значения при ошибке
-                return {
-                    "BTC": Decimal('30000.0000'),
-                    "ETH": Decimal('1600.0000')
-                }
-            
-            response.raise_for_status()
+                return {}
+
             data = response.json()
-            
-            # Проверяем структуру ответа
-            if "bitcoin" not in data or "ethereum" not in data:
-                cls.logger.error(f"Неверная структура ответа от CoinGecko: {data}")
-                # Возвращаем фиксированные значения при ошибке
-                return {
-                    "BTC": Decimal('30000.0000'),
-                    "ETH": Decimal('1600.0000')
-                }
-            
-            result = {
-                "BTC": Decimal(str(data["bitcoin"]["usd"])),
-                "ETH": Decimal(str(data["ethereum"]["usd"]))
-            }
-            
+            result = {}
+            for coingecko_id, code in batch.items():
+                price = data.get(coingecko_id, {}).get("usd")
+                if price is None:
+                    cls.logger.error(f"В ответе CoinGecko нет цены {code} ({coingecko_id})")
+                    continue
+                result[code] = Decimal(str(price))
+
             cls.logger.info(f"Получены курсы криптовалют от CoinGecko: {result}")
             return result
         except requests.exceptions.RequestException as e:
             cls.logger.error(f"Ошибка соединения с CoinGecko: {e}")
-            # Возвращаем фиксированные значения при ошибке
-            return {
-                "BTC": Decimal('30000.0000'),
-                "ETH": Decimal('1600.0000')
-            }
+            return {}
         except Exception as e:
             cls.logger.error(f"Ошибка при получении курсов криптовалют: {e}")
-            # Возвращаем фиксированные значения при ошибке
+            return {}
+
+    # Символы традиционных валют, отображаемые на сайте. Символы криптовалют задаются в реестре монет
+    CURRENCY_SYMBOLS = {
+        "USD": "$",
+        "EUR": "€",
+        "CNY": "¥"
+    }
+
+    # Традиционные валюты и их курсы на случай недоступности всех источников
+    FIAT_CURRENCIES = ["USD", "EUR", "CNY"]
+    FIXED_FIAT_RATES = {"USD": 90.0, "EUR": 100.0, "CNY": 12.5}
+
+    @classmethod
+    def fetch_fiat_rates(cls):
+        """
+        Получает курсы традиционных валют по цепочке OpenExchangeRates -> ЦБ РФ -> фиксированные значения.
+        Выполняет только сетевые запросы, ничего не записывая в БД.
+        Возвращает {'rates': {валюта: курс}, 'source': источник, 'snapshot': данные для снимка курсов или None}.
+        """
+        data = cls.fetch_openexchangerates()
+        forex_rates = cls.get_forex_rates_from_openexchangerates(data) if data else {}
+        cls.logger.info(f"Результат запроса к OpenExchangeRates: {forex_rates}")
+        if forex_rates:
             return {
-                "BTC": Decimal('30000.0000'),
-                "ETH": Decimal('1600.0000')
+                'rates': {currency: rate_info['rate'] for currency, rate_info in forex_rates.items()},
+                'source': 'OpenExchangeRates',
+                'snapshot': ('OpenExchangeRates', data),
+            }
+
+        # Если не удалось получить данные от OpenExchangeRates, используем ЦБ РФ
+        cls.logger.warning("Не удалось получить данные от OpenExchangeRates, используем ЦБ РФ")
+        try:
+            rates = http_client.call('cbr', ExchangeRates)
+            return {
+                'rates': {currency: rates[currency].rate for currency in cls.FIAT_CURRENCIES},
+                'source': 'ЦБ РФ',
+                'snapshot': ('ЦБ РФ', rates),
+            }
+        except Exception as e:
+            cls.logger.error(f"Ошибка при получении курсов валют через ЦБ РФ: {e}")
+
+        # Создаем фиксированные значения для отладки
+        cls.logger.warning("Создаем фиксированные значения для валют")
+        return {'rates': dict(cls.FIXED_FIAT_RATES), 'source': 'Фиксированное значение', 'snapshot': None}
+
+    @classmethod
+    def collect_currency_rates(cls):
+        """
+        Параллельно запрашивает курсы традиционных валют (с сохранением порядка резервных источников)
+        и криптовалют, поэтому обновление длится столько, сколько самый медленный источник.
+        Возвращает пару (результат fetch_fiat_rates, {криптовалюта: курс}).
+        """
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='currency-providers') as executor:
+            # Запросы из потоков пула учитываются в телеметрии выполняющейся задачи
+            fiat_future = executor.submit(job_telemetry.bind(cls._run_in_worker), cls.fetch_fiat_rates)
+            crypto_future = executor.submit(job_telemetry.bind(cls._run_in_worker), cls.get_crypto_rates)
+            return fiat_future.result(), crypto_future.result()
+
+    @staticmethod
+    def _run_in_worker(func):
+        """Выполняет func в потоке пула и закрывает открытые им соединения с БД (учет лимита запросов)"""
+        try:
+            return func()
+        finally:
+            connections.close_all()
+
+    @classmethod
+    def save_currency_rates(cls, now, fiat, crypto_rates, source_suffix=''):
+        """
+        Записывает текущие курсы, историю и снимок курсов одной транзакцией.
+        Текущие курсы обновляются пакетно, а не отдельным update_or_create на каждую валюту.
+        """
+        symbols = {
+            **cls.CURRENCY_SYMBOLS,
+            **{code: coin['symbol'] for code, coin in TrackedCoin.get_registry().items()},
+        }
+        records = [(currency, rate, fiat['source']) for currency, rate in fiat['rates'].items()]
+        records += [(crypto, rate, 'CoinGecko') for crypto, rate in crypto_rates.items()]
+        records = [
+            (currency, rate, f"{source}{source_suffix}")
+            for currency, rate, source in records
+            if currency in symbols
+        ]
+
+        with transaction.atomic():
+            # Сохраняем курсы всех валют одним снимком для конвертера
+            if fiat['snapshot']:
+                snapshot_source, snapshot_data = fiat['snapshot']
+                try:
+                    with transaction.atomic():
+                        if snapshot_source == 'ЦБ РФ':
+                            store_cbr_snapshot(snapshot_data)
+                        else:
+                            store_snapshot(
+                                snapshot_data['rates'], base=snapshot_data.get('base', 'USD'), source=snapshot_source
+                            )
+                    job_telemetry.add_rows(upserted=1)
+                except Exception as e:
+                    cls.logger.error(f"Ошибка при сохранении снимка курсов {snapshot_source}: {e}")
+
+            existing = {
+                rate.currency_name: rate
+                for rate in CurrencyRate.objects.filter(currency_name__in=[record[0] for record in records])
             }
+            to_update, to_create = [], []
+            for currency, rate, source in records:
+                current = existing.get(currency)
+                if current is None:
+                    to_create.append(CurrencyRate(
+                        currency_name=currency,
+                        rate=rate,
+                        symbol=symbols[currency],
+                        updated_at=now,
+                        source=source
+                    ))
+                else:
+                    current.rate = rate
+                    current.symbol = symbols[currency]
+                    current.updated_at = now
+                    current.source = source
+                    to_update.append(current)
+            CurrencyRate.objects.bulk_update(to_update, ['rate', 'symbol', 'updated_at', 'source'])
+            CurrencyRate.objects.bulk_create(to_create)
+
+            # Сохраняем историю курсов
+            CurrencyRateHistory.objects.bulk_create([
+                CurrencyRateHistory(currency_name=currency, rate=rate, timestamp=now, source=source)
+                for currency, rate, source in records
+            ])
+            job_telemetry.add_rows(upserted=len(to_update) + len(to_create) + len(records))
+
+            # Пакетные операции не отправляют сигналы, поэтому сбрасываем кеш главной страницы сами
+            transaction.on_commit(bump_news_version)
+        cls.logger.info(f"Записаны курсы {len(records)} валют: {', '.join(record[0] for record in records)}")
 
     @classmethod
     def update_currency_job(cls):
         try:
-            # Очищаем кеш данных курсов валют при обновлении
-            # Импортируем здесь, чтобы избежать цикличного импорта
-            from .views import _currency_data_cache
-            _currency_data_cache.clear()
-            
             now = timezone.now()
-            
-            # Разрешаем обновление только в начале часа или при запуске сервера
-            if now.minute != 0 and not getattr(cls, '_initial_run', False):
-                cls.logger.info(f"Пропуск обновления курсов валют. Обновление только в начале часа (текущие минуты: {now.minute})")
-                return
-            
-            # Сбрасываем флаг первого запуска
-            if getattr(cls, '_initial_run', False):
-                cls._initial_run = False
-            
             cls.logger.info(f"Начало обновления курсов валют в {now}")
-            
-            currency_symbols = {
-                "USD": "$",
-                "EUR": "€",
-                "CNY": "¥",
-                "BTC": "₿",
-                "ETH": "Ξ"
-            }
 
-            # Получаем курсы традиционных валют через OpenExchangeRates API
-            forex_rates = cls.get_forex_rates_from_openexchangerates()
-            cls.logger.info(f"Результат запроса к OpenExchangeRates: {forex_rates}")
-            
-            # Если не удалось получить данные от OpenExchangeRates, используем ЦБ РФ
-            if not forex_rates:
-                cls.logger.warning("Не удалось получить данные от OpenExchangeRates, используем ЦБ РФ")
-                try:
-                    rates = ExchangeRates()
-                    for currency in ["USD", "EUR", "CNY"]:
-                        rate = rates[currency].rate
-                        # Обновляем текущий курс
-                        CurrencyRate.objects.update_or_create(
-                            currency_name=currency,
-                            defaults={
-                                'rate': rate,
-                                'symbol': currency_symbols[currency],
-                                'updated_at': now,
-                                'source': 'ЦБ РФ'
-                            }
-                        )
-                        
-                        # Сохраняем историю курса
-                        CurrencyRateHistory.objects.create(
-                            currency_name=currency,
-                            rate=rate,
-                            timestamp=now,
-                            source='ЦБ РФ'
-                        )
-                    cls.logger.info("Курсы традиционных валют успешно обновлены из ЦБ РФ")
-                except Exception as e:
-                    cls.logger.error(f"Ошибка при получении курсов валют через ЦБ РФ: {e}")
-                    # Создаем фиксированные значения для отладки
-                    cls.logger.warning("Создаем фиксированные значения для валют")
-                    for currency, default_rate in {"USD": 90.0, "EUR": 100.0, "CNY": 12.5}.items():
-                        try:
-                            CurrencyRate.objects.update_or_create(
-                                currency_name=currency,
-                                defaults={
-                                    'rate': default_rate,
-                                    'symbol': currency_symbols[currency],
-                                    'updated_at': now,
-                                    'source': 'Фиксированное значение'
-                                }
-                            )
-                            
-                            # Сохраняем историю курса
-                            CurrencyRateHistory.objects.create(
-                                currency_name=currency,
-                                rate=default_rate,
-                                timestamp=now,
-                                source='Фиксированное значение'
-                            )
-                        except Exception as inner_e:
-                            cls.logger.error(f"Ошибка при создании фиксированного значения для {currency}: {inner_e}")
-                    return
-            else:
-                # Обновляем курсы из OpenExchangeRates
-                for currency, rate_info in forex_rates.items():
-                    if currency in currency_symbols:
-                        rate = rate_info['rate']
-                        # Обновляем текущий курс
-                        CurrencyRate.objects.update_or_create(
-                            currency_name=currency,
-                            defaults={
-                                'rate': rate,
-                                'symbol': currency_symbols[currency],
-                                'updated_at': now,
-                                'source': 'OpenExchangeRates'
-                            }
-                        )
-                        
-                        # Сохраняем историю курса
-                        CurrencyRateHistory.objects.create(
-                            currency_name=currency, 
-                            rate=rate,
-                            timestamp=now,
-                            source='OpenExchangeRates'
-                        )
-                cls.logger.info("Курсы традиционных валют успешно обновлены из OpenExchangeRates")
-
-            # Пробуем получить криптовалютные курсы
-            crypto_rates = cls.get_crypto_rates()
+            fiat, crypto_rates = cls.collect_currency_rates()
             cls.logger.info(f"Результат запроса криптовалютных курсов: {crypto_rates}")
-            
-            # Обновляем криптовалюты
-            for crypto, rate in crypto_rates.items():
-                # Обновляем текущий курс
-                CurrencyRate.objects.update_or_create(
-                    currency_name=crypto,
-                    defaults={
-                        'rate': rate,
-                        'symbol': currency_symbols[crypto],
-                        'updated_at': now,
-                        'source': 'CoinGecko'
-                    }
-                )
-                
-                # Сохраняем историю курса
-                CurrencyRateHistory.objects.create(
-                    currency_name=crypto,
-                    rate=rate,
-                    timestamp=now,
-                    source='CoinGecko'
-                )
-            cls.logger.info("Курсы криптовалют успешно обновлены")
+            cls.save_currency_rates(now, fiat, crypto_rates)
+
+            # Перед очисткой сворачиваем историю в почасовые OHLC, а завершенные дни - в дневные, чтобы не терять ее
+            rolled_up = rollup_currency_history(now)
+            job_telemetry.add_rows(upserted=rolled_up)
+            if rolled_up > 0:
+                cls.logger.info(f"Свернуто {rolled_up} интервалов истории курсов валют")
 
             # Очищаем историю старше 30 дней для экономии места
             thirty_days_ago = now - timedelta(days=30)
-            old_records = CurrencyRateHistory.objects.filter(timestamp__lt=thirty_days_ago)
-            deleted_count = old_records.count()
-            old_records.delete()
+            deleted_count, _ = CurrencyRateHistory.objects.filter(timestamp__lt=thirty_days_ago).delete()
             if deleted_count > 0:
                 cls.logger.info(f"Удалено {deleted_count} устаревших записей истории курсов валют")
 
+            # Снимки курсов занимают одну строку на обновление, поэтому хранятся дольше
+            deleted_snapshots, _ = ForexSnapshot.objects.filter(
+                fetched_at__lt=now - timedelta(days=FOREX_SNAPSHOT_RETENTION_DAYS)
+            ).delete()
+            job_telemetry.add_rows(deleted=deleted_count + deleted_snapshots)
+
+            # Сбрасываем кеш истории курсов во всех воркерах после записи новых данных
+            invalidate_currency_cache()
+
             cls.logger.info(f"Курсы валют обновлены в: {now}")
         except Exception as e:
+            job_telemetry.record_error(e)
             cls.logger.error(f"Ошибка при обновлении курсов валют: {e}")
 
     @classmethod
-    def get_forex_rates_from_openexchangerates(cls):
+    def backfill_daily_history(cls):
         """
-        Получает курсы валют через API OpenExchangeRates
+        Догружает в таблицу дневных курсов завершенные дни за самый длинный период графиков
+        для традиционных валют и всех отслеживаемых криптовалют. Графики за неделю, месяц и год
+        читают только эту таблицу и не обращаются к внешним API при запросе страницы.
+        """
+        period = max(currency_history.PERIOD_DAYS, key=currency_history.PERIOD_DAYS.get)
+        currencies = [code for code in cls.FIAT_CURRENCIES if code in currency_history.CB_CURRENCY_CODES]
+        currencies += list(TrackedCoin.get_registry())
+
+        created = 0
+        for currency_code in currencies:
+            start, end = currency_history.period_bounds(period)
+            try:
+                created += currency_history.backfill_daily_rates(currency_code, start, end)
+            except Exception as e:
+                job_telemetry.record_error(e)
+                cls.logger.error(f"Ошибка при догрузке дневных курсов {currency_code}: {e}")
+        job_telemetry.add_rows(upserted=created)
+
+        if created:
+            # Сбрасываем кеш истории курсов во всех воркерах, чтобы графики увидели новые дни
+            invalidate_currency_cache()
+            cls.logger.info(f"Догружено {created} дневных курсов")
+
+    @classmethod
+    def fetch_openexchangerates(cls):
+        """
+        Получает курсы всех валют к USD через API OpenExchangeRates.
+        Возвращает ответ API или None, если данные получить не удалось.
         """
         try:
             app_id = "35e0390444424d648c3bcf5c71469192"  # API ключ
@@ -253,12 +496,12 @@ class SchedulerSingleton:
             url = f"https://openexchangerates.org/api/latest.json?app_id={app_id}&base=USD"
             cls.logger.info(f"URL запроса: {url}")
             
-            response = requests.get(url, timeout=10)
+            response = http_client.get(url, provider='openexchangerates')
             cls.logger.info(f"Статус ответа: {response.status_code}")
             
             if response.status_code != 200:
                 cls.logger.error(f"Ошибка API OpenExchangeRates. Статус: {response.status_code}, Ответ: {response.text}")
-                return {}
+                return None
             
             response.raise_for_status()
             data = response.json()
@@ -268,19 +511,41 @@ class SchedulerSingleton:
             
             if 'rates' not in data:
                 cls.logger.error(f"В ответе OpenExchangeRates нет данных о курсах: {data}")
-                return {}
+                return None
             
             # Получаем курс USD к RUB для конвертации
             if 'RUB' not in data['rates']:
                 cls.logger.error("В ответе OpenExchangeRates нет данных о курсе RUB")
-                return {}
+                return None
             
+            return data
+        except requests.exceptions.RequestException as e:
+            cls.logger.error(f"Ошибка соединения с OpenExchangeRates: {e}")
+            return None
+        except ValueError as e:
+            cls.logger.error(f"Ошибка при парсинге ответа от OpenExchangeRates: {e}")
+            return None
+        except Exception as e:
+            cls.logger.error(f"Ошибка при получении курсов валют от OpenExchangeRates: {e}")
+            return None
+
+    @classmethod
+    def get_forex_rates_from_openexchangerates(cls, data=None):
+        """
+        Получает курсы валют через API OpenExchangeRates
+        (или вычисляет их из уже полученного ответа data)
+        """
+        try:
+            data = data or cls.fetch_openexchangerates()
+            if not data:
+                return {}
+
             usd_to_rub = Decimal(str(data['rates']['RUB']))
             cls.logger.info(f"Курс USD к RUB: {usd_to_rub}")
             
             result = {}
             # Вычисляем курсы валют к рублю
-            for currency in ["USD", "EUR", "CNY"]:
+            for currency in cls.FIAT_CURRENCIES:
                 if currency in data['rates']:
                     if currency == "USD":
                         # USD к RUB напрямую
@@ -301,103 +566,174 @@ class SchedulerSingleton:
             
             cls.logger.info(f"Получены курсы валют от OpenExchangeRates: {result}")
             return result
-        except requests.exceptions.RequestException as e:
-            cls.logger.error(f"Ошибка соединения с OpenExchangeRates: {e}")
-            return {}
-        except ValueError as e:
-            cls.logger.error(f"Ошибка при парсинге ответа от OpenExchangeRates: {e}")
-            return {}
         except Exception as e:
             cls.logger.error(f"Ошибка при получении курсов валют от OpenExchangeRates: {e}")
             return {}
 
-    @classmethod
-    def FEED_URLS(cls):
-        active_sources = NewsSource.objects.filter(is_active=True)
-        return {source.name: source.feed_url for source in active_sources}
+    # Сколько RSS-каналов загружать одновременно
+    NEWS_FETCH_WORKERS = 8
+    # Таймауты загрузки одного RSS-канала (в секундах): установка соединения и чтение ответа.
+    # Каналы загружаются без повторов, поэтому один канал не задерживает сбор дольше этих таймаутов:
+    # недоступный канал будет загружен при следующем запуске
+    FEED_TIMEOUT = (3.05, 15)
+    # Сколько часов хранить новости
+    NEWS_MAX_AGE_HOURS = 96
+
+    # Ключевые слова для фильтрации новостей по финансовой тематике
+    NEWS_KEYWORDS = [
+        'финанс', 'эконом', 'кредит', 'валюта', 'цб', 'банк',
+        'акции', 'биржа', 'инвестиции', 'депозит', 'монета',
+        'финансовый', 'прибыль', 'налоги', 'рынок', 'удорожение',
+        'спред', 'коммерция', 'банкротство', 'валютный', 'инфляция',
+        'ставка', 'оверрайт', 'рынок капитала', 'кредитование'
+    ]
 
     @classmethod
     def fetch_news(cls):
+        """Плановый сбор новостей из всех активных источников с удалением устаревших новостей"""
         try:
-            # Проверяем условие запуска - только при первом запуске сервера или по расписанию
-            now = timezone.now()
-            if not getattr(cls, '_initial_run', False) and now.hour % 6 != 0:
-                cls.logger.info(f"Пропуск обновления новостей. Обновление только каждые 6 часов или при запуске сервера")
-                return
-                
-            # Сбрасываем флаг первого запуска
-            if getattr(cls, '_initial_run', False):
-                cls._initial_run = False
-                
-            feed_urls = cls.FEED_URLS()
-            for feed_name, feed_url in feed_urls.items():
-                feed = feedparser.parse(feed_url)
-                entries = feed.entries
-                for entry in entries:
-                    title = entry.get("title", "Без заголовка")
-                    description = strip_tags(entry.get("description", ""))
-                    description = description.replace('&nbsp;', ' ')
-                    description = description.replace('&ndash;', '-')
-                    description = cls.limit_description(description, 3)
-                    published_at = entry.get("published", "")
-                    link = entry.get("link", "")
-                    # Извлечение изображения из описания, если доступно
-                    image_url = ""
-                    if '<img src="' in description:
-                        start = description.find('<img src="') + len('<img src="')
-                        end = description.find('"', start)
-                        image_url = description[start:end] if end > start else ""
-                    
-                    # Преобразуем дату публикации в объект datetime
-                    if published_at:
-                        try:
-                            date_published = datetime.strptime(published_at, "%a, %d %b %Y %H:%M:%S %z")
-                        except ValueError:
-                            date_published = timezone.now()
-                    else:
-                        date_published = timezone.now()
-
-                    # Фильтрация новостей по ключевым словам для обеспечения финансовой тематики
-                    allowed_keywords = [
-                        'финанс', 'эконом', 'кредит', 'валюта', 'цб', 'банк',
-                        'акции', 'биржа', 'инвестиции', 'депозит', 'монета',
-                        'финансовый', 'прибыль', 'налоги', 'рынок', 'удорожение',
-                        'спред', 'коммерция', 'банкротство', 'валютный', 'инфляция',
-                        'ставка', 'оверрайт', 'рынок капитала', 'кредитование'
-                    ]
-                    if not any(keyword in title.lower() or keyword in description.lower() for keyword in allowed_keywords):
-                        continue
-
-                    # Проверка, что новость опубликована в последние 96 часов
-                    ninety_six_hours_ago = timezone.now() - timedelta(hours=96)
-                    if date_published < ninety_six_hours_ago:
-                        continue
-
-                    # Получаем источник по названию RSS канала
-                    try:
-                        source = NewsSource.objects.get(name=feed_name)
-                    except NewsSource.DoesNotExist:
-                        source = None
-
-                    News.objects.update_or_create(
-                        link=link,
-                        defaults={
-                            'title': title,
-                            'description': description,
-                            'date_published': date_published,
-                            'image': image_url,
-                            'source': source
-                        }
-                    )
-            
-            # Удаляем новости старше 96 часов
-            ninety_six_hours_ago = timezone.now() - timedelta(hours=96)
-            News.objects.filter(date_published__lt=ninety_six_hours_ago).delete()
-            
+            cls.fetch_news_from_sources(NewsSource.objects.filter(is_active=True))
+
+            # Удаляем новости старше NEWS_MAX_AGE_HOURS часов
+            oldest = timezone.now() - timedelta(hours=cls.NEWS_MAX_AGE_HOURS)
+            deleted_count, _ = News.objects.filter(date_published__lt=oldest).delete()
+            job_telemetry.add_rows(deleted=deleted_count)
+
             cls.logger.info("Парсинг новостей завершен успешно.")
         except Exception as e:
+            job_telemetry.record_error(e)
             cls.logger.error(f"Ошибка при получении новостей через RSS: {e}")
 
+    # Выборочное обновление новостей - Метод fetch_news_from_sources
+    # Используется плановой задачей fetch_news для всех активных источников, а также для ручного
+    # обновления определенных источников из админ-панели или тестирования новых RSS-каналов.
+    @classmethod
+    def fetch_news_from_sources(cls, sources):
+        """
+        Обновляет новости из указанных источников.
+        Каналы загружаются и разбираются параллельно (не больше NEWS_FETCH_WORKERS одновременно,
+        с таймаутами FEED_TIMEOUT на каждый канал), поэтому сбор длится примерно столько, сколько
+        самый медленный канал. Новости записываются в БД в основном потоке по порядку источников.
+        Канал, не изменившийся с прошлой загрузки (ответ 304), не разбирается и не записывается.
+        """
+        sources = list(sources)
+        if not sources:
+            return
+        with ThreadPoolExecutor(
+            max_workers=min(cls.NEWS_FETCH_WORKERS, len(sources)), thread_name_prefix='news-feeds'
+        ) as executor:
+            # Запросы из потоков пула учитываются в телеметрии выполняющейся задачи
+            futures = [executor.submit(job_telemetry.bind(cls.download_feed), source) for source in sources]
+            for source, future in zip(sources, futures):
+                feed = future.result()
+                if feed is None:
+                    continue
+                if feed['not_modified']:
+                    cls.logger.info(f"Источник {source.name}: канал не изменился")
+                    continue
+                with transaction.atomic():
+                    saved = cls.save_feed_entries(source, feed['entries'])
+                    # Валидаторы сохраняются вместе с новостями: если запись не удалась, канал загрузится заново
+                    NewsSource.objects.filter(pk=source.pk).update(etag=feed['etag'], modified=feed['modified'])
+                cls.logger.info(f"Источник {source.name}: записано {saved} новостей")
+
+    @classmethod
+    def download_feed(cls, source):
+        """
+        Загружает и разбирает RSS-канал источника. Выполняется в потоке пула и не обращается к БД.
+        Запрос условный: с ETag и Last-Modified прошлой загрузки, поэтому неизменившийся канал
+        не передается и не разбирается.
+        Возвращает {'not_modified', 'entries', 'etag', 'modified'} или None, если канал получить не удалось.
+        """
+        headers = {}
+        if source.etag:
+            headers['If-None-Match'] = source.etag
+        if source.modified:
+            headers['If-Modified-Since'] = source.modified
+        try:
+            response = http_client.get(source.feed_url, timeout=cls.FEED_TIMEOUT, retries=False, headers=headers)
+            if response.status_code == 304:
+                return {'not_modified': True, 'entries': [], 'etag': source.etag, 'modified': source.modified}
+            if response.status_code != 200:
+                cls.logger.error(f"Ошибка загрузки RSS {source.name}. Статус: {response.status_code}")
+                return None
+            feed = feedparser.parse(response.content, response_headers=response.headers)
+        except requests.exceptions.RequestException as e:
+            cls.logger.error(f"Ошибка соединения с RSS {source.name}: {e}")
+            return None
+        except Exception as e:
+            cls.logger.error(f"Ошибка при разборе RSS {source.name}: {e}")
+            return None
+
+        if feed.get('bozo') and not feed.entries:
+            cls.logger.error(f"Некорректный RSS {source.name}: {feed.get('bozo_exception')}")
+            return None
+        # Слишком длинный валидатор не сохраняем: обрезанный никогда не совпадет
+        etag = response.headers.get('ETag', '')
+        modified = response.headers.get('Last-Modified', '')
+        return {
+            'not_modified': False,
+            'entries': feed.entries,
+            'etag': etag if len(etag) <= NewsSource._meta.get_field('etag').max_length else '',
+            'modified': modified if len(modified) <= NewsSource._meta.get_field('modified').max_length else '',
+        }
+
+    @classmethod
+    def save_feed_entries(cls, source, entries):
+        """
+        Записывает новости финансовой тематики из записей RSS-канала источника одной транзакцией.
+        Возвращает количество записанных новостей.
+        """
+        now = timezone.now()
+        oldest = now - timedelta(hours=cls.NEWS_MAX_AGE_HOURS)
+        saved = 0
+        with transaction.atomic():
+            for entry in entries:
+                title = entry.get("title", "Без заголовка")
+                description = strip_tags(entry.get("description", ""))
+                description = description.replace('&nbsp;', ' ')
+                description = description.replace('&ndash;', '-')
+                description = cls.limit_description(description, 3)
+                published_at = entry.get("published", "")
+                link = entry.get("link", "")
+                # Извлечение изображения из описания, если доступно
+                image_url = ""
+                if '<img src="' in description:
+                    start = description.find('<img src="') + len('<img src="')
+                    end = description.find('"', start)
+                    image_url = description[start:end] if end > start else ""
+
+                # Преобразуем дату публикации в объект datetime
+                if published_at:
+                    try:
+                        date_published = datetime.strptime(published_at, "%a, %d %b %Y %H:%M:%S %z")
+                    except ValueError:
+                        date_published = now
+                else:
+                    date_published = now
+
+                # Фильтрация новостей по ключевым словам для обеспечения финансовой тематики
+                if not any(keyword in title.lower() or keyword in description.lower() for keyword in cls.NEWS_KEYWORDS):
+                    continue
+
+                # Проверка, что новость опубликована в последние NEWS_MAX_AGE_HOURS часов
+                if date_published < oldest:
+                    continue
+
+                News.objects.update_or_create(
+                    link=link,
+                    defaults={
+                        'title': title,
+                        'description': description,
+                        'date_published': date_published,
+                        'image': image_url,
+                        'source': source
+                    }
+                )
+                saved += 1
+        job_telemetry.add_rows(upserted=saved)
+        return saved
+
     @classmethod
     def limit_description(cls, text, num_sentences=3):
         """
@@ -408,74 +744,6 @@ class SchedulerSingleton:
         sentences = re.split(r'(?<=[.!?])\s+', text)
         return ' '.join(sentences[:num_sentences]) if len(sentences) > num_sentences else text
 
-    # Выборочное обновление новостей - Метод fetch_news_from_sources
-    # Данный метод позволяет обновлять новости только из указанных источников,
-    # в отличие от основного метода fetch_news, который обрабатывает все активные источники.
-    # Это полезно для ручного обновления определенных источников или тестирования новых RSS-каналов.
-    @classmethod
-    def fetch_news_from_sources(cls, sources):
-        """
-        Обновляет новости только из указанных источников
-        """
-        try:
-            feed_urls = {source.name: source.feed_url for source in sources}
-            for feed_name, feed_url in feed_urls.items():
-                feed = feedparser.parse(feed_url)
-                entries = feed.entries
-                for entry in entries:
-                    title = entry.get("title", "Без заголовка")
-                    description = strip_tags(entry.get("description", ""))
-                    description = description.replace('&nbsp;', ' ')
-                    description = description.replace('&ndash;', '-')
-                    description = cls.limit_description(description, 3)
-                    published_at = entry.get("published", "")
-                    link = entry.get("link", "")
-                    
-                    # Преобразуем дату публикации в объект datetime
-                    if published_at:
-                        try:
-                            date_published = datetime.strptime(published_at, "%a, %d %b %Y %H:%M:%S %z")
-                        except ValueError:
-                            date_published = timezone.now()
-                    else:
-                        date_published = timezone.now()
-
-                    # Фильтрация новостей по ключевым словам для обеспечения финансовой тематики
-                    allowed_keywords = [
-                        'финанс', 'эконом', 'кредит', 'валюта', 'цб', 'банк',
-                        'акции', 'биржа', 'инвестиции', 'депозит', 'монета',
-                        'финансовый', 'прибыль', 'налоги', 'рынок', 'удорожение',
-                        'спред', 'коммерция', 'банкротство', 'валютный', 'инфляция',
-                        'ставка', 'оверрайт', 'рынок капитала', 'кредитование'
-                    ]
-                    if not any(keyword in title.lower() or keyword in description.lower() for keyword in allowed_keywords):
-                        continue
-
-                    # Проверка, что новость опубликована в последние 96 часов
-                    ninety_six_hours_ago = timezone.now() - timedelta(hours=96)
-                    if date_published < ninety_six_hours_ago:
-                        continue
-
-                    # Получаем источник по названию RSS канала
-                    try:
-                        source = NewsSource.objects.get(name=feed_name)
-                    except NewsSource.DoesNotExist:
-                        source = None
-
-                    News.objects.update_or_create(
-                        link=link,
-                        defaults={
-                            'title': title,
-                            'description': description,
-                            'date_published': date_published,
-                            'source': source
-                        }
-                    )
-            
-            cls.logger.info(f"Парсинг новостей из выбранных источников завершен успешно.")
-        except Exception as e:
-            cls.logger.error(f"Ошибка при получении новостей через RSS: {e}") 
-
     @classmethod
     def update_currency_job_force(cls):
         """
@@ -483,130 +751,18 @@ class SchedulerSingleton:
         Используется для ручного обновления из админ-панели
         """
         try:
-            # Очищаем кеш данных курсов валют при обновлении
-            # Импортируем здесь, чтобы избежать цикличного импорта
-            from .views import _currency_data_cache
-            _currency_data_cache.clear()
-            
             now = timezone.now()
             cls.logger.info(f"Запущено принудительное обновление курсов валют в {now}")
-            
-            currency_symbols = {
-                "USD": "$",
-                "EUR": "€",
-                "CNY": "¥",
-                "BTC": "₿",
-                "ETH": "Ξ"
-            }
 
-            # Получаем курсы традиционных валют через OpenExchangeRates API
-            forex_rates = cls.get_forex_rates_from_openexchangerates()
-            cls.logger.info(f"Результат запроса к OpenExchangeRates (force): {forex_rates}")
-            
-            # Если не удалось получить данные от OpenExchangeRates, используем ЦБ РФ
-            if not forex_rates:
-                cls.logger.warning("Не удалось получить данные от OpenExchangeRates, используем ЦБ РФ")
-                try:
-                    rates = ExchangeRates()
-                    for currency in ["USD", "EUR", "CNY"]:
-                        rate = rates[currency].rate
-                        # Обновляем текущий курс
-                        CurrencyRate.objects.update_or_create(
-                            currency_name=currency,
-                            defaults={
-                                'rate': rate,
-                                'symbol': currency_symbols[currency],
-                                'updated_at': now,
-                                'source': 'ЦБ РФ (принудительное обновление)'
-                            }
-                        )
-                        
-                        # Сохраняем историю курса
-                        CurrencyRateHistory.objects.create(
-                            currency_name=currency,
-                            rate=rate,
-                            timestamp=now,
-                            source='ЦБ РФ (принудительное обновление)'
-                        )
-                    cls.logger.info("Курсы традиционных валют успешно обновлены из ЦБ РФ (принудительно)")
-                except Exception as e:
-                    cls.logger.error(f"Ошибка при получении курсов валют через ЦБ РФ: {e}")
-                    # Создаем фиксированные значения для отладки
-                    cls.logger.warning("Создаем фиксированные значения для валют (принудительно)")
-                    for currency, default_rate in {"USD": 90.0, "EUR": 100.0, "CNY": 12.5}.items():
-                        try:
-                            CurrencyRate.objects.update_or_create(
-                                currency_name=currency,
-                                defaults={
-                                    'rate': default_rate,
-                                    'symbol': currency_symbols[currency],
-                                    'updated_at': now,
-                                    'source': 'Фиксированное значение (принудительное обновление)'
-                                }
-                            )
-                            
-                            # Сохраняем историю курса
-                            CurrencyRateHistory.objects.create(
-                                currency_name=currency,
-                                rate=default_rate,
-                                timestamp=now,
-                                source='Фиксированное значение (принудительное обновление)'
-                            )
-                        except Exception as inner_e:
-                            cls.logger.error(f"Ошибка при создании фиксированного значения для {currency}: {inner_e}")
-            else:
-                # Обновляем курсы из OpenExchangeRates
-                for currency, rate_info in forex_rates.items():
-                    if currency in currency_symbols:
-                        rate = rate_info['rate']
-                        # Обновляем текущий курс
-                        CurrencyRate.objects.update_or_create(
-                            currency_name=currency,
-                            defaults={
-                                'rate': rate,
-                                'symbol': currency_symbols[currency],
-                                'updated_at': now,
-                                'source': 'OpenExchangeRates (принудительное обновление)'
-                            }
-                        )
-                        
-                        # Сохраняем историю курса
-                        CurrencyRateHistory.objects.create(
-                            currency_name=currency,
-                            rate=rate,
-                            timestamp=now,
-                            source='OpenExchangeRates (принудительное обновление)'
-                        )
-                cls.logger.info("Курсы традиционных валют успешно обновлены из OpenExchangeRates (принудительно)")
-
-            # Пробуем получить криптовалютные курсы
-            crypto_rates = cls.get_crypto_rates()
+            fiat, crypto_rates = cls.collect_currency_rates()
             cls.logger.info(f"Результат запроса криптовалютных курсов (force): {crypto_rates}")
-            
-            # Обновляем криптовалюты
-            for crypto, rate in crypto_rates.items():
-                # Обновляем текущий курс
-                CurrencyRate.objects.update_or_create(
-                    currency_name=crypto,
-                    defaults={
-                        'rate': rate,
-                        'symbol': currency_symbols[crypto],
-                        'updated_at': now,
-                        'source': 'CoinGecko (принудительное обновление)'
-                    }
-                )
-                
-                # Сохраняем историю курса
-                CurrencyRateHistory.objects.create(
-                    currency_name=crypto,
-                    rate=rate,
-                    timestamp=now,
-                    source='CoinGecko (принудительное обновление)'
-                )
-            cls.logger.info("Курсы криптовалют успешно обновлены (принудительно)")
+            cls.save_currency_rates(now, fiat, crypto_rates, source_suffix=' (принудительное обновление)')
+
+            # Сбрасываем кеш истории курсов во всех воркерах после записи новых данных
+            invalidate_currency_cache()
 
             cls.logger.info(f"Принудительное обновление курсов валют завершено в: {now}")
             return True
         except Exception as e:
             cls.logger.error(f"Ошибка при принудительном обновлении курсов валют: {e}")
-            return False 
\ No newline at end of file
+            return False
@@ -1,8 +1,19 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from unittest import mock
 from django.urls import reverse, NoReverseMatch
 from django.contrib.auth.models import User
-from Ad.models import News, NewsRating, NewsComment as Comment
+from Ad.models import News, NewsRating, NewsComment as Comment, CurrencyRate, JobRun
+from Ad.tasks import SchedulerSingleton
+from Ad.tests.utils import create_tracked_coin
+from Ad import analytics, currency_cache, forex, http_client, job_telemetry, leader_election, rate_limit, views
+import requests
+from django.utils import timezone
+from datetime import datetime, timedelta
 import json
+import threading
+import time
+
 
 class NewsRatingAPITest(TestCase):
     """Тесты для API оценки новостей"""
@@ -39,6 +50,33 @@ class NewsRatingAPITest(TestCase):
         rating = NewsRating.objects.get(user=self.user, news=self.news)
         self.assertTrue(rating.is_like)
 
+    def test_rate_news_updates_counters(self):
+        """Тест обновления счетчиков новости при смене и отмене оценки"""
+        self.client.login(username='testuser', password='testpassword')
+
+        def rate(rating_type):
+            response = self.client.post(
+                reverse('rate_news'),
+                json.dumps({'news_id': self.news.id, 'rating_type': rating_type}),
+                content_type='application/json'
+            )
+            return json.loads(response.content)
+
+        data = rate('like')
+        self.assertEqual((data['likes'], data['dislikes']), (1, 0))
+
+        # Смена лайка на дизлайк переносит оценку между счетчиками
+        data = rate('dislike')
+        self.assertEqual((data['likes'], data['dislikes']), (0, 1))
+
+        # Повторный дизлайк отменяет оценку
+        data = rate('dislike')
+        self.assertEqual(data['status'], 'removed')
+        self.assertEqual((data['likes'], data['dislikes']), (0, 0))
+
+        self.news.refresh_from_db()
+        self.assertEqual((self.news.likes_count, self.news.dislikes_count), (0, 0))
+
 
 class CommentAPITest(TestCase):
     """Тесты для API комментариев"""
@@ -76,6 +114,7 @@ class CommentAPITest(TestCase):
         self.assertEqual(comment.text, 'Это тестовый комментарий')
         
         # Проверяем, что счетчик комментариев обновился
+        self.news.refresh_from_db()
         self.assertEqual(self.news.comments_count, 1)
 
 
@@ -235,4 +274,651 @@ class AuthRequiredForRatingTest(TestCase):
         data = json.loads(response.content)
         # Проверяем, что в ответе есть индикатор ошибки
         self.assertEqual(data['status'], 'error')
-        # Сообщение об ошибке может отличаться, потому не проверяем его точное содержание 
\ No newline at end of file
+        # Сообщение об ошибке может отличаться, потому не проверяем его точное содержание
+
+
+class NewsFeedAPITest(TestCase):
+    """Тесты для API ленты новостей с keyset-пагинацией"""
+
+    def setUp(self):
+        """Настройка тестового окружения"""
+        base_time = timezone.now()
+        self.news_ids = []
+        for i in range(25):
+            # Часть новостей с одинаковой датой, чтобы проверить сортировку по id
+            news = News.objects.create(
+                title=f"Новость {i+1}",
+                description=f"Описание новости {i+1}",
+                date_published=base_time - timedelta(hours=i // 3)
+            )
+            self.news_ids.append(news.id)
+
+        # Ожидаемый порядок - от новых к старым, при равной дате по убыванию id
+        self.expected_order = [
+            news.id for news in News.objects.order_by('-date_published', '-id')
+        ]
+
+    def test_pagination_walks_whole_feed(self):
+        """Тест обхода всей ленты по курсорам без пропусков и повторов"""
+        received = []
+        cursor = None
+        while True:
+            params = {'page_size': 10}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(reverse('news_feed'), params)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)
+            self.assertEqual(data['status'], 'success')
+            received.extend(item['id'] for item in data['news'])
+            cursor = data['next_cursor']
+            if not data['has_more']:
+                break
+
+        self.assertEqual(received, self.expected_order)
+
+    def test_deep_page_costs_same_as_first(self):
+        """Тест того, что глубокая страница требует столько же запросов, сколько первая"""
+        first = json.loads(self.client.get(reverse('news_feed'), {'page_size': 5}).content)
+        self.assertEqual(len(first['news']), 5)
+        self.assertIn('likes_count', first['news'][0])
+
+        # Новости и фоновые изображения
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('news_feed'), {'page_size': 5, 'cursor': first['next_cursor']})
+        self.assertEqual(
+            [item['id'] for item in json.loads(response.content)['news']],
+            self.expected_order[5:10]
+        )
+
+    def test_invalid_cursor(self):
+        """Тест ответа на некорректный курсор"""
+        response = self.client.get(reverse('news_feed'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['status'], 'error')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CurrencyHistoryCacheTest(TestCase):
+    """Тесты общего кеша истории курсов валют"""
+
+    history = [{'date': '2025-03-25', 'value': 83.87}]
+
+    def setUp(self):
+        """Настройка тестового окружения"""
+        cache.clear()
+        # Фоновые обновления, подмененные в предыдущих тестах, не должны блокировать новые
+        currency_cache._background_refreshes.clear()
+        currency_cache.reset_cache_stats()
+
+    def request_history(self, currency_code='USD', period='month'):
+        response = self.client.post(
+            reverse('currency_history'),
+            json.dumps({'currency_code': currency_code, 'period': period}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_history_served_from_cache(self):
+        """Тест того, что повторный запрос не обращается к источнику данных"""
+        with mock.patch('Ad.views.load_currency_history', return_value=self.history) as loader:
+            first = self.request_history()
+            second = self.request_history()
+
+        self.assertEqual(loader.call_count, 1)
+        self.assertEqual(first['data'], self.history)
+        self.assertEqual(second['data'], self.history)
+
+        stats = currency_cache.get_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_history_downsampled_to_max_points(self):
+        """Тест ограничения количества точек графика"""
+        long_history = [{'date': f'2025-01-01 {hour:02d}:00', 'value': float(hour % 5)} for hour in range(24)]
+        with mock.patch('Ad.views.load_currency_history', return_value=long_history):
+            response = self.client.post(
+                reverse('currency_history'),
+                json.dumps({'currency_code': 'USD', 'period': 'day', 'max_points': 10}),
+                content_type='application/json'
+            )
+
+        data = json.loads(response.content)['data']
+        self.assertEqual(len(data), 10)
+        self.assertEqual(data[-1], long_history[-1])
+
+    def test_too_few_max_points_rejected(self):
+        """Тест ответа 400, если точек меньше, чем нужно для прореживания"""
+        with mock.patch('Ad.views.load_currency_history') as loader:
+            for max_points in (2, 0, -5, 'abc'):
+                response = self.client.get(
+                    reverse('currency_history') + f'?currency=USD&period=day&max_points={max_points}'
+                )
+                self.assertEqual(response.status_code, 400)
+        loader.assert_not_called()
+
+    def test_batch_history_resolves_hits_and_loads_misses(self):
+        """Тест пакетного запроса: попадания берутся из кеша, промахи загружаются"""
+        with mock.patch('Ad.views.load_currency_history', return_value=self.history) as loader:
+            self.request_history('USD', 'month')
+            response = self.client.post(
+                reverse('currency_history_batch'),
+                json.dumps({'currency_codes': ['USD', 'BTC'], 'periods': ['month', 'day']}),
+                content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)['data']
+        self.assertEqual(loader.call_count, 4)
+        self.assertEqual(
+            sorted(call.args for call in loader.call_args_list[1:]),
+            [('BTC', 'day'), ('BTC', 'month'), ('USD', 'day')]
+        )
+        self.assertEqual(set(data), {'USD', 'BTC'})
+        self.assertEqual(data['BTC']['day']['data'], self.history)
+        self.assertEqual(data['USD']['month']['freshness'], 'fresh')
+
+    def test_batch_history_validates_request(self):
+        """Тест проверки параметров пакетного запроса"""
+        for body in ({}, {'currency_codes': 'USD'}, {'currency_codes': [f'C{i}' for i in range(30)]}):
+            response = self.client.post(
+                reverse('currency_history_batch'), json.dumps(body), content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_history_sets_etag_and_cache_control(self):
+        """Тест GET-запроса истории: ETag, Cache-Control и ответ 304 без загрузки данных"""
+        url = reverse('currency_history') + '?currency=USD&period=month'
+        with mock.patch('Ad.views.load_currency_history', return_value=self.history) as loader:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content)['data'], self.history)
+            etag = response['ETag']
+            self.assertIn('max-age=3600', response['Cache-Control'])
+            self.assertIn('public', response['Cache-Control'])
+
+            with self.assertNumQueries(0):
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified['ETag'], etag)
+        self.assertEqual(loader.call_count, 1)
+
+        # Перезагрузка тех же данных не меняет ETag, и ответ 304 не собирается заново
+        cache.clear()
+        with mock.patch('Ad.views.load_currency_history', return_value=list(self.history)), \
+                mock.patch('Ad.views._history_response_item') as build_response:
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        build_response.assert_not_called()
+
+        # Измененные данные меняют ETag, откуда бы они ни были получены
+        cache.clear()
+        changed = [*self.history[:-1], {**self.history[-1], 'value': 90.0}]
+        with mock.patch('Ad.views.load_currency_history', return_value=changed):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unknown_period_rejected(self):
+        """Тест ответа 400 на неизвестный период без загрузки данных"""
+        with mock.patch('Ad.views.load_currency_history') as loader:
+            responses = [
+                self.client.get(reverse('currency_history') + '?currency=USD&period=decade'),
+                self.client.get(reverse('currency_analytics') + '?currency=USD&period=decade'),
+                self.client.post(
+                    reverse('currency_history_batch'),
+                    json.dumps({'currency_codes': ['USD'], 'periods': ['month', 'decade']}),
+                    content_type='application/json'
+                ),
+            ]
+        self.assertEqual([response.status_code for response in responses], [400, 400, 400])
+        loader.assert_not_called()
+
+    def test_columnar_and_delta_formats(self):
+        """Тест столбцового и разностного форматов, отдаваемых из той же записи кеша"""
+        history = [
+            {'date': '2025-03-25 07:00', 'value': 83.87},
+            {'date': '2025-03-25 08:00', 'value': 83.9},
+            {'date': '2025-03-25 09:00', 'value': 83.8512},
+        ]
+        url = reverse('currency_history') + '?currency=USD&period=day'
+        with mock.patch('Ad.views.load_currency_history', return_value=history) as loader:
+            columnar = json.loads(self.client.get(url + '&format=columnar').content)
+            delta = json.loads(self.client.get(url + '&format=delta').content)
+            invalid = self.client.get(url + '&format=xml')
+        self.assertEqual(loader.call_count, 1)
+        self.assertEqual(invalid.status_code, 400)
+
+        first_epoch = int(timezone.make_aware(datetime(2025, 3, 25, 7, 0)).timestamp())
+        self.assertEqual(columnar['format'], 'columnar')
+        self.assertEqual(columnar['data'], {
+            't': [first_epoch, first_epoch + 3600, first_epoch + 7200],
+            'v': [83.87, 83.9, 83.8512],
+        })
+        self.assertEqual(delta['data'], {
+            't': [first_epoch, 3600, 3600],
+            'v': [838700, 300, -488],
+            'scale': 10000,
+        })
+
+    def test_analytics_computed_once_per_series(self):
+        """Тест индикаторов по ряду и их кеширования рядом с рядом"""
+        history = [{'date': f'2025-03-{day:02d}', 'value': float(value)} for day, value in ((1, 100), (2, 110), (3, 99), (4, 120))]
+        url = reverse('currency_analytics') + '?currency=USD&period=month&sma=2&ema=2&volatility_window=2'
+        with mock.patch('Ad.views.load_currency_history', return_value=history), \
+                mock.patch('Ad.analytics.compute_analytics', wraps=analytics.compute_analytics) as compute:
+            response = self.client.get(url)
+            self.client.get(url)
+
+        self.assertEqual(compute.call_count, 1)
+        data = json.loads(response.content)['data']
+        self.assertEqual(data['sma']['2'], [None, 105.0, 104.5, 109.5])
+        self.assertEqual(data['returns'][:2], [None, 10.0])
+        self.assertEqual(data['volatility'][0:2], [None, None])
+        self.assertEqual(data['summary']['min'], 99.0)
+        self.assertEqual(data['summary']['max'], 120.0)
+        self.assertEqual(data['summary']['percent_change'], 20.0)
+        self.assertEqual(len(data['ema']['2']), 4)
+
+        invalid = self.client.get(reverse('currency_analytics') + '?currency=USD&sma=1')
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_get_stale_history_not_cacheable(self):
+        """Тест того, что устаревшая история не кешируется браузером"""
+        url = reverse('currency_history') + '?currency=USD&period=month'
+        with mock.patch('Ad.views.load_currency_history', return_value=self.history), \
+                mock.patch('Ad.currency_cache._run_in_background'):
+            self.client.get(url)
+            self.expire_cached_history('USD', 'month', 60)
+            response = self.client.get(url)
+
+        self.assertEqual(json.loads(response.content)['freshness'], 'stale')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def expire_cached_history(self, currency_code, period, seconds_ago):
+        """Сдвигает момент устаревания закешированной истории в прошлое"""
+        key = currency_cache.history_cache_key(currency_code, period)
+        entry = cache.get(key)
+        entry['fresh_until'] = time.time() - seconds_ago
+        cache.set(key, entry)
+
+    def test_invalidation_reloads_history(self):
+        """Тест сброса кеша при обновлении курсов: данные отдаются устаревшими и обновляются в фоне"""
+        with mock.patch('Ad.views.load_currency_history', return_value=self.history) as loader, \
+                mock.patch('Ad.currency_cache._run_in_background', side_effect=lambda func: func()):
+            self.request_history()
+            currency_cache.invalidate_currency_cache()
+            stale = self.request_history()
+            fresh = self.request_history()
+
+        self.assertEqual(loader.call_count, 2)
+        self.assertEqual(stale['freshness'], 'stale')
+        self.assertEqual(fresh['freshness'], 'fresh')
+
+    def test_expired_history_served_stale_while_refreshing(self):
+        """Тест того, что устаревшая история отдается сразу, а обновляется в фоне"""
+        updated_history = [{'date': '2025-03-26', 'value': 84.1}]
+        with mock.patch('Ad.views.load_currency_history', return_value=self.history):
+            first = self.request_history()
+        self.assertEqual(first['freshness'], 'fresh')
+        self.expire_cached_history('USD', 'month', 60)
+
+        background = []
+        with mock.patch('Ad.views.load_currency_history', return_value=updated_history) as loader, \
+                mock.patch('Ad.currency_cache._run_in_background', side_effect=background.append):
+            stale = self.request_history()
+            # Повторный запрос не запускает второе фоновое обновление
+            self.request_history()
+            self.assertEqual(loader.call_count, 0)
+            self.assertEqual(len(background), 1)
+            background[0]()
+            refreshed = self.request_history()
+
+        self.assertEqual(stale['freshness'], 'stale')
+        self.assertEqual(stale['data'], self.history)
+        self.assertEqual(loader.call_count, 1)
+        self.assertEqual(refreshed['freshness'], 'fresh')
+        self.assertEqual(refreshed['data'], updated_history)
+
+    def test_history_beyond_max_staleness_refreshed_synchronously(self):
+        """Тест блокирующего обновления слишком старой истории"""
+        updated_history = [{'date': '2025-03-26', 'value': 84.1}]
+        with mock.patch('Ad.views.load_currency_history', return_value=self.history):
+            self.request_history()
+        self.expire_cached_history('USD', 'month', currency_cache.CURRENCY_CACHE_MAX_STALE['month'] + 60)
+
+        with mock.patch('Ad.views.load_currency_history', return_value=updated_history) as loader, \
+                mock.patch('Ad.currency_cache._run_in_background') as run_in_background:
+            response = self.request_history()
+
+        self.assertEqual(loader.call_count, 1)
+        run_in_background.assert_not_called()
+        self.assertEqual(response['freshness'], 'fresh')
+        self.assertEqual(response['data'], updated_history)
+
+    def test_periods_cached_separately(self):
+        """Тест раздельного кеширования разных валют и периодов"""
+        with mock.patch('Ad.views.load_currency_history', return_value=self.history) as loader:
+            self.request_history('USD', 'month')
+            self.request_history('USD', 'day')
+            self.request_history('EUR', 'month')
+            self.request_history('USD', 'day')
+
+        self.assertEqual(loader.call_count, 3)
+
+    def test_concurrent_misses_share_one_upstream_call(self):
+        """Тест объединения одновременных промахов кеша в один запрос к источнику"""
+        calls = []
+
+        def slow_loader(currency_code, period):
+            calls.append((currency_code, period))
+            time.sleep(0.3)
+            return self.history
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(views.get_or_load_currency_history('BTC', 'week')['data'])
+            )
+            for _ in range(5)
+        ]
+        with mock.patch('Ad.views.load_currency_history', side_effect=slow_loader):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [self.history] * 5)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ConvertCurrencyAPITest(TestCase):
+    """Тесты конвертера валют по снимку курсов"""
+
+    def setUp(self):
+        """Настройка тестового окружения"""
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            forex.store_snapshot(
+                {'USD': 1, 'RUB': 90, 'EUR': 0.9, 'CNY': 7.2}, base='USD', source='OpenExchangeRates'
+            )
+
+    def test_convert_any_pair_from_snapshot(self):
+        """Тест расчета кросс-курсов и повторной конвертации без запросов к БД"""
+        url = reverse('convert_currency') + '?from=EUR&to=RUB,CNY&amount=2'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)['data']
+        self.assertEqual(data['rates'], {'RUB': 100.0, 'CNY': 8.0})
+        self.assertEqual(data['results'], {'RUB': 200.0, 'CNY': 16.0})
+
+        with self.assertNumQueries(0):
+            self.client.get(reverse('convert_currency') + '?from=CNY&to=RUB')
+
+    def test_new_snapshot_replaces_rates(self):
+        """Тест того, что новый снимок сразу используется конвертером"""
+        self.client.get(reverse('convert_currency') + '?from=USD&to=RUB')
+        with self.captureOnCommitCallbacks(execute=True):
+            forex.store_snapshot({'USD': 1, 'RUB': 95}, base='USD')
+
+        data = json.loads(self.client.get(reverse('convert_currency') + '?from=USD&to=RUB').content)['data']
+        self.assertEqual(data['rates'], {'RUB': 95.0})
+
+    def test_unknown_currency(self):
+        """Тест ошибки для неизвестной валюты"""
+        response = self.client.get(reverse('convert_currency') + '?from=USD&to=XXX')
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_finite_amount_rejected(self):
+        """Тест ответа 400 на сумму, которую нельзя отдать в JSON"""
+        for amount in ('nan', 'inf', '-Infinity', 'abc', '1e308'):
+            response = self.client.get(reverse('convert_currency') + f'?from=USD&to=RUB&amount={amount}')
+            self.assertEqual(response.status_code, 400)
+
+
+class HttpClientTest(TestCase):
+    """Тесты общего клиента внешних HTTP-запросов"""
+
+    def setUp(self):
+        """Настройка тестового окружения"""
+        http_client.reset_stats()
+
+    def test_session_reused_per_host_with_default_timeout(self):
+        """Тест переиспользования сессии хоста и таймаутов по умолчанию"""
+        self.assertIs(http_client.get_session('api.example.com'), http_client.get_session('api.example.com'))
+        self.assertIsNot(http_client.get_session('api.example.com'), http_client.get_session('other.example.com'))
+
+        with mock.patch.object(requests.Session, 'request', return_value=mock.Mock(status_code=200)) as send:
+            http_client.get('https://api.example.com/rates', params={'a': 1}, provider='example')
+
+        self.assertEqual(
+            send.call_args.kwargs['timeout'], (http_client.CONNECT_TIMEOUT, http_client.READ_TIMEOUT)
+        )
+        self.assertEqual(http_client.get_stats()['example']['requests'], 1)
+
+    def test_errors_counted_per_provider(self):
+        """Тест учета ошибок внешних запросов по провайдерам"""
+        with mock.patch.object(requests.Session, 'request', side_effect=requests.exceptions.ConnectTimeout()):
+            with self.assertRaises(requests.exceptions.RequestException):
+                http_client.get('https://api.example.com/rates', provider='example')
+        with mock.patch.object(requests.Session, 'request', return_value=mock.Mock(status_code=503)):
+            http_client.get('https://api.example.com/rates', provider='example')
+
+        stats = http_client.get_stats()['example']
+        self.assertEqual((stats['requests'], stats['errors']), (2, 2))
+        self.assertEqual(stats['last_error'], 'HTTP 503')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CircuitBreakerTest(TestCase):
+    """Тесты автомата отключения недоступных провайдеров"""
+
+    url = 'https://api.example.com/rates'
+
+    def setUp(self):
+        """Настройка тестового окружения"""
+        cache.clear()
+        http_client.reset_stats()
+        create_tracked_coin('BTC', 'bitcoin')
+
+    def fail_requests(self, count):
+        with mock.patch.object(requests.Session, 'request', side_effect=requests.exceptions.ConnectTimeout()) as send:
+            for _ in range(count):
+                with self.assertRaises(requests.exceptions.RequestException):
+                    http_client.get(self.url, provider='example')
+        return send
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        """Тест отключения провайдера: после серии ошибок запросы не выполняются и сразу завершаются ошибкой"""
+        self.fail_requests(http_client.CIRCUIT_FAILURE_THRESHOLD)
+
+        send = self.fail_requests(3)
+        self.assertEqual(send.call_count, 0)
+        self.assertEqual(http_client.get_circuit_states(['example'])['example']['state'], http_client.CIRCUIT_OPEN)
+        with self.assertRaises(http_client.CircuitOpenError):
+            http_client.get(self.url, provider='example')
+
+    def test_success_resets_failure_count(self):
+        """Тест сброса серии ошибок успешным запросом"""
+        self.fail_requests(http_client.CIRCUIT_FAILURE_THRESHOLD - 1)
+        with mock.patch.object(requests.Session, 'request', return_value=mock.Mock(status_code=200)):
+            http_client.get(self.url, provider='example')
+        self.fail_requests(http_client.CIRCUIT_FAILURE_THRESHOLD - 1)
+
+        self.assertEqual(http_client.get_circuit_states(['example'])['example']['state'], http_client.CIRCUIT_CLOSED)
+
+    def test_half_open_allows_single_probe(self):
+        """Тест пробного запроса после истечения времени отключения"""
+        self.fail_requests(http_client.CIRCUIT_FAILURE_THRESHOLD)
+        later = time.time() + http_client.CIRCUIT_RESET_TIMEOUT + 1
+
+        with mock.patch('Ad.http_client.time.time', return_value=later):
+            self.assertEqual(http_client.get_circuit_states(['example'])['example']['state'], http_client.CIRCUIT_HALF_OPEN)
+            # Пробный запрос не удался - провайдер снова отключен
+            send = self.fail_requests(1)
+            self.assertEqual(send.call_count, 1)
+            self.assertEqual(self.fail_requests(1).call_count, 0)
+
+        much_later = later + http_client.CIRCUIT_RESET_TIMEOUT + 1
+        with mock.patch('Ad.http_client.time.time', return_value=much_later), \
+                mock.patch.object(requests.Session, 'request', return_value=mock.Mock(status_code=200)):
+            http_client.get(self.url, provider='example')
+            self.assertEqual(http_client.get_circuit_states(['example'])['example']['state'], http_client.CIRCUIT_CLOSED)
+
+    def test_open_circuit_falls_back_without_waiting(self):
+        """Тест быстрого перехода к резервному источнику при отключенном провайдере"""
+        for provider in ('coingecko', 'cryptocompare'):
+            cache.set(f'http_circuit_failures:{provider}', http_client.CIRCUIT_FAILURE_THRESHOLD)
+            cache.set(f'http_circuit_opened:{provider}', time.time())
+
+        with mock.patch.object(requests.Session, 'request') as send:
+            history = views.load_currency_history('BTC', 'day')
+
+        send.assert_not_called()
+        self.assertTrue(history)
+
+    def test_status_endpoint(self):
+        """Тест страницы состояния внешних сервисов"""
+        self.fail_requests(http_client.CIRCUIT_FAILURE_THRESHOLD)
+
+        response = self.client.get(reverse('service_status'))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual(data['degraded'], ['example'])
+        self.assertEqual(data['providers']['example']['last_error'], 'ConnectTimeout')
+        self.assertEqual(data['providers']['coingecko']['state'], http_client.CIRCUIT_CLOSED)
+        self.assertIn('currency_cache', data)
+
+
+class RateLimitTest(TestCase):
+    """Тесты общего лимита запросов к внешним API"""
+
+    def setUp(self):
+        """Настройка тестового окружения"""
+        patcher = mock.patch.dict(rate_limit.RATE_LIMITS, {
+            'coingecko': {'capacity': 3, 'per_minute': 60, 'reserve': 1},
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = time.time()
+        time_patcher = mock.patch('Ad.rate_limit.time.time', side_effect=lambda: self.now)
+        time_patcher.start()
+        self.addCleanup(time_patcher.stop)
+        create_tracked_coin('BTC', 'bitcoin')
+
+    def test_low_priority_keeps_reserve(self):
+        """Тест резерва: запросы пользователей не забирают токены, оставленные для обновления курсов"""
+        rate_limit.acquire('coingecko')
+        rate_limit.acquire('coingecko')
+        with self.assertRaises(rate_limit.RateLimitExceeded):
+            rate_limit.acquire('coingecko')
+
+        rate_limit.acquire('coingecko', priority=rate_limit.PRIORITY_HIGH)
+        with self.assertRaises(rate_limit.RateLimitExceeded):
+            rate_limit.acquire('coingecko', priority=rate_limit.PRIORITY_HIGH)
+
+    def test_bucket_refills_over_time(self):
+        """Тест пополнения корзины со временем"""
+        for _ in range(3):
+            rate_limit.acquire('coingecko', priority=rate_limit.PRIORITY_HIGH)
+
+        self.now += 2
+        rate_limit.acquire('coingecko')
+        self.assertEqual(rate_limit.get_bucket_states()['coingecko']['tokens'], 1.0)
+
+    def test_high_priority_waits_for_token(self):
+        """Тест ожидания токена плановой задачей вместо отказа"""
+        for _ in range(3):
+            rate_limit.acquire('coingecko', priority=rate_limit.PRIORITY_HIGH)
+
+        def sleep(seconds):
+            self.now += seconds
+
+        with mock.patch('Ad.rate_limit.time.sleep', side_effect=sleep) as sleeper:
+            rate_limit.acquire('coingecko', priority=rate_limit.PRIORITY_HIGH, max_wait=5)
+        sleeper.assert_called_once()
+
+    def test_exhausted_limit_falls_back_to_other_provider(self):
+        """Тест перехода графиков к резервному провайдеру без запроса к CoinGecko при исчерпанном лимите"""
+        for _ in range(2):
+            rate_limit.acquire('coingecko')
+
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'Response': 'Success', 'Data': {'Data': [{'time': 1700000000, 'close': 100.0}]}}
+        with mock.patch.object(requests.Session, 'request', return_value=response) as send:
+            history = views.load_currency_history('BTC', 'day')
+
+        self.assertEqual(history[0]['value'], 100.0)
+        self.assertEqual(send.call_count, 1)
+        self.assertIn('cryptocompare', send.call_args.args[1])
+
+    def test_provider_429_drains_bucket(self):
+        """Тест обнуления корзины, когда провайдер сам сообщил о превышении лимита"""
+        with mock.patch.object(requests.Session, 'request', return_value=mock.Mock(status_code=429)):
+            http_client.get('https://api.coingecko.com/api/v3/ping', provider='coingecko')
+
+        with self.assertRaises(requests.exceptions.RequestException):
+            http_client.get('https://api.coingecko.com/api/v3/ping', provider='coingecko')
+
+
+class JobsStatusAPITest(TestCase):
+    """Тесты API состояния фоновых задач"""
+
+    def create_run(self, hours_ago, duration, latencies_ms, **fields):
+        """Создает выполнение обновления курсов с запросами к CoinGecko заданной длительности"""
+        collector = job_telemetry.RunCollector()
+        for latency_ms in latencies_ms:
+            collector.record_request('coingecko', latency_ms / 1000)
+        return JobRun.objects.create(
+            job_name='update_currency_job',
+            started_at=timezone.now() - timedelta(hours=hours_ago),
+            duration=duration,
+            provider_latencies=collector.providers,
+            **fields
+        )
+
+    def test_jobs_summary(self):
+        """Тест сводки выполнений: длительность, ошибки, перцентили времени ответа и лидер планировщика"""
+        leader_election.try_acquire('scheduler', 'worker-1')
+        self.create_run(3, 2.0, [40] * 9 + [3000], status=JobRun.STATUS_SUCCESS, rows_upserted=11)
+        self.create_run(2, 4.0, [80] * 10, status=JobRun.STATUS_ERROR, error_class='KeyError')
+        self.create_run(48, 100.0, [9000], status=JobRun.STATUS_SUCCESS)
+
+        response = self.client.get(reverse('jobs_status'))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertNotIn('holder', data['leader'])
+        self.assertTrue(data['leader']['active'])
+        self.assertEqual(set(data['jobs']), set(SchedulerSingleton.SCHEDULED_JOBS))
+        self.assertEqual(data['jobs']['fetch_news']['runs'], 0)
+        self.assertIsNone(data['jobs']['fetch_news']['last_run'])
+
+        job = data['jobs']['update_currency_job']
+        self.assertEqual((job['runs'], job['errors']), (2, 1))
+        self.assertEqual((job['avg_duration'], job['max_duration']), (3.0, 4.0))
+        self.assertEqual(job['last_run']['error_class'], 'KeyError')
+        coingecko = job['providers']['coingecko']
+        self.assertEqual(coingecko['requests'], 20)
+        self.assertEqual((coingecko['p50_ms'], coingecko['p95_ms']), (100, 100))
+        self.assertEqual(coingecko['max_ms'], 3000)
+        self.assertEqual(len(coingecko['histogram']), len(data['latency_buckets_ms']) + 1)
+
+    def test_only_get_allowed(self):
+        """Тест того, что состояние задач доступно только GET-запросом"""
+        self.assertEqual(self.client.post(reverse('jobs_status')).status_code, 405)
+
+    def test_period_parameter(self):
+        """Тест периода сводки и некорректного значения"""
+        self.create_run(48, 100.0, [9000], status=JobRun.STATUS_SUCCESS)
+
+        data = self.client.get(reverse('jobs_status'), {'hours': 72}).json()['data']
+        self.assertEqual(data['jobs']['update_currency_job']['runs'], 1)
+        self.assertEqual(data['jobs']['update_currency_job']['providers']['coingecko']['p95_ms'], 10000)
+        self.assertIsNone(data['leader'])
+
+        response = self.client.get(reverse('jobs_status'), {'hours': 'day'})
+        self.assertEqual(response.status_code, 400)
@@ -1,6 +1,14 @@
-from django.test import TestCase
+from io import StringIO
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.management import call_command
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
-from Ad.models import News, NewsRating
+from django.utils import timezone
+from Ad import currency_history
+from Ad.models import News, NewsRating, NewsComment, CurrencyDailyRate, CurrencyRate, CurrencyRateHistory, CurrencyRateRollup, TrackedCoin
 
 class NewsModelTest(TestCase):
     """Тесты для модели News"""
@@ -45,4 +53,255 @@ class NewsRatingModelTest(TestCase):
         # Проверяем строковое представление
         self.assertIn("дизлайк", str(rating))
         self.assertIn(self.user.username, str(rating))
-        self.assertIn(self.news.title, str(rating)) 
\ No newline at end of file
+        self.assertIn(self.news.title, str(rating))
+
+
+class NewsCountersTest(TestCase):
+    """Тесты для денормализованных счетчиков новости"""
+
+    def setUp(self):
+        """Настройка тестового окружения"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpassword'
+        )
+        self.news = News.objects.create(
+            title="Тестовая новость",
+            description="Описание тестовой новости"
+        )
+
+    def test_adjust_counters_never_negative(self):
+        """Тест того, что уменьшение счетчика не уводит его в минус"""
+        News.adjust_counters(self.news.id, likes_count=-1, comments_count=2)
+
+        self.news.refresh_from_db()
+        self.assertEqual(self.news.likes_count, 0)
+        self.assertEqual(self.news.comments_count, 2)
+
+    def test_reconcile_counters_command(self):
+        """Тест команды reconcile_counters, исправляющей расхождения счетчиков"""
+        # Создаем оценку и комментарий в обход счетчиков
+        NewsRating.objects.create(user=self.user, news=self.news, is_like=True)
+        NewsComment.objects.create(user=self.user, news=self.news, text="Комментарий")
+        News.objects.filter(pk=self.news.pk).update(dislikes_count=5)
+
+        out = StringIO()
+        call_command('reconcile_counters', '--dry-run', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.news.refresh_from_db()
+        self.assertEqual(self.news.dislikes_count, 5)
+
+        call_command('reconcile_counters', stdout=StringIO())
+        self.news.refresh_from_db()
+        self.assertEqual(
+            (self.news.likes_count, self.news.dislikes_count, self.news.comments_count),
+            (1, 0, 1)
+        )
+
+        # Повторный запуск не находит расхождений
+        self.assertEqual(News.reconcile_counters(), 0)
+
+
+class CurrencyDailyRateTest(TestCase):
+    """Тесты таблицы дневных курсов и ее догрузки"""
+
+    def test_backfill_fills_gaps_with_last_known_rate(self):
+        """Тест заполнения дней без опубликованного курса последним известным курсом"""
+        rates = {
+            date(2025, 3, 7): Decimal('85.0000'),
+            date(2025, 3, 11): Decimal('86.0000'),
+        }
+        with mock.patch.object(currency_history, 'fetch_daily_rates', return_value=(rates, 'ЦБ РФ')) as fetch:
+            created = currency_history.backfill_daily_rates('USD', date(2025, 3, 8), date(2025, 3, 12))
+
+        self.assertEqual(created, 5)
+        fetch.assert_called_once_with('USD', date(2025, 2, 26), date(2025, 3, 12))
+        stored = dict(CurrencyDailyRate.objects.filter(currency_name='USD').values_list('date', 'rate'))
+        self.assertEqual(stored[date(2025, 3, 8)], Decimal('85.0000'))
+        self.assertEqual(stored[date(2025, 3, 10)], Decimal('85.0000'))
+        self.assertEqual(stored[date(2025, 3, 12)], Decimal('86.0000'))
+
+    def test_backfill_fetches_only_missing_days(self):
+        """Тест того, что догружаются только недостающие начало и конец диапазона"""
+        for day in range(10, 13):
+            CurrencyDailyRate.objects.create(currency_name='USD', date=date(2025, 3, day), rate=Decimal('85'))
+
+        self.assertEqual(
+            currency_history.missing_ranges('USD', date(2025, 3, 5), date(2025, 3, 15)),
+            [(date(2025, 3, 5), date(2025, 3, 9)), (date(2025, 3, 13), date(2025, 3, 15))]
+        )
+        self.assertEqual(currency_history.missing_ranges('USD', date(2025, 3, 10), date(2025, 3, 12)), [])
+
+    def test_daily_history_served_from_table(self):
+        """Тест того, что заполненная таблица отдает год одним запросом по диапазону без обращения к API"""
+        start, end = currency_history.period_bounds('year')
+        CurrencyDailyRate.objects.bulk_create([
+            CurrencyDailyRate(currency_name='USD', date=start + timedelta(days=offset), rate=Decimal('85'))
+            for offset in range((end - start).days + 1)
+        ])
+
+        CurrencyRate.objects.create(currency_name='USD', rate=Decimal('86'))
+
+        with mock.patch.object(currency_history, 'fetch_daily_rates') as fetch, self.assertNumQueries(2):
+            history = currency_history.get_daily_history('USD', 'year')
+
+        fetch.assert_not_called()
+        self.assertEqual(len(history), 366)
+        self.assertEqual(history[0], {'date': start.strftime('%Y-%m-%d'), 'value': 85.0})
+        # Текущий (незавершенный) день не хранится в таблице, а берется из последнего курса
+        self.assertEqual(end, date.today() - timedelta(days=1))
+        self.assertEqual(history[-1], {'date': date.today().strftime('%Y-%m-%d'), 'value': 86.0})
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_empty_range_not_refetched(self):
+        """Тест того, что диапазон без курсов у источника не запрашивается повторно до истечения паузы"""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with mock.patch.object(currency_history, 'fetch_daily_rates', return_value=({}, 'ЦБ РФ')) as fetch:
+            currency_history.backfill_daily_rates('USD', date(2025, 3, 8), date(2025, 3, 12))
+            currency_history.backfill_daily_rates('USD', date(2025, 3, 8), date(2025, 3, 12))
+
+        fetch.assert_called_once()
+        self.assertFalse(CurrencyDailyRate.objects.exists())
+
+
+class CurrencyRateRollupTest(TestCase):
+    """Тесты свертки истории курсов и прореживания графиков"""
+
+    def create_history(self, start, rates, step=timedelta(minutes=20), currency_name='USD'):
+        for index, rate in enumerate(rates):
+            CurrencyRateHistory.objects.create(
+                currency_name=currency_name, rate=Decimal(rate), timestamp=start + step * index
+            )
+
+    def test_rollup_builds_ohlc_for_completed_buckets(self):
+        """Тест построения OHLC только за завершенные часы и дни"""
+        start = timezone.make_aware(datetime(2025, 3, 10, 10, 0))
+        self.create_history(start, ['85', '87', '84', '86', '88', '83'])
+        now = start + timedelta(hours=1, minutes=30)
+
+        currency_history.rollup_currency_history(now)
+
+        hourly = CurrencyRateRollup.objects.get(resolution='hour')
+        self.assertEqual(hourly.bucket_start, start)
+        self.assertEqual(
+            (hourly.open, hourly.high, hourly.low, hourly.close, hourly.samples),
+            (Decimal('85'), Decimal('87'), Decimal('84'), Decimal('84'), 3)
+        )
+        # Текущий день еще не завершен
+        self.assertFalse(CurrencyRateRollup.objects.filter(resolution='day').exists())
+
+        # Повторный запуск на следующий день сворачивает только новые интервалы, а день - из его часов
+        currency_history.rollup_currency_history(start + timedelta(days=1))
+        second = CurrencyRateRollup.objects.get(resolution='hour', bucket_start=start + timedelta(hours=1))
+        self.assertEqual((second.open, second.high, second.low, second.close, second.samples),
+                         (Decimal('86'), Decimal('88'), Decimal('83'), Decimal('83'), 3))
+        self.assertEqual(CurrencyRateRollup.objects.filter(resolution='hour').count(), 2)
+        daily = CurrencyRateRollup.objects.get(resolution='day')
+        self.assertEqual(daily.bucket_start, timezone.make_aware(datetime(2025, 3, 10)))
+        self.assertEqual((daily.open, daily.high, daily.low, daily.close, daily.samples),
+                         (Decimal('85'), Decimal('88'), Decimal('83'), Decimal('83'), 6))
+
+    def test_rollup_tracks_last_bucket_per_currency(self):
+        """Тест того, что отставшая или новая валюта сворачивается, даже если другие уже свернуты позже"""
+        start = timezone.make_aware(datetime(2025, 3, 10, 10, 0))
+        self.create_history(start + timedelta(hours=5), ['85', '86'])
+        currency_history.rollup_currency_history(start + timedelta(hours=6))
+
+        # Записи BTC старше последнего свернутого часа USD
+        self.create_history(start, ['30000', '31000'], currency_name='BTC')
+        currency_history.rollup_currency_history(start + timedelta(hours=6))
+
+        btc = CurrencyRateRollup.objects.get(currency_name='BTC')
+        self.assertEqual(btc.bucket_start, start)
+        self.assertEqual((btc.open, btc.close, btc.samples), (Decimal('30000'), Decimal('31000'), 2))
+        self.assertEqual(CurrencyRateRollup.objects.filter(currency_name='USD').count(), 1)
+
+    def test_rollup_survives_history_pruning(self):
+        """Тест того, что свернутая история остается после удаления старых записей"""
+        start = timezone.now() - timedelta(days=3)
+        self.create_history(start, ['85', '86'])
+        currency_history.rollup_currency_history()
+        CurrencyRateHistory.objects.filter(timestamp__lt=timezone.now() - timedelta(days=1)).delete()
+
+        self.assertFalse(CurrencyRateHistory.objects.exists())
+        self.assertTrue(CurrencyRateRollup.objects.filter(resolution='hour').exists())
+        self.assertTrue(CurrencyRateRollup.objects.filter(resolution='day').exists())
+
+    def test_hourly_rollups_pruned_daily_kept(self):
+        """Тест того, что почасовая свертка удаляется после срока хранения, а дневная остается"""
+        start = timezone.now() - timedelta(days=currency_history.HOURLY_ROLLUP_RETENTION_DAYS + 10)
+        self.create_history(start, ['85', '86'])
+
+        currency_history.rollup_currency_history()
+
+        self.assertFalse(CurrencyRateRollup.objects.filter(resolution='hour').exists())
+        self.assertEqual(CurrencyRateRollup.objects.filter(resolution='day').count(), 1)
+
+    def test_daily_rollup_used_without_daily_rates(self):
+        """Тест графика за месяц по дневной свертке, если в таблице дневных курсов нет валюты"""
+        today = timezone.localdate()
+        for days_ago in range(31, 0, -1):
+            CurrencyRateRollup.objects.create(
+                currency_name='XAU', resolution='day',
+                bucket_start=timezone.make_aware(datetime.combine(today - timedelta(days=days_ago), datetime.min.time())),
+                open=Decimal('100'), high=Decimal('101'), low=Decimal('99'), close=Decimal(100 + days_ago), samples=24
+            )
+        CurrencyRate.objects.create(currency_name='XAU', rate=Decimal('99'))
+
+        history = currency_history.get_daily_rollup_history('XAU', 'month')
+
+        self.assertEqual(len(history), 31)
+        self.assertEqual(history[0], {'date': (today - timedelta(days=30)).strftime('%Y-%m-%d'), 'value': 130.0})
+        self.assertEqual(history[-1]['value'], 99.0)
+        self.assertEqual(currency_history.get_daily_rollup_history('XAU', 'year'), [])
+
+    def test_lttb_keeps_endpoints_and_extremes(self):
+        """Тест прореживания LTTB: число точек, крайние точки и пик сохраняются"""
+        xs = [day * 86400 for day in range(365)]
+        ys = [80.0 + (day % 7) for day in range(365)]
+        ys[200] = 150.0
+
+        indices = currency_history.lttb_indices(xs, ys, 50)
+
+        self.assertEqual(len(indices), 50)
+        self.assertEqual((indices[0], indices[-1]), (0, 364))
+        self.assertEqual(indices, sorted(set(indices)))
+        self.assertIn(200, indices)
+        # Короткий ряд и слишком малый порог не прореживаются
+        self.assertIsNone(currency_history.lttb_indices(xs[:10], ys[:10], 50))
+        self.assertIsNone(currency_history.lttb_indices(xs, ys, 2))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TrackedCoinTest(TestCase):
+    """Тесты реестра отслеживаемых криптовалют"""
+
+    def setUp(self):
+        """Настройка тестового окружения"""
+        cache.clear()
+        TrackedCoin.objects.all().delete()
+        self.coin = TrackedCoin.objects.create(
+            code='BTC', name='Bitcoin', symbol='₿', coingecko_id='bitcoin', fallback_price=Decimal('30000')
+        )
+
+    def test_registry_cached_and_invalidated_on_change(self):
+        """Тест кеширования реестра и его сброса при добавлении монеты"""
+        self.assertEqual(list(TrackedCoin.get_registry()), ['BTC'])
+        with self.assertNumQueries(0):
+            self.assertTrue(currency_history.is_crypto('BTC'))
+            self.assertFalse(currency_history.is_crypto('USD'))
+
+        TrackedCoin.objects.create(code='SOL', name='Solana', symbol='S', coingecko_id='solana', fallback_price=Decimal('100'))
+
+        self.assertEqual(TrackedCoin.get_registry()['SOL']['cryptocompare_symbol'], 'SOL')
+
+    def test_crypto_flag_annotated_in_same_query(self):
+        """Тест признака криптовалюты у курсов без дополнительных запросов"""
+        CurrencyRate.objects.create(currency_name='USD', rate=Decimal('90'))
+        CurrencyRate.objects.create(currency_name='BTC', rate=Decimal('60000'))
+
+        with self.assertNumQueries(1):
+            flags = {rate.currency_name: rate.is_crypto for rate in CurrencyRate.with_crypto_flag()}
+
+        self.assertEqual(flags, {'USD': False, 'BTC': True})
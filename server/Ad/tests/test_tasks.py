@@ -0,0 +1,477 @@
+from django.apps import apps
+from django.core.management import call_command, CommandError
+from django.test import TestCase, override_settings
+from io import StringIO
+from unittest import mock
+from decimal import Decimal
+from Ad.models import CurrencyRate, CurrencyRateHistory, ForexSnapshot, JobRun, News, NewsSource, TrackedCoin
+from Ad.tasks import SchedulerSingleton
+from Ad.tests.utils import create_tracked_coin
+from Ad import http_client, job_telemetry, leader_election, rate_limit
+from django.utils import timezone
+from django.conf import settings
+from apscheduler.triggers.cron import CronTrigger
+from django_apscheduler.models import DjangoJob
+from datetime import date, timedelta
+import os
+import requests
+import signal
+import time
+
+
+class UpdateCurrencyJobTest(TestCase):
+    """Тесты обновления курсов валют"""
+
+    oxr_response = {'base': 'USD', 'timestamp': 0, 'rates': {'USD': 1, 'RUB': 90, 'EUR': 0.9, 'CNY': 7.2}}
+    crypto_rates = {'BTC': Decimal('60000'), 'ETH': Decimal('3000')}
+
+    def setUp(self):
+        """Настройка тестового окружения"""
+        create_tracked_coin('BTC', 'bitcoin', '30000')
+        create_tracked_coin('ETH', 'ethereum', '1600')
+
+    def run_job(self):
+        """Запускает обновление курсов с выполнением действий после фиксации транзакции"""
+        with self.captureOnCommitCallbacks(execute=True):
+            SchedulerSingleton.update_currency_job()
+
+    def test_providers_queried_concurrently(self):
+        """Тест параллельного опроса источников: время обновления равно самому медленному источнику"""
+        def slow_oxr():
+            time.sleep(0.3)
+            return self.oxr_response
+
+        def slow_crypto():
+            time.sleep(0.3)
+            return self.crypto_rates
+
+        with mock.patch.object(SchedulerSingleton, 'fetch_openexchangerates', side_effect=slow_oxr), \
+                mock.patch.object(SchedulerSingleton, 'get_crypto_rates', side_effect=slow_crypto):
+            started = time.monotonic()
+            self.run_job()
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.55)
+        rates = dict(CurrencyRate.objects.values_list('currency_name', 'rate'))
+        self.assertEqual(rates['USD'], Decimal('90'))
+        self.assertEqual(rates['EUR'], Decimal('100'))
+        self.assertEqual(rates['BTC'], Decimal('60000'))
+        self.assertEqual(CurrencyRateHistory.objects.count(), 5)
+        self.assertEqual(ForexSnapshot.objects.get().source, 'OpenExchangeRates')
+
+    def test_fallback_chain_respected(self):
+        """Тест резервных источников: при недоступности OpenExchangeRates используется ЦБ РФ, затем фиксированные значения"""
+        CurrencyRate.objects.create(currency_name='USD', rate=Decimal('80'), source='OpenExchangeRates')
+
+        with mock.patch.object(SchedulerSingleton, 'fetch_openexchangerates', return_value=None), \
+                mock.patch.object(SchedulerSingleton, 'get_crypto_rates', return_value=self.crypto_rates), \
+                mock.patch('Ad.tasks.ExchangeRates', side_effect=ConnectionError('ЦБ РФ недоступен')):
+            self.run_job()
+
+        usd = CurrencyRate.objects.get(currency_name='USD')
+        self.assertEqual(usd.rate, Decimal('90'))
+        self.assertEqual(usd.source, 'Фиксированное значение')
+        self.assertEqual(CurrencyRate.objects.count(), 5)
+        self.assertFalse(ForexSnapshot.objects.exists())
+
+
+class CryptoRatesTest(TestCase):
+    """Тесты получения цен отслеживаемых криптовалют"""
+
+    def setUp(self):
+        """Настройка тестового окружения"""
+        create_tracked_coin('BTC', 'bitcoin', '30000')
+        create_tracked_coin('ETH', 'ethereum', '1600')
+        create_tracked_coin('SOL', 'solana', '100')
+
+    def test_all_coins_in_one_request(self):
+        """Тест того, что цены всех монет реестра запрашиваются одним запросом"""
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'bitcoin': {'usd': 60000}, 'ethereum': {'usd': 3000.5}, 'solana': {'usd': 150}}
+        with mock.patch.object(requests.Session, 'request', return_value=response) as send:
+            rates = SchedulerSingleton.get_crypto_rates()
+
+        send.assert_called_once()
+        self.assertEqual(
+            set(send.call_args.kwargs['params']['ids'].split(',')), {'bitcoin', 'ethereum', 'solana'}
+        )
+        self.assertEqual(rates, {'BTC': Decimal('60000'), 'ETH': Decimal('3000.5'), 'SOL': Decimal('150')})
+
+    def test_missing_coin_uses_fallback_price(self):
+        """Тест резервной цены для монеты, которой нет в ответе, и для всех монет при ошибке"""
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'bitcoin': {'usd': 60000}, 'ethereum': {'usd': 3000}}
+        with mock.patch.object(requests.Session, 'request', return_value=response):
+            rates = SchedulerSingleton.get_crypto_rates()
+        self.assertEqual(rates['SOL'], Decimal('100'))
+        self.assertEqual(rates['BTC'], Decimal('60000'))
+
+        with mock.patch.object(requests.Session, 'request', side_effect=requests.exceptions.ConnectTimeout()):
+            rates = SchedulerSingleton.get_crypto_rates()
+        self.assertEqual(rates, {'BTC': Decimal('30000'), 'ETH': Decimal('1600'), 'SOL': Decimal('100')})
+
+    def test_inactive_coin_not_requested(self):
+        """Тест того, что отключенные монеты не запрашиваются"""
+        TrackedCoin.objects.filter(code='SOL').update(is_active=False)
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'bitcoin': {'usd': 60000}, 'ethereum': {'usd': 3000}}
+        with mock.patch.object(requests.Session, 'request', return_value=response) as send:
+            rates = SchedulerSingleton.get_crypto_rates()
+
+        self.assertNotIn('solana', send.call_args.kwargs['params']['ids'])
+        self.assertEqual(set(rates), {'BTC', 'ETH'})
+
+
+class LeaderElectionTest(TestCase):
+    """Тесты выбора единственного процесса, выполняющего фоновые задачи"""
+
+    def test_only_one_holder_at_a_time(self):
+        """Тест того, что роль получает один процесс, а продлить ее может только он сам"""
+        self.assertTrue(leader_election.try_acquire('scheduler', 'worker-1'))
+        self.assertFalse(leader_election.try_acquire('scheduler', 'worker-2'))
+        self.assertTrue(leader_election.try_acquire('scheduler', 'worker-1'))
+        self.assertEqual(leader_election.get_lease('scheduler').holder, 'worker-1')
+
+    def test_follower_takes_over_expired_lease(self):
+        """Тест перехода роли к другому процессу, когда лидер перестал продлевать аренду"""
+        leader_election.try_acquire('scheduler', 'worker-1')
+
+        later = timezone.now() + timedelta(seconds=leader_election.LEASE_TTL + 1)
+        with mock.patch('Ad.leader_election.timezone.now', return_value=later):
+            self.assertTrue(leader_election.try_acquire('scheduler', 'worker-2'))
+            self.assertFalse(leader_election.try_acquire('scheduler', 'worker-1'))
+
+        lease = leader_election.get_lease('scheduler')
+        self.assertEqual((lease.holder, lease.acquired_at), ('worker-2', later))
+
+    def test_release_lets_follower_take_over(self):
+        """Тест освобождения роли при остановке лидера"""
+        leader_election.try_acquire('scheduler', 'worker-1')
+        leader_election.release('scheduler', 'worker-1')
+
+        self.assertTrue(leader_election.try_acquire('scheduler', 'worker-2'))
+
+    def test_jobs_run_only_in_leader(self):
+        """Тест того, что плановые задачи выполняет только лидер"""
+        self.addCleanup(setattr, SchedulerSingleton, '_leader_until', None)
+        self.addCleanup(setattr, SchedulerSingleton, '_holder_id', None)
+        leader_election.try_acquire(SchedulerSingleton.LEADER_LEASE_NAME, 'other-process')
+        SchedulerSingleton._holder_id = 'this-process'
+
+        with mock.patch.object(SchedulerSingleton, 'update_currency_job') as job:
+            SchedulerSingleton.renew_leadership()
+            SchedulerSingleton.run_scheduled('update_currency_job')
+            job.assert_not_called()
+
+            leader_election.release(SchedulerSingleton.LEADER_LEASE_NAME, 'other-process')
+            SchedulerSingleton.renew_leadership()
+            SchedulerSingleton.run_scheduled('update_currency_job')
+            job.assert_called_once()
+
+
+class RunSchedulerCommandTest(TestCase):
+    """Тесты запуска планировщика отдельным процессом"""
+
+    def test_command_runs_until_signal_and_shuts_down(self):
+        """Тест работы команды до сигнала SIGTERM и корректной остановки планировщика"""
+        def start():
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        out = StringIO()
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        with mock.patch.object(SchedulerSingleton, 'get_instance', side_effect=start) as get_instance, \
+                mock.patch.object(SchedulerSingleton, 'shutdown') as shutdown:
+            call_command('run_scheduler', stdout=out)
+
+        get_instance.assert_called_once()
+        shutdown.assert_called_once_with(wait=True)
+        self.assertIn('SIGTERM', out.getvalue())
+        self.assertIs(signal.getsignal(signal.SIGTERM), previous_handler)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_command_refuses_process_local_cache(self):
+        """Тест того, что планировщик не запускается отдельным процессом с кешем, не общим для процессов"""
+        with mock.patch.object(SchedulerSingleton, 'get_instance') as get_instance:
+            with self.assertRaises(CommandError):
+                call_command('run_scheduler', stdout=StringIO())
+
+        get_instance.assert_not_called()
+
+    def test_web_process_does_not_start_scheduler(self):
+        """Тест того, что веб-процесс не запускает планировщик, если это не включено явно"""
+        config = apps.get_app_config('Ad')
+        with mock.patch('sys.argv', ['gunicorn', 'core.wsgi:application']), \
+                mock.patch.object(SchedulerSingleton, 'get_instance') as get_instance:
+            config.ready()
+            get_instance.assert_not_called()
+
+            with override_settings(SCHEDULER_IN_WEB_PROCESS=True):
+                config.ready()
+            get_instance.assert_called_once()
+
+
+class ScheduledJobsTest(TestCase):
+    """Тесты расписания фоновых задач в хранилище БД"""
+
+    def create_scheduler(self):
+        scheduler = SchedulerSingleton._create_scheduler()
+        scheduler.start(paused=True)
+        self.addCleanup(lambda: scheduler.running and scheduler.shutdown(wait=False))
+        return scheduler
+
+    def test_jobs_use_cron_triggers_and_misfire_grace(self):
+        """Тест расписания по cron с объединением пропущенных запусков"""
+        scheduler = self.create_scheduler()
+        SchedulerSingleton.sync_jobs(scheduler)
+
+        job = scheduler.get_job('update_currency_job')
+        self.assertEqual(str(job.trigger), str(CronTrigger(minute=0, timezone=settings.TIME_ZONE)))
+        self.assertTrue(job.coalesce)
+        self.assertEqual(job.misfire_grace_time, 600)
+        self.assertEqual(job.args, ('update_currency_job',))
+        self.assertEqual(
+            {job.id for job in scheduler.get_jobs()}, set(SchedulerSingleton.SCHEDULED_JOBS)
+        )
+        self.assertTrue(DjangoJob.objects.filter(id='fetch_news').exists())
+
+    def test_restart_keeps_schedule(self):
+        """Тест того, что перезапуск не добавляет лишних запусков и не сбрасывает пропущенный запуск"""
+        first = self.create_scheduler()
+        SchedulerSingleton.sync_jobs(first)
+        missed_run = timezone.now() - timedelta(minutes=5)
+        first.modify_job('update_currency_job', next_run_time=missed_run)
+        first.add_job(print, 'date', run_date=timezone.now() + timedelta(days=1), id='update_currency_job_init')
+        first.shutdown(wait=False)
+
+        second = self.create_scheduler()
+        SchedulerSingleton.sync_jobs(second)
+
+        self.assertEqual(second.get_job('update_currency_job').next_run_time, missed_run)
+        self.assertIsNone(second.get_job('update_currency_job_init'))
+
+    def test_jobs_do_real_work_on_every_run(self):
+        """Тест того, что задача не пропускает запуск из-за текущего времени"""
+        with mock.patch.object(SchedulerSingleton, 'collect_currency_rates') as collect, \
+                mock.patch.object(SchedulerSingleton, 'save_currency_rates'), \
+                mock.patch('Ad.tasks.timezone.now', return_value=timezone.now().replace(minute=17)):
+            collect.return_value = ({'rates': {}, 'source': 'test', 'snapshot': None}, {})
+            SchedulerSingleton.update_currency_job()
+
+        collect.assert_called_once()
+
+    def test_daily_history_backfilled_by_job(self):
+        """Тест догрузки дневных курсов плановой задачей по завершенный день для валют и монет"""
+        create_tracked_coin('BTC', 'bitcoin', '30000')
+        with mock.patch('Ad.tasks.currency_history.backfill_daily_rates', return_value=3) as backfill:
+            SchedulerSingleton.backfill_daily_history()
+
+        yesterday = date.today() - timedelta(days=1)
+        self.assertEqual(
+            {call.args[0] for call in backfill.call_args_list}, {'USD', 'EUR', 'CNY', 'BTC'}
+        )
+        self.assertTrue(all(call.args[2] == yesterday for call in backfill.call_args_list))
+
+
+class JobTelemetryTest(TestCase):
+    """Тесты телеметрии выполнения фоновых задач"""
+
+    oxr_response = {'base': 'USD', 'timestamp': 0, 'rates': {'USD': 1, 'RUB': 90, 'EUR': 0.9, 'CNY': 7.2}}
+
+    def setUp(self):
+        """Настройка тестового окружения: процесс считается лидером"""
+        self.addCleanup(setattr, SchedulerSingleton, '_leader_until', None)
+        SchedulerSingleton._leader_until = time.monotonic() + 60
+        http_client.reset_stats()
+        self.addCleanup(http_client.reset_stats)
+
+    def fake_request(self, method, url, **kwargs):
+        """Ответы внешних API: OpenExchangeRates отвечает 0.3 с, CoinGecko - сразу"""
+        response = mock.Mock(status_code=200)
+        if 'openexchangerates' in url:
+            time.sleep(0.3)
+            response.json.return_value = self.oxr_response
+        else:
+            response.json.return_value = {'bitcoin': {'usd': 60000}}
+        return response
+
+    def fetch_crypto(self):
+        """Запрос цены BTC из потока пула без обращения к реестру монет в БД"""
+        return SchedulerSingleton.fetch_coingecko_prices({'bitcoin': 'BTC'})
+
+    def test_run_records_rows_and_provider_latencies(self):
+        """Тест записи длительности, строк и времени ответа провайдеров, в том числе из потоков пула"""
+        with mock.patch.object(requests.Session, 'request', side_effect=self.fake_request), \
+                mock.patch.object(rate_limit, 'acquire'), \
+                mock.patch.object(SchedulerSingleton, 'get_crypto_rates', side_effect=self.fetch_crypto), \
+                mock.patch.object(TrackedCoin, 'get_registry', return_value={'BTC': {'symbol': '₿'}}), \
+                self.captureOnCommitCallbacks(execute=True):
+            SchedulerSingleton.run_scheduled('update_currency_job')
+
+        run = JobRun.objects.get(job_name='update_currency_job')
+        self.assertEqual(run.status, JobRun.STATUS_SUCCESS)
+        self.assertIsNotNone(run.finished_at)
+        self.assertGreaterEqual(run.duration, 0.3)
+        # 4 текущих курса, 4 записи истории и снимок курсов
+        self.assertEqual((run.rows_upserted, run.rows_deleted), (9, 0))
+        self.assertEqual(set(run.provider_latencies), {'openexchangerates', 'coingecko'})
+        oxr = run.provider_latencies['openexchangerates']
+        self.assertEqual((oxr['requests'], oxr['errors']), (1, 0))
+        self.assertGreaterEqual(oxr['max_ms'], 300)
+        self.assertEqual(oxr['histogram'][job_telemetry.LATENCY_BUCKETS_MS.index(500)], 1)
+        self.assertEqual(sum(run.provider_latencies['coingecko']['histogram']), 1)
+        self.assertEqual(run.error_class, '')
+
+    def test_handled_error_marks_run_failed(self):
+        """Тест того, что ошибка, обработанная самой задачей, отмечается в телеметрии"""
+        with mock.patch.object(SchedulerSingleton, 'collect_currency_rates', side_effect=KeyError('RUB')):
+            SchedulerSingleton.run_scheduled('update_currency_job')
+
+        run = JobRun.objects.get(job_name='update_currency_job')
+        self.assertEqual((run.status, run.error_class), (JobRun.STATUS_ERROR, 'KeyError'))
+
+    def test_rejected_request_counted_as_provider_error(self):
+        """Тест учета запроса, отклоненного лимитом: ошибка провайдера без времени ответа"""
+        rejected = rate_limit.RateLimitExceeded('coingecko', 5)
+        with mock.patch.object(rate_limit, 'acquire', side_effect=rejected), \
+                mock.patch.object(requests.Session, 'request') as send:
+            with job_telemetry.track('manual_job'):
+                self.assertEqual(self.fetch_crypto(), {})
+
+        send.assert_not_called()
+        coingecko = JobRun.objects.get(job_name='manual_job').provider_latencies['coingecko']
+        self.assertEqual((coingecko['requests'], coingecko['errors']), (0, 1))
+        self.assertEqual(coingecko['last_error'], 'RateLimitExceeded')
+
+    def test_old_runs_pruned(self):
+        """Тест удаления телеметрии старше срока хранения истории задач"""
+        old = JobRun.objects.create(
+            job_name='fetch_news',
+            started_at=timezone.now() - timedelta(days=SchedulerSingleton.JOB_HISTORY_RETENTION_DAYS + 1)
+        )
+        SchedulerSingleton.run_scheduled('prune_job_history')
+
+        self.assertFalse(JobRun.objects.filter(pk=old.pk).exists())
+        self.assertEqual(JobRun.objects.get(job_name='prune_job_history').rows_deleted, 1)
+
+
+class FetchNewsTest(TestCase):
+    """Тесты сбора новостей из RSS-каналов"""
+
+    def setUp(self):
+        """Настройка тестового окружения: три источника, первый отвечает дольше остальных"""
+        http_client.reset_stats()
+        self.addCleanup(http_client.reset_stats)
+        self.delays = {'slow.example': 0.4, 'fast.example': 0.1, 'down.example': 0.1}
+        self.sources = [
+            NewsSource.objects.create(name=host, feed_url=f"https://{host}/rss")
+            for host in self.delays
+        ]
+
+    def rss(self, host):
+        published = timezone.now().strftime('%a, %d %b %Y %H:%M:%S +0000')
+        return f"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>{host}</title>
+<item><title>Банк {host} снизил ставки</title><link>https://{host}/news/1</link>
+<description>Новость о банке.</description><pubDate>{published}</pubDate></item>
+<item><title>Погода {host}</title><link>https://{host}/news/2</link>
+<description>Солнечно и тепло.</description><pubDate>{published}</pubDate></item>
+</channel></rss>""".encode('utf-8')
+
+    def fake_request(self, method, url, **kwargs):
+        host = url.split('/')[2]
+        time.sleep(self.delays[host])
+        if host == 'down.example':
+            raise requests.exceptions.ReadTimeout()
+        return mock.Mock(status_code=200, content=self.rss(host), headers={'content-type': 'application/rss+xml'})
+
+    def test_feeds_fetched_concurrently(self):
+        """Тест параллельной загрузки: сбор длится столько, сколько самый медленный канал"""
+        saved_order = []
+        save_feed_entries = SchedulerSingleton.save_feed_entries
+
+        def save(source, entries):
+            saved_order.append(source.name)
+            return save_feed_entries(source, entries)
+
+        with mock.patch.object(requests.Session, 'request', side_effect=self.fake_request) as send, \
+                mock.patch.object(SchedulerSingleton, 'save_feed_entries', side_effect=save):
+            started = time.monotonic()
+            SchedulerSingleton.fetch_news()
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.55)
+        self.assertEqual(send.call_args.kwargs['timeout'], SchedulerSingleton.FEED_TIMEOUT)
+        # Записи идут по порядку источников, недоступный источник пропускается
+        self.assertEqual(saved_order, ['slow.example', 'fast.example'])
+        self.assertEqual(
+            dict(News.objects.values_list('link', 'source__name')),
+            {'https://slow.example/news/1': 'slow.example', 'https://fast.example/news/1': 'fast.example'}
+        )
+
+    def test_feeds_not_retried(self):
+        """Тест загрузки каналов без повторов: время загрузки канала ограничено FEED_TIMEOUT"""
+        sessions = []
+
+        def send(session, method, url, **kwargs):
+            sessions.append(session)
+            return self.fake_request(method, url, **kwargs)
+
+        with mock.patch.object(requests.Session, 'request', autospec=True, side_effect=send):
+            SchedulerSingleton.fetch_news_from_sources(self.sources)
+
+        self.assertEqual(len(sessions), len(self.sources))
+        for session in sessions:
+            self.assertEqual(session.get_adapter('https://').max_retries.total, 0)
+        self.assertGreater(
+            http_client.get_session('down.example').get_adapter('https://down.example/rss').max_retries.total, 0
+        )
+
+    def test_selected_sources_only(self):
+        """Тест обновления только выбранных источников (действие админ-панели)"""
+        with mock.patch.object(requests.Session, 'request', side_effect=self.fake_request) as send:
+            SchedulerSingleton.fetch_news_from_sources(NewsSource.objects.filter(name='fast.example'))
+
+        send.assert_called_once()
+        self.assertEqual(list(News.objects.values_list('source__name', flat=True)), ['fast.example'])
+
+    def test_telemetry_counts_feeds(self):
+        """Тест телеметрии сбора новостей: записанные новости и ошибки каналов"""
+        with mock.patch.object(requests.Session, 'request', side_effect=self.fake_request):
+            with job_telemetry.track('fetch_news'):
+                SchedulerSingleton.fetch_news()
+
+        run = JobRun.objects.get(job_name='fetch_news')
+        self.assertEqual(run.rows_upserted, 2)
+        self.assertEqual(run.provider_latencies['down.example']['last_error'], 'ReadTimeout')
+        self.assertEqual(run.provider_latencies['fast.example']['requests'], 1)
+
+    def test_not_modified_feed_skipped(self):
+        """Тест условного запроса: неизменившийся канал не разбирается и не записывается"""
+        source = self.sources[1]
+
+        def conditional_request(method, url, headers=None, **kwargs):
+            if headers.get('If-None-Match') == '"v1"':
+                return mock.Mock(status_code=304, content=b'', headers={})
+            return mock.Mock(
+                status_code=200, content=self.rss('fast.example'),
+                headers={'ETag': '"v1"', 'Last-Modified': 'Sun, 18 Oct 2026 10:00:00 GMT'}
+            )
+
+        with mock.patch.object(requests.Session, 'request', side_effect=conditional_request):
+            SchedulerSingleton.fetch_news_from_sources([source])
+        source.refresh_from_db()
+        self.assertEqual((source.etag, source.modified), ('"v1"', 'Sun, 18 Oct 2026 10:00:00 GMT'))
+        self.assertEqual(News.objects.count(), 1)
+
+        News.objects.all().delete()
+        with mock.patch.object(requests.Session, 'request', side_effect=conditional_request) as send, \
+                mock.patch('Ad.tasks.feedparser.parse') as parse, \
+                mock.patch.object(SchedulerSingleton, 'save_feed_entries') as save:
+            SchedulerSingleton.fetch_news_from_sources([source])
+
+        self.assertEqual(send.call_args.kwargs['headers'], {
+            'If-None-Match': '"v1"', 'If-Modified-Since': 'Sun, 18 Oct 2026 10:00:00 GMT'
+        })
+        parse.assert_not_called()
+        save.assert_not_called()
+        self.assertFalse(News.objects.exists())
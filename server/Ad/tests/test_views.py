@@ -1,7 +1,8 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
 from django.urls import reverse
 from django.contrib.auth.models import User
-from Ad.models import News, NewsRating
+from Ad.models import News, NewsRating, NewsComment
 
 class MainPageViewTest(TestCase):
     """Тесты для представления главной страницы"""
@@ -81,4 +82,131 @@ class NewsListWithRatingsTest(TestCase):
                 if hasattr(news, 'user_liked'):
                     self.assertTrue(news.user_liked)
                 elif hasattr(news, 'user_rating'):
-                    self.assertEqual(news.user_rating, 'like') 
\ No newline at end of file
+                    self.assertEqual(news.user_rating, 'like') 
+
+class MainPageQueryCountTest(TestCase):
+    """Тесты количества SQL-запросов главной страницы"""
+
+    def setUp(self):
+        """Настройка тестового окружения"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpassword'
+        )
+        other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpassword'
+        )
+
+        # Создаем полную ленту из 10 новостей с оценками и комментариями
+        for i in range(10):
+            news = News.objects.create(
+                title=f"Новость {i+1}",
+                description=f"Описание новости {i+1}"
+            )
+            NewsRating.objects.create(user=self.user, news=news, is_like=i % 2 == 0)
+            NewsRating.objects.create(user=other_user, news=news, is_like=True)
+            NewsComment.objects.create(user=other_user, news=news, text="Комментарий")
+
+        # Оценки и комментарии созданы напрямую, поэтому пересчитываем счетчики
+        News.reconcile_counters()
+
+    def test_anonymous_query_count(self):
+        """Лента для анонимного пользователя строится фиксированным числом запросов"""
+        # Новости, фоновые изображения и курсы валют
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('main'))
+
+        self.assertEqual(response.status_code, 200)
+        news = response.context['news_list'][0]
+        self.assertEqual(news.likes_count + news.dislikes_count, 2)
+        self.assertEqual(news.comments_count, 1)
+        self.assertIsNone(news.user_rating)
+
+    def test_authenticated_query_count(self):
+        """Оценки пользователя не добавляют запросов на каждую новость"""
+        self.client.login(username='testuser', password='testpassword')
+
+        # Сессия и пользователь, затем те же три запроса, что и для анонимного пользователя
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('main'))
+
+        self.assertEqual(response.status_code, 200)
+        ratings = {news.user_rating for news in response.context['news_list']}
+        self.assertEqual(ratings, {'like', 'dislike'})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class MainPageCacheTest(TestCase):
+    """Тесты кеширования главной страницы"""
+
+    def setUp(self):
+        """Настройка тестового окружения"""
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpassword'
+        )
+        self.news = News.objects.create(
+            title="Закешированная новость",
+            description="Описание новости"
+        )
+        NewsRating.objects.create(user=self.user, news=self.news, is_like=True)
+
+    def test_anonymous_cache_hit_without_queries(self):
+        """Повторный запрос анонимного пользователя отдается из кеша без обращений к БД"""
+        first = self.client.get(reverse('main'))
+
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('main'))
+
+        self.assertEqual(first.content, second.content)
+        self.assertNotContains(second, 'id="user-ratings-data"')
+
+    def test_new_news_invalidates_cache(self):
+        """Добавление новости сбрасывает закешированную страницу"""
+        self.client.get(reverse('main'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            News.objects.create(title="Свежая новость", description="Описание")
+
+        response = self.client.get(reverse('main'))
+        self.assertContains(response, "Свежая новость")
+
+    def test_authenticated_user_gets_rating_overlay(self):
+        """Авторизованный пользователь получает общую страницу и свои оценки одним запросом"""
+        self.client.login(username='testuser', password='testpassword')
+        self.client.get(reverse('main'))
+
+        # Сессия, пользователь и оценки пользователя
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('main'))
+
+        self.assertContains(response, 'id="user-ratings-data"')
+        self.assertContains(response, f'"{self.news.id}": "like"')
+
+        # Оценка одного пользователя не попадает в страницу другого
+        User.objects.create_user(username='otheruser', password='testpassword')
+        self.client.login(username='otheruser', password='testpassword')
+        response = self.client.get(reverse('main'))
+        self.assertNotContains(response, 'id="user-ratings-data"')
+
+    def test_rating_change_invalidates_cache(self):
+        """Изменение счетчиков оценок сбрасывает закешированную страницу"""
+        self.client.get(reverse('main'))
+        version = cache.get('news_version')
+
+        self.client.login(username='testuser', password='testpassword')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(
+                reverse('rate_news'),
+                '{"news_id": %d, "rating_type": "dislike"}' % self.news.id,
+                content_type='application/json'
+            )
+
+        # Версия меняется только после фиксации транзакции, иначе страница со старыми
+        # счетчиками может попасть в кеш под новой версией
+        self.assertEqual(cache.get('news_version'), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get('news_version'), version)
@@ -0,0 +1,13 @@
+from decimal import Decimal
+
+from Ad.models import TrackedCoin
+
+
+def create_tracked_coin(code, coingecko_id, fallback_price='30000'):
+    """Добавляет монету в реестр (в БД с миграциями BTC и ETH уже есть)"""
+    return TrackedCoin.objects.get_or_create(code=code, defaults={
+        'name': code,
+        'symbol': code[0],
+        'coingecko_id': coingecko_id,
+        'fallback_price': Decimal(fallback_price),
+    })[0]
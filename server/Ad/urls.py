@@ -15,6 +15,12 @@ api_patterns = [
     path('comments/<int:news_id>/', views.get_comments, name='get_comments'),
     path('add-comment/', views.add_comment, name='add_comment'),
     path('currency-history/', views.get_currency_history, name='currency_history'),
+    path('currency-history/batch/', views.get_currency_history_batch, name='currency_history_batch'),
+    path('currency-analytics/', views.get_currency_analytics, name='currency_analytics'),
+    path('convert/', views.convert_currency, name='convert_currency'),
+    path('news/', views.news_feed_api, name='news_feed'),
+    path('status/', views.service_status, name='service_status'),
+    path('status/jobs/', views.jobs_status, name='jobs_status'),
 ]
 
 # Явно указываем основные маршруты приложения
@@ -4,64 +4,258 @@ from .models import News, CurrencyRate, BackgroundImage, NewsRating, UserProfile
 from django.contrib.auth import authenticate, login, logout, update_session_auth_hash
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm, PasswordChangeForm
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponseRedirect
-from django.views.decorators.http import require_POST
+from django.http import JsonResponse, HttpResponseRedirect, HttpResponse, HttpResponseNotModified
+from django.utils.html import json_script
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.conf import settings
+from django.views.decorators.http import require_POST, require_http_methods
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
 from django.contrib import messages
-from itertools import cycle
 from django.urls import reverse
+import base64
+import binascii
+import hashlib
 import json
 import logging
+import math
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 import calendar
-import requests
 from .weather_utils import weather_service
+from . import page_cache, currency_cache, currency_history, analytics, forex, http_client, job_telemetry, leader_election, rate_limit
 from datetime import datetime, timedelta, timezone
 from django.utils import timezone as django_timezone
 from pycbrf import ExchangeRates
 from zoneinfo import ZoneInfo  # Используем zoneinfo вместо timezone
 
 
+# Размер страницы ленты новостей
+NEWS_FEED_PAGE_SIZE = getattr(settings, 'NEWS_FEED_PAGE_SIZE', 10)
+NEWS_FEED_MAX_PAGE_SIZE = getattr(settings, 'NEWS_FEED_MAX_PAGE_SIZE', 50)
+
+# Максимальное количество точек графика в ответе API истории курсов.
+# Меньше трех точек LTTB не прореживает: первая и последняя точки сохраняются всегда
+CURRENCY_HISTORY_MAX_POINTS = getattr(settings, 'CURRENCY_HISTORY_MAX_POINTS', 200)
+CURRENCY_HISTORY_MIN_POINTS = 3
+
+# Время кеширования ответов конвертера валют в браузере и прокси (в секундах)
+FOREX_HTTP_MAX_AGE = getattr(settings, 'FOREX_HTTP_MAX_AGE', 5 * 60)
+
+# Форматы данных истории курсов: список точек, столбцы и столбцы, закодированные разностями
+CURRENCY_HISTORY_FORMATS = ('points', 'columnar', 'delta')
+
+# Периоды истории курсов: сутки по записям истории и периоды, которые строятся по дневным курсам
+CURRENCY_HISTORY_PERIODS = ('day', *currency_history.PERIOD_DAYS)
+
+# Максимальное количество рядов (валюта и период) в одном пакетном запросе истории курсов.
+# Футер разбивает запрос на части этого размера (base.html)
+CURRENCY_HISTORY_BATCH_MAX_SIZE = getattr(settings, 'CURRENCY_HISTORY_BATCH_MAX_SIZE', 20)
+
+# Время кеширования GET-ответов истории курсов в браузере и прокси (в секундах)
+CURRENCY_HISTORY_HTTP_MAX_AGE = getattr(settings, 'CURRENCY_HISTORY_HTTP_MAX_AGE', {
+    'day': 5 * 60,
+    'week': 30 * 60,
+    'month': 60 * 60,
+    'year': 6 * 60 * 60,
+})
+
+
 def redirect_to_main(request):
     return redirect('main')
 
 
-def main_page(request):
-    news_list = list(News.objects.all().order_by('-date_published')[:10])
-    currency_rates = CurrencyRate.objects.all()
+def annotate_news_feed(queryset, user):
+    """
+    Подготавливает ленту новостей: счетчики уже хранятся в самой новости,
+    а оценку текущего пользователя добавляем подзапросом, чтобы вся лента загружалась одним запросом
+    """
+    queryset = queryset.select_related('source')
+
+    if user.is_authenticated:
+        queryset = queryset.annotate(
+            user_is_like=Subquery(
+                NewsRating.objects.filter(news=OuterRef('pk'), user=user).values('is_like')[:1]
+            )
+        )
+    return queryset
+
+
+def _user_rating_from_annotation(news):
+    """Преобразует аннотацию user_is_like в значение, которое ожидает шаблон"""
+    is_like = getattr(news, 'user_is_like', None)
+    if is_like is None:
+        return None
+    return 'like' if is_like else 'dislike'
+
+
+def _assign_news_backgrounds(news_list, start_position=0):
+    """
+    Назначает новостям фоновые изображения по кругу.
+    start_position - порядковый номер первой новости в ленте, чтобы при подгрузке
+    следующих страниц фоны продолжали чередоваться так же, как на главной странице
+    """
     background_images = list(BackgroundImage.objects.all())
-    current_time = now()
 
     if background_images:
-        bg_cycle = cycle(background_images)
-        for news in news_list:
-            news.assigned_background_url = next(bg_cycle).image.url
+        for offset, news in enumerate(news_list):
+            image = background_images[(start_position + offset) % len(background_images)]
+            news.assigned_background_url = image.image.url
     else:
         for news in news_list:
             news.assigned_background_url = '/static/default_background.jpg'
 
-    # Добавляем количество лайков и дизлайков для каждой новости
+
+def _user_ratings_overlay(user, news_list=None, news_ids=None):
+    """
+    Возвращает оценки пользователя для новостей на странице в виде {news_id: 'like'|'dislike'}.
+    Если лента уже загружена с аннотацией user_is_like, дополнительный запрос не нужен,
+    иначе оценки выбираются одним запросом по списку id.
+    """
+    if not user.is_authenticated:
+        return {}
+
+    if news_list is not None:
+        overlay = {news.id: _user_rating_from_annotation(news) for news in news_list}
+        return {news_id: rating for news_id, rating in overlay.items() if rating}
+
+    ratings = NewsRating.objects.filter(user=user, news_id__in=news_ids).values_list('news_id', 'is_like')
+    return {news_id: 'like' if is_like else 'dislike' for news_id, is_like in ratings}
+
+
+def _apply_user_ratings_overlay(body, overlay):
+    """Подставляет оценки пользователя в общую закешированную страницу"""
+    overlay_html = json_script({str(news_id): rating for news_id, rating in overlay.items()}, 'user-ratings-data') if overlay else ''
+    return body.replace(page_cache.USER_RATINGS_PLACEHOLDER, overlay_html, 1)
+
+
+def main_page(request):
+    # Страница с одноразовыми сообщениями не кешируется, чтобы не показать их другим посетителям
+    cacheable = len(messages.get_messages(request)) == 0
+    cache_key = page_cache.main_page_cache_key(request.path, request.user.is_authenticated)
+
+    cached = page_cache.get_cached_main_page(cache_key) if cacheable else None
+    if cached is not None:
+        # Общая страница из кеша, для авторизованного пользователя - плюс его оценки одним запросом
+        overlay = _user_ratings_overlay(request.user, news_ids=cached['news_ids'])
+        return HttpResponse(_apply_user_ratings_overlay(cached['body'], overlay))
+
+    news_list = list(
+        annotate_news_feed(News.objects.all(), request.user).order_by('-date_published', '-id')[:NEWS_FEED_PAGE_SIZE]
+    )
+    currency_rates = CurrencyRate.with_crypto_flag()
+    current_time = now()
+
+    _assign_news_backgrounds(news_list)
+
+    # Количество лайков, дизлайков и комментариев хранится в самой новости.
+    # Оценка пользователя в общую разметку не попадает, а подставляется поверх нее
+    overlay = _user_ratings_overlay(request.user, news_list=news_list)
     for news in news_list:
-        news.likes_count = NewsRating.objects.filter(news=news, is_like=True).count()
-        news.dislikes_count = NewsRating.objects.filter(news=news, is_like=False).count()
-        # Свойство comments_count вычисляется автоматически, не нужно его устанавливать
-        
-        # Если пользователь аутентифицирован, определяем его оценку
-        if request.user.is_authenticated:
-            try:
-                rating = NewsRating.objects.get(user=request.user, news=news)
-                news.user_rating = 'like' if rating.is_like else 'dislike'
-            except NewsRating.DoesNotExist:
-                news.user_rating = None
-        else:
-            news.user_rating = None
+        news.user_rating = overlay.get(news.id)
 
-    return render(request, 'main.html', {
+    response = render(request, 'main.html', {
         'news_list': news_list,
         'currency_rates': currency_rates,
         'current_time': current_time
     })
 
+    body = response.content.decode(response.charset)
+    if cacheable:
+        page_cache.set_cached_main_page(cache_key, body, [news.id for news in news_list])
+    response.content = _apply_user_ratings_overlay(body, overlay)
+    return response
+
+
+def _encode_feed_cursor(news, position):
+    """Кодирует курсор ленты: дата публикации и id последней новости страницы и ее позиция в ленте"""
+    payload = json.dumps({
+        'date': news.date_published.isoformat(),
+        'id': news.id,
+        'position': position
+    })
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def _decode_feed_cursor(cursor):
+    """Декодирует курсор ленты, при некорректном курсоре выбрасывает ValueError"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (
+            datetime.fromisoformat(payload['date']),
+            int(payload['id']),
+            int(payload.get('position', 0))
+        )
+    except (TypeError, KeyError, UnicodeError, binascii.Error, json.JSONDecodeError) as e:
+        raise ValueError(f"Некорректный курсор: {e}")
+
+
+def _serialize_feed_news(news):
+    """Формирует для API те же поля новости, что и главная страница"""
+    return {
+        'id': news.id,
+        'title': news.title,
+        'description': news.description,
+        'date_published': news.date_published.strftime('%d.%m.%Y %H:%M'),
+        'image': news.image,
+        'link': news.link,
+        'source_url': news.source.feed_url if news.source else None,
+        'likes_count': news.likes_count,
+        'dislikes_count': news.dislikes_count,
+        'comments_count': news.comments_count,
+        'user_rating': _user_rating_from_annotation(news),
+        'background_url': news.assigned_background_url
+    }
+
+
+def news_feed_api(request):
+    """
+    API-endpoint ленты новостей для бесконечной прокрутки.
+    Использует keyset-пагинацию по (date_published, id), поэтому стоимость любой страницы
+    не зависит от глубины прокрутки.
+    """
+    logger = logging.getLogger('Ad.views')
+
+    try:
+        page_size = int(request.GET.get('page_size', NEWS_FEED_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Некорректный размер страницы'}, status=400)
+    page_size = max(1, min(page_size, NEWS_FEED_MAX_PAGE_SIZE))
+
+    queryset = annotate_news_feed(News.objects.all(), request.user).order_by('-date_published', '-id')
+
+    position = 0
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            last_date, last_id, position = _decode_feed_cursor(cursor)
+        except ValueError as e:
+            logger.debug(f"news_feed_api: {e}")
+            return JsonResponse({'status': 'error', 'message': 'Некорректный курсор'}, status=400)
+
+        queryset = queryset.filter(
+            Q(date_published__lt=last_date) | Q(date_published=last_date, id__lt=last_id)
+        )
+
+    # Берем на одну новость больше, чтобы узнать, есть ли следующая страница
+    news_list = list(queryset[:page_size + 1])
+    has_more = len(news_list) > page_size
+    news_list = news_list[:page_size]
+
+    _assign_news_backgrounds(news_list, start_position=position)
+
+    next_cursor = None
+    if has_more:
+        next_cursor = _encode_feed_cursor(news_list[-1], position + len(news_list))
+
+    return JsonResponse({
+        'status': 'success',
+        'news': [_serialize_feed_news(news) for news in news_list],
+        'next_cursor': next_cursor,
+        'has_more': has_more
+    })
+
 
 def login_view(request):
     if request.method == 'POST':
@@ -128,6 +322,11 @@ def change_password(request):
     return render(request, 'profile.html', {'form': form})
 
 
+def _rating_counter(is_like):
+    """Возвращает имя счетчика новости для типа оценки"""
+    return 'likes_count' if is_like else 'dislikes_count'
+
+
 @csrf_exempt
 @require_POST
 def rate_news(request):
@@ -168,30 +367,34 @@ def rate_news(request):
                 'message': 'Пользователь не авторизован'
             })
 
-        # Проверяем, уже оценил ли пользователь эту новость
-        try:
-            rating = NewsRating.objects.get(user=request.user, news=news)
-            # Если тип оценки совпадает с текущей - удаляем оценку
-            if (rating.is_like and rating_type == 'like') or (not rating.is_like and rating_type == 'dislike'):
+        is_like = rating_type == 'like'
+        status = 'success'
+
+        # Оценка и счетчики новости изменяются в одной транзакции
+        with transaction.atomic():
+            # Проверяем, уже оценил ли пользователь эту новость
+            rating = NewsRating.objects.select_for_update().filter(user=request.user, news=news).first()
+            if rating is None:
+                # Создаем новую оценку
+                NewsRating.objects.create(user=request.user, news=news, is_like=is_like)
+                News.adjust_counters(news.id, **{_rating_counter(is_like): 1})
+            elif rating.is_like == is_like:
+                # Если тип оценки совпадает с текущей - удаляем оценку
                 rating.delete()
-                return JsonResponse({
-                    'status': 'removed',
-                    'likes': NewsRating.objects.filter(news=news, is_like=True).count(),
-                    'dislikes': NewsRating.objects.filter(news=news, is_like=False).count()
-                })
+                News.adjust_counters(news.id, **{_rating_counter(is_like): -1})
+                status = 'removed'
             else:
                 # Изменяем тип оценки
-                rating.is_like = rating_type == 'like'
-                rating.save()
-        except NewsRating.DoesNotExist:
-            # Создаем новую оценку
-            rating = NewsRating(user=request.user, news=news, is_like=rating_type == 'like')
-            rating.save()
+                rating.is_like = is_like
+                rating.save(update_fields=['is_like'])
+                News.adjust_counters(news.id, **{_rating_counter(is_like): 1, _rating_counter(not is_like): -1})
+
+            counters = News.objects.filter(pk=news.id).values('likes_count', 'dislikes_count').get()
 
         return JsonResponse({
-            'status': 'success',
-            'likes': NewsRating.objects.filter(news=news, is_like=True).count(),
-            'dislikes': NewsRating.objects.filter(news=news, is_like=False).count()
+            'status': status,
+            'likes': counters['likes_count'],
+            'dislikes': counters['dislikes_count']
         })
     except Exception as e:
         logger.error(f"Error in rate_news: {str(e)}")
@@ -232,7 +435,7 @@ def page_not_found(request, exception):
     """
     # Получаем актуальные курсы валют для отображения в футере
     from .models import CurrencyRate
-    currency_rates = CurrencyRate.objects.all()
+    currency_rates = CurrencyRate.with_crypto_flag()
 
     # Возвращаем страницу с правильным статусом 404
     return render(request, '404.html', {
@@ -247,7 +450,7 @@ def test_404(request):
     logger = logging.getLogger('Ad.views')
     logger.debug(f"test_404 вызван для пути: {request.path}")
     
-    currency_rates = CurrencyRate.objects.all()
+    currency_rates = CurrencyRate.with_crypto_flag()
     
     # Отображаем страницу ошибки
     return render(request, '404.html', {
@@ -346,12 +549,14 @@ def add_comment(request):
         
         # Получаем новость и сохраняем комментарий
         news = get_object_or_404(News, id=news_id)
-        comment = NewsComment(user=request.user, news=news, text=comment_text)
-        comment.save()
-        
-        # Добавляем комментарий в активность пользователя
-        profile = request.user.userprofile
-        profile.add_comment_activity(comment)
+        with transaction.atomic():
+            comment = NewsComment(user=request.user, news=news, text=comment_text)
+            comment.save()
+            News.adjust_counters(news.id, comments_count=1)
+            
+            # Добавляем комментарий в активность пользователя
+            profile = request.user.userprofile
+            profile.add_comment_activity(comment)
         
         return JsonResponse({
             'status': 'success',
@@ -401,11 +606,11 @@ def get_calendar(request, year, month):
 
 def currency_charts(request):
     """View function for the currency charts page."""
-    currency_rates = CurrencyRate.objects.all()
+    currency_rates = CurrencyRate.with_crypto_flag()
     
     # Получаем список валют для отображения в селекторе
     available_currencies = [
-        {'code': rate.currency_name, 'symbol': rate.symbol, 'rate': float(rate.rate)}
+        {'code': rate.currency_name, 'symbol': rate.symbol, 'rate': float(rate.rate), 'is_crypto': rate.is_crypto}
         for rate in currency_rates
     ]
     
@@ -415,39 +620,14 @@ def currency_charts(request):
     })
 
 
-# Кеш для хранения сгенерированных данных
-# Структура: {currency_code: {period: [data]}}
-_currency_data_cache = {}
-_last_hour_checked = None
-
-def _clear_day_cache_if_hour_changed():
-    """Проверяет, сменился ли час, и если да - очищает кеш дневных данных"""
-    global _last_hour_checked
-    current_hour = datetime.now().hour
-    
-    # Если часы изменились или это первая проверка
-    if _last_hour_checked is None or _last_hour_checked != current_hour:
-        # Очищаем только дневные данные
-        for currency in list(_currency_data_cache.keys()):
-            if 'day' in _currency_data_cache[currency]:
-                del _currency_data_cache[currency]['day']
-        
-        _last_hour_checked = current_hour
-
 def fetch_crypto_history_from_coingecko(currency_code, period):
     """Получает исторические данные о курсах криптовалют из CoinGecko."""
     from datetime import datetime, timedelta
     import time
     
-    # Маппинг криптовалютных кодов на ID в CoinGecko
-    crypto_ids = {
-        'BTC': 'bitcoin',
-        'ETH': 'ethereum'
-    }
-    
-    # Получаем ID криптовалюты
-    crypto_id = crypto_ids.get(currency_code)
-    if not crypto_id:
+    # Получаем ID криптовалюты из реестра отслеживаемых монет
+    coin = currency_history.get_coin(currency_code)
+    if not coin:
         raise ValueError(f"Неизвестный код криптовалюты: {currency_code}")
     
     # Определяем параметры запроса в зависимости от периода
@@ -460,7 +640,7 @@ def fetch_crypto_history_from_coingecko(currency_code, period):
         interval = 'hourly'  # Почасовые точки данных
         
         # Для дневного режима используем /coins/{id}/market_chart с минутными интервалами
-        url = f"https://api.coingecko.com/api/v3/coins/{crypto_id}/market_chart"
+        url = f"https://api.coingecko.com/api/v3/coins/{coin['coingecko_id']}/market_chart"
         params = {
             "vs_currency": "usd",
             "days": days,
@@ -476,7 +656,7 @@ def fetch_crypto_history_from_coingecko(currency_code, period):
             days = 365
         
         # Для других периодов используем /coins/{id}/market_chart с дневными интервалами
-        url = f"https://api.coingecko.com/api/v3/coins/{crypto_id}/market_chart"
+        url = f"https://api.coingecko.com/api/v3/coins/{coin['coingecko_id']}/market_chart"
         params = {
             "vs_currency": "usd",
             "days": days,
@@ -485,7 +665,7 @@ def fetch_crypto_history_from_coingecko(currency_code, period):
     
     # Делаем запрос к API
     try:
-        response = requests.get(url, params=params)
+        response = http_client.get(url, params=params, provider='coingecko')
         response.raise_for_status()
         data = response.json()
         
@@ -520,15 +700,11 @@ def fetch_crypto_history_from_cryptocompare(currency_code, period):
     """Получает исторические данные о курсах криптовалют из CryptoCompare."""
     from datetime import datetime, timedelta
     
-    # Маппинг криптовалютных кодов
-    crypto_symbols = {
-        'BTC': 'BTC',
-        'ETH': 'ETH'
-    }
-    
-    symbol = crypto_symbols.get(currency_code)
-    if not symbol:
+    # Символ криптовалюты в CryptoCompare из реестра отслеживаемых монет
+    coin = currency_history.get_coin(currency_code)
+    if not coin:
         raise ValueError(f"Неизвестный код криптовалюты: {currency_code}")
+    symbol = coin['cryptocompare_symbol']
     
     # Определяем параметры запроса в зависимости от периода
     result = []
@@ -576,7 +752,7 @@ def fetch_crypto_history_from_cryptocompare(currency_code, period):
     
     # Делаем запрос к API
     try:
-        response = requests.get(url, params=params)
+        response = http_client.get(url, params=params, provider='cryptocompare')
         response.raise_for_status()
         data = response.json()
         
@@ -614,132 +790,220 @@ def fetch_crypto_history_from_cryptocompare(currency_code, period):
         raise e
 
 
-@require_POST
+def load_currency_history(currency_code, period):
+    """
+    Загружает историю курса валюты из БД или внешних API без использования кеша.
+    Неделя, месяц и год строятся по таблице дневных курсов, которую заполняет плановая задача
+    (неделя - по почасовой свертке истории, если она есть за весь период), а без дневных курсов -
+    по дневной свертке истории.
+    Если это не удалось, и для дневного периода:
+    для криптовалют: БД (дневной период) -> CoinGecko -> CryptoCompare -> сгенерированные данные;
+    для обычных валют: БД (дневной период) -> ЦБ РФ -> сгенерированные данные.
+    """
+    if period in currency_history.PERIOD_DAYS:
+        try:
+            # Неделю показываем по часам, если почасовая свертка покрывает весь период
+            history_data = currency_history.get_hourly_history(currency_code, period) if period == 'week' else []
+            if history_data:
+                return history_data
+            history_data = currency_history.get_daily_history(currency_code, period)
+            if history_data:
+                return history_data
+            history_data = currency_history.get_daily_rollup_history(currency_code, period)
+            if history_data:
+                return history_data
+        except Exception as e:
+            logging.error(f"Ошибка при получении дневных курсов {currency_code} из БД: {str(e)}")
+
+    # Для криптовалют получаем данные с внешних API
+    if currency_history.is_crypto(currency_code):
+        try:
+            # Сначала проверяем, есть ли данные в БД для криптовалют (дневной период)
+            if period == 'day':
+                history_data = get_crypto_history_from_db(currency_code)
+                if history_data and len(history_data) > 0:
+                    return history_data
+
+            # Если в БД нет данных или это не дневной период, используем внешние API
+            try:
+                # Пробуем получить данные из CoinGecko
+                return fetch_crypto_history_from_coingecko(currency_code, period)
+            except Exception as e:
+                logging.error(f"Ошибка при получении данных из CoinGecko: {str(e)}")
+                try:
+                    # Если CoinGecko не сработал, пробуем CryptoCompare
+                    return fetch_crypto_history_from_cryptocompare(currency_code, period)
+                except Exception as e2:
+                    logging.error(f"Ошибка при получении данных из CryptoCompare: {str(e2)}")
+                    # Генерируем данные на основе последней записи или фиксированного значения
+                    return generate_test_crypto_data(currency_code, period)
+        except Exception as e:
+            logging.error(f"Ошибка при получении данных для криптовалюты {currency_code}: {str(e)}")
+            return generate_test_crypto_data(currency_code, period)
+
+    # Для обычных валют сначала пытаемся получить данные из БД
+    try:
+        # Пытаемся получить данные из БД (особенно важно для дневного периода)
+        if period == 'day':
+            history_data = get_currency_history_from_db(currency_code)
+            if history_data and len(history_data) > 0:
+                return history_data
+
+        # Для других периодов или если в БД нет достаточных данных,
+        # используем только ЦБ РФ
+        return fetch_currency_history_from_cb(currency_code, period)
+    except Exception as e:
+        logging.error(f"Ошибка при получении истории курсов: {str(e)}")
+        return generate_test_currency_data(currency_code, period)
+
+
+def get_or_load_currency_history(currency_code, period):
+    """
+    Возвращает историю курса из общего кеша в виде {'data', 'columns', 'freshness', 'fetched_at'}.
+    Устаревшие данные отдаются сразу и обновляются в фоне, при промахе история загружается и кешируется.
+    Одновременные запросы одной валюты и периода ждут единственного обращения к внешнему API.
+    """
+    return currency_cache.get_or_load_history_entry(currency_code, period, load_currency_history)
+
+
+def get_or_load_currency_histories(pairs):
+    """
+    Возвращает историю для списка пар (код валюты, период) в виде {пара: {'data', 'columns', 'freshness', 'fetched_at'}}.
+    Попадания читаются из кеша одним запросом, промахи загружаются параллельно.
+    """
+    return currency_cache.get_or_load_many(pairs, load_currency_history)
+
+
+def _parse_max_points(value):
+    """Возвращает допустимое количество точек графика. Некорректное значение вызывает ValueError"""
+    try:
+        max_points = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('Некорректное количество точек')
+    if max_points < CURRENCY_HISTORY_MIN_POINTS:
+        raise ValueError(f'Количество точек должно быть не меньше {CURRENCY_HISTORY_MIN_POINTS}')
+    return min(max_points, CURRENCY_HISTORY_MAX_POINTS)
+
+
+def _parse_history_period(value):
+    """Проверяет период истории. Неизвестный период вызывает ValueError"""
+    if value not in CURRENCY_HISTORY_PERIODS:
+        raise ValueError(f"Неизвестный период: {value}")
+    return value
+
+
+def _parse_history_format(value):
+    """Проверяет формат данных истории. Неизвестный формат вызывает ValueError"""
+    if value not in CURRENCY_HISTORY_FORMATS:
+        raise ValueError(f"Неизвестный формат данных: {value}")
+    return value
+
+
+def _history_response_item(history, max_points, data_format='points'):
+    """
+    История курса для ответа API: прореженные данные в запрошенном формате и отметка свежести.
+    points - список {'date', 'value'}; columnar - столбцы {'t': [секунды эпохи], 'v': [значения]};
+    delta - те же столбцы, закодированные разностями.
+    """
+    columns = history['columns']
+    indices = currency_history.lttb_indices(columns['t'], columns['v'], max_points)
+    if data_format == 'points':
+        data = history['data'] if indices is None else [history['data'][index] for index in indices]
+    else:
+        if indices is not None:
+            columns = {
+                't': [columns['t'][index] for index in indices],
+                'v': [columns['v'][index] for index in indices],
+            }
+        data = columns if data_format == 'columnar' else currency_history.delta_encode(columns)
+    return {
+        'data': data,
+        'format': data_format,
+        'freshness': history['freshness'],
+        'fetched_at': history['fetched_at'],
+    }
+
+
+def _currency_history_etag(history, *variant):
+    """
+    ETag истории курса по самим данным ряда (время и значения точек) и параметрам ответа variant.
+    Время загрузки в ETag не входит, поэтому перезагруженный без изменений ряд не отдается заново.
+    ETag слабый: при совпадающих данных тело ответа может отличаться временем загрузки.
+    """
+    columns = history['columns']
+    version = f"{':'.join(map(str, variant))}:{len(columns['t'])}:{columns['t']}:{columns['v']}"
+    return 'W/' + quote_etag(hashlib.sha256(version.encode()).hexdigest()[:32])
+
+
+def _is_not_modified(request, history, etag):
+    """Можно ли ответить 304: данные свежие и клиент прислал тот же ETag"""
+    return (
+        history['freshness'] == currency_cache.FRESHNESS_FRESH
+        and etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    )
+
+
+def _set_history_cache_headers(response, period, etag):
+    """
+    Разрешает браузеру и прокси кешировать свежую историю на время, зависящее от периода.
+    Устаревшие данные (обновляются в фоне) кешировать нельзя.
+    """
+    if etag:
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=CURRENCY_HISTORY_HTTP_MAX_AGE.get(period, 0))
+    else:
+        patch_cache_control(response, no_cache=True, max_age=0)
+    return response
+
+
+@require_http_methods(["GET", "POST"])
 def get_currency_history(request):
-    """API-endpoint для получения исторических данных о курсах валют."""
+    """
+    API-endpoint для получения исторических данных о курсах валют.
+    Принимает POST с JSON-телом или GET с параметрами currency, period, max_points и format.
+    GET-ответы отдаются с ETag и Cache-Control, поэтому их могут кешировать браузер и прокси.
+    """
     try:
-        # Очищаем кеш дневных данных, если сменился час
-        _clear_day_cache_if_hour_changed()
-        
-        data = json.loads(request.body)
-        currency_code = data.get('currency_code')
-        period = data.get('period', 'month')
+        if request.method == 'GET':
+            currency_code = request.GET.get('currency')
+            period = request.GET.get('period', 'month')
+            raw_max_points = request.GET.get('max_points', CURRENCY_HISTORY_MAX_POINTS)
+            raw_format = request.GET.get('format', 'points')
+        else:
+            data = json.loads(request.body)
+            currency_code = data.get('currency_code')
+            period = data.get('period', 'month')
+            raw_max_points = data.get('max_points', CURRENCY_HISTORY_MAX_POINTS)
+            raw_format = data.get('format', 'points')
         
         if not currency_code:
             return JsonResponse({'status': 'error', 'message': 'Не указан код валюты'})
-        
-        # Используем кеш данных для конкретной валюты и периода
-        cache_key = f"{currency_code}_{period}"
-        
-        # Для криптовалют получаем данные с внешних API
-        if currency_code in ['BTC', 'ETH']:
-            # Проверяем кеш сначала
-            if currency_code in _currency_data_cache and period in _currency_data_cache[currency_code]:
-                return JsonResponse({
-                    'status': 'success',
-                    'data': _currency_data_cache[currency_code][period]
-                })
-                
-            # Если в кеше нет, получаем реальные данные
-            try:
-                # Сначала проверяем, есть ли данные в БД для криптовалют (дневной период)
-                if period == 'day':
-                    history_data = get_crypto_history_from_db(currency_code)
-                    if history_data and len(history_data) > 0:
-                        # Сохраняем в кеш
-                        if currency_code not in _currency_data_cache:
-                            _currency_data_cache[currency_code] = {}
-                        _currency_data_cache[currency_code][period] = history_data
-                        
-                        return JsonResponse({
-                            'status': 'success',
-                            'data': history_data
-                        })
-                
-                # Если в БД нет данных или это не дневной период, используем генерацию данных
-                # на основе последних записей
-                try:
-                    # Пробуем получить данные из CoinGecko
-                    history_data = fetch_crypto_history_from_coingecko(currency_code, period)
-                except Exception as e:
-                    logging.error(f"Ошибка при получении данных из CoinGecko: {str(e)}")
-                    try:
-                        # Если CoinGecko не сработал, пробуем CryptoCompare
-                        history_data = fetch_crypto_history_from_cryptocompare(currency_code, period)
-                    except Exception as e2:
-                        logging.error(f"Ошибка при получении данных из CryptoCompare: {str(e2)}")
-                        # Генерируем данные на основе последней записи или фиксированного значения
-                        history_data = generate_test_crypto_data(currency_code, period)
-            except Exception as e:
-                logging.error(f"Ошибка при получении данных для криптовалюты {currency_code}: {str(e)}")
-                history_data = generate_test_crypto_data(currency_code, period)
-            
-            # Сохраняем в кеш
-            if currency_code not in _currency_data_cache:
-                _currency_data_cache[currency_code] = {}
-            _currency_data_cache[currency_code][period] = history_data
-            
-            return JsonResponse({
-                'status': 'success',
-                'data': history_data
-            })
-        
-        # Для обычных валют сначала пытаемся получить данные из БД
+
         try:
-            # Проверяем кеш сначала
-            if currency_code in _currency_data_cache and period in _currency_data_cache[currency_code]:
-                return JsonResponse({
-                    'status': 'success',
-                    'data': _currency_data_cache[currency_code][period]
-                })
-            
-            # Если кеша нет, пытаемся получить данные из БД (особенно важно для дневного периода)
-            if period == 'day':
-                history_data = get_currency_history_from_db(currency_code)
-                
-                if history_data and len(history_data) > 0:
-                    # Сохраняем в кеш
-                    if currency_code not in _currency_data_cache:
-                        _currency_data_cache[currency_code] = {}
-                    _currency_data_cache[currency_code][period] = history_data
-                    
-                    return JsonResponse({
-                        'status': 'success',
-                        'data': history_data
-                    })
-            
-            # Для других периодов или если в БД нет достаточных данных, 
-            # используем только ЦБ РФ
-            history_data = fetch_currency_history_from_cb(currency_code, period)
-            
-            # Сохраняем в кеш
-            if currency_code not in _currency_data_cache:
-                _currency_data_cache[currency_code] = {}
-            _currency_data_cache[currency_code][period] = history_data
-            
-            return JsonResponse({
-                'status': 'success',
-                'data': history_data
-            })
-        except Exception as e:
-            logging.error(f"Ошибка при получении истории курсов: {str(e)}")
-            
-            # Если в кеше нет, генерируем тестовые данные
-            if currency_code not in _currency_data_cache or period not in _currency_data_cache[currency_code]:
-                history_data = generate_test_currency_data(currency_code, period)
-                
-                # Сохраняем в кеш
-                if currency_code not in _currency_data_cache:
-                    _currency_data_cache[currency_code] = {}
-                _currency_data_cache[currency_code][period] = history_data
-            else:
-                history_data = _currency_data_cache[currency_code][period]
-                
-            return JsonResponse({
-                'status': 'success',
-                'data': history_data
-            })
-            
+            period = _parse_history_period(period)
+            max_points = _parse_max_points(raw_max_points)
+            data_format = _parse_history_format(raw_format)
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+        history = get_or_load_currency_history(currency_code, period)
+        etag = None
+        if request.method == 'GET':
+            # Совпадение ETag проверяется до прореживания и сериализации ответа
+            etag = _currency_history_etag(history, currency_code, period, max_points, data_format)
+            if _is_not_modified(request, history, etag):
+                return _set_history_cache_headers(HttpResponseNotModified(), period, etag)
+
+        response = JsonResponse({
+            'status': 'success',
+            **_history_response_item(history, max_points, data_format)
+        })
+        if request.method == 'GET':
+            # Устаревшие данные обновляются в фоне, поэтому для них ETag не выдается
+            _set_history_cache_headers(
+                response, period, etag if history['freshness'] == currency_cache.FRESHNESS_FRESH else None
+            )
+        return response
     except Exception as e:
         logging.error(f"Ошибка в get_currency_history: {str(e)}")
         return JsonResponse({
@@ -748,6 +1012,218 @@ def get_currency_history(request):
         }, status=500)
 
 
+@require_http_methods(["GET"])
+def get_currency_analytics(request):
+    """
+    API-endpoint индикаторов по истории курса: доходности, SMA/EMA, скользящая волатильность
+    и сводка (минимум, максимум, изменение за период).
+    Параметры: currency, period, sma и ema (списки окон через запятую), volatility_window, max_points.
+    """
+    try:
+        currency_code = request.GET.get('currency')
+        period = request.GET.get('period', 'month')
+        if not currency_code:
+            return JsonResponse({'status': 'error', 'message': 'Не указан код валюты'}, status=400)
+
+        try:
+            period = _parse_history_period(period)
+            max_points = _parse_max_points(request.GET.get('max_points', CURRENCY_HISTORY_MAX_POINTS))
+            sma_windows = analytics.parse_windows(request.GET.get('sma'), analytics.DEFAULT_SMA_WINDOWS)
+            ema_windows = analytics.parse_windows(request.GET.get('ema'), analytics.DEFAULT_EMA_WINDOWS)
+            volatility_window = analytics.parse_windows(
+                request.GET.get('volatility_window'), (analytics.DEFAULT_VOLATILITY_WINDOW,)
+            )
+            if len(volatility_window) != 1:
+                raise ValueError('Укажите одно окно волатильности')
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+        name = f"analytics:{','.join(map(str, sma_windows))}:{','.join(map(str, ema_windows))}:{volatility_window[0]}"
+        history = get_or_load_currency_history(currency_code, period)
+        etag = _currency_history_etag(history, currency_code, period, max_points, name)
+        if _is_not_modified(request, history, etag):
+            return _set_history_cache_headers(HttpResponseNotModified(), period, etag)
+
+        result = currency_cache.get_or_compute_derived(
+            currency_code, period, history, name,
+            lambda series: analytics.compute_analytics(
+                series['columns'], sma_windows, ema_windows, volatility_window[0]
+            )
+        )
+        columns = history['columns']
+        indices = currency_history.lttb_indices(columns['t'], columns['v'], max_points)
+
+        response = JsonResponse({
+            'status': 'success',
+            'data': analytics.select_points(result, indices),
+            'freshness': history['freshness'],
+            'fetched_at': history['fetched_at'],
+        })
+        return _set_history_cache_headers(
+            response, period, etag if history['freshness'] == currency_cache.FRESHNESS_FRESH else None
+        )
+    except Exception as e:
+        logging.error(f"Ошибка в get_currency_analytics: {str(e)}")
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def convert_currency(request):
+    """
+    API-endpoint конвертации валют по последнему снимку курсов.
+    Параметры: from (код валюты), to (один или несколько кодов через запятую), amount (по умолчанию 1).
+    """
+    from_code = (request.GET.get('from') or '').upper()
+    to_codes = [code.strip().upper() for code in request.GET.get('to', '').split(',') if code.strip()]
+    if not from_code or not to_codes:
+        return JsonResponse({'status': 'error', 'message': 'Не указаны валюты для конвертации'}, status=400)
+
+    try:
+        amount = float(request.GET.get('amount', 1))
+    except ValueError:
+        amount = None
+    # nan и inf float() принимает, но в JSON они не сериализуются
+    if amount is None or not math.isfinite(amount):
+        return JsonResponse({'status': 'error', 'message': 'Некорректная сумма'}, status=400)
+
+    try:
+        vector = forex.get_rate_vector()
+        if vector is None:
+            return JsonResponse({'status': 'error', 'message': 'Нет данных о курсах валют'}, status=503)
+        rates = forex.cross_rates(from_code, to_codes, vector)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    results = {code: round(amount * rate, 4) for code, rate in rates.items()}
+    if not all(math.isfinite(result) for result in results.values()):
+        return JsonResponse({'status': 'error', 'message': 'Слишком большая сумма'}, status=400)
+
+    response = JsonResponse({
+        'status': 'success',
+        'data': {
+            'from': from_code,
+            'amount': amount,
+            'rates': {code: round(rate, 6) for code, rate in rates.items()},
+            'results': results,
+            'source': vector.source,
+            'updated_at': vector.fetched_at.isoformat(),
+        }
+    })
+    patch_cache_control(response, public=True, max_age=FOREX_HTTP_MAX_AGE)
+    return response
+
+
+@require_POST
+def get_currency_history_batch(request):
+    """
+    API-endpoint для получения истории нескольких валют за несколько периодов одним запросом.
+    Принимает {'currency_codes': [...], 'periods': [...]} и возвращает {код: {период: история}}.
+    """
+    try:
+        data = json.loads(request.body)
+        currency_codes = data.get('currency_codes')
+        periods = data.get('periods', ['month'])
+
+        if not currency_codes or not isinstance(currency_codes, list) or not isinstance(periods, list) or not periods:
+            return JsonResponse({'status': 'error', 'message': 'Не указаны коды валют или периоды'}, status=400)
+        if not all(isinstance(item, str) for item in currency_codes + periods):
+            return JsonResponse({'status': 'error', 'message': 'Некорректные коды валют или периоды'}, status=400)
+
+        pairs = list(dict.fromkeys((code, period) for code in currency_codes for period in periods))
+        if len(pairs) > CURRENCY_HISTORY_BATCH_MAX_SIZE:
+            return JsonResponse({
+                'status': 'error',
+                'message': f'Можно запросить не более {CURRENCY_HISTORY_BATCH_MAX_SIZE} рядов за раз'
+            }, status=400)
+
+        try:
+            for period in periods:
+                _parse_history_period(period)
+            max_points = _parse_max_points(data.get('max_points', CURRENCY_HISTORY_MAX_POINTS))
+            data_format = _parse_history_format(data.get('format', 'points'))
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+        result = {}
+        for (currency_code, period), history in get_or_load_currency_histories(pairs).items():
+            result.setdefault(currency_code, {})[period] = _history_response_item(history, max_points, data_format)
+
+        return JsonResponse({'status': 'success', 'data': result})
+    except Exception as e:
+        logging.error(f"Ошибка в get_currency_history_batch: {str(e)}")
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def service_status(request):
+    """
+    API-endpoint состояния внешних сервисов: автоматы отключения провайдеров и лимиты запросов
+    (общие для всех процессов), статистика внешних запросов и кеша истории курсов (текущего процесса и общего кеша).
+    """
+    circuits = http_client.get_circuit_states()
+    response = JsonResponse({
+        'status': 'success',
+        'data': {
+            'degraded': sorted(provider for provider, circuit in circuits.items() if circuit['state'] != http_client.CIRCUIT_CLOSED),
+            'providers': circuits,
+            'http': http_client.get_stats(),
+            'rate_limits': rate_limit.get_bucket_states(),
+            'currency_cache': currency_cache.get_cache_stats(),
+        }
+    })
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@require_http_methods(["GET"])
+def jobs_status(request):
+    """
+    API-endpoint состояния фоновых задач: есть ли процесс-лидер планировщика, время следующего запуска задач
+    и телеметрия выполнений за последние hours часов (по умолчанию 24) - длительность, записанные строки,
+    ошибки и время ответа внешних сервисов.
+    """
+    from .tasks import SchedulerSingleton
+    from django_apscheduler.models import DjangoJob
+
+    max_hours = SchedulerSingleton.JOB_HISTORY_RETENTION_DAYS * 24
+    try:
+        hours = int(request.GET.get('hours', 24))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Некорректный период'}, status=400)
+    hours = max(1, min(hours, max_hours))
+
+    lease = leader_election.get_lease(SchedulerSingleton.LEADER_LEASE_NAME)
+    next_runs = dict(DjangoJob.objects.values_list('id', 'next_run_time'))
+    job_names = list(SchedulerSingleton.SCHEDULED_JOBS)
+    jobs = job_telemetry.get_job_summary(hours=hours, job_names=job_names)
+    for job_name, job in jobs.items():
+        next_run_time = next_runs.get(job_name)
+        job['next_run_time'] = next_run_time.isoformat() if next_run_time else None
+
+    response = JsonResponse({
+        'status': 'success',
+        'data': {
+            'hours': hours,
+            # Имя хоста и pid лидера наружу не отдаются
+            'leader': {
+                'acquired_at': lease.acquired_at.isoformat(),
+                'expires_at': lease.expires_at.isoformat(),
+                'active': lease.expires_at > django_timezone.now(),
+            } if lease else None,
+            'latency_buckets_ms': list(job_telemetry.LATENCY_BUCKETS_MS),
+            'jobs': jobs,
+        }
+    })
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
 def get_currency_history_from_db(currency_code):
     """Получает историю курсов обычных валют из БД для дневного периода."""
     from .models import CurrencyRateHistory
@@ -852,7 +1328,7 @@ def fetch_currency_history_from_cb(currency_code, period):
         else:
             # Если записей нет, получаем текущий курс из ЦБ РФ
             try:
-                rates = ExchangeRates()
+                rates = http_client.call('cbr', ExchangeRates)
                 last_value = float(rates[currency_code].rate)
                 logging.info(f"Получен текущий курс из ЦБ РФ для {currency_code}: {last_value}")
             except Exception as e:
@@ -916,7 +1392,7 @@ def fetch_currency_history_from_cb(currency_code, period):
         # Документация: http://www.cbr.ru/development/SXML/
         url = f"http://www.cbr.ru/scripts/XML_dynamic.asp?date_req1={date1}&date_req2={date2}&VAL_NM_RQ={get_cb_currency_code(currency_code)}"
         
-        response = requests.get(url)
+        response = http_client.get(url, provider='cbr')
         response.raise_for_status()
         
         # Парсим XML
@@ -957,16 +1433,7 @@ def fetch_currency_history_from_cb(currency_code, period):
 
 def get_cb_currency_code(currency_code):
     """Возвращает код валюты для API ЦБ РФ."""
-    # Коды валют для API ЦБ
-    # Полный список кодов: http://www.cbr.ru/scripts/XML_val.asp?d=0
-    cb_codes = {
-        'USD': 'R01235',  # Доллар США
-        'EUR': 'R01239',  # Евро
-        'CNY': 'R01375',  # Китайский юань
-        'GBP': 'R01035'   # Фунт стерлингов
-    }
-    
-    return cb_codes.get(currency_code, 'R01235')  # По умолчанию USD
+    return currency_history.CB_CURRENCY_CODES.get(currency_code, 'R01235')  # По умолчанию USD
 
 
 def generate_test_currency_data(currency_code, period):
@@ -1031,13 +1498,9 @@ def generate_test_crypto_data(currency_code, period):
     today = datetime.now()
     result = []
     
-    # Базовые значения для криптовалют
-    base_values = {
-        'BTC': 30000,
-        'ETH': 1600
-    }
-    
-    base_value = base_values.get(currency_code, 30000)
+    # Базовое значение - резервная цена монеты из реестра
+    coin = currency_history.get_coin(currency_code)
+    base_value = float(coin['fallback_price']) if coin else 30000
     
     # Определяем количество точек и временной шаг
     if period == 'day':
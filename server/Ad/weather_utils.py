@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from django.conf import settings
 from django.utils import timezone
 from .models import WeatherCache
+from . import http_client
 import logging
 import os
 import subprocess
@@ -137,7 +138,7 @@ class WeatherService:
         }
         
         try:
-            response = requests.get(url, params=params)
+            response = http_client.get(url, params=params, provider='openweathermap')
             response.raise_for_status()
             return True
         except requests.RequestException:
@@ -252,7 +253,7 @@ class WeatherService:
 
         try:
             logging.info(f"Запрос текущей погоды: {url}")
-            response = requests.get(url, params=params, timeout=10)
+            response = http_client.get(url, params=params, provider='openweathermap')
             response.raise_for_status()
             
             weather_data = response.json()
@@ -286,7 +287,7 @@ class WeatherService:
 
         try:
             logging.info(f"Запрос почасового прогноза")
-            response = requests.get(url, params=params, timeout=10)
+            response = http_client.get(url, params=params, provider='openweathermap')
             response.raise_for_status()
             
             forecast_data = response.json()
@@ -340,7 +341,7 @@ class WeatherService:
 
         try:
             logging.info(f"Запрос прогноза погоды на {days} дней")
-            response = requests.get(url, params=params, timeout=10)
+            response = http_client.get(url, params=params, provider='openweathermap')
             response.raise_for_status()
             
             forecast_data = response.json()
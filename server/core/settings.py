@@ -140,6 +140,19 @@ if TEST_STAND:
 }
 
 
+# Cache
+# Кеш должен быть общим для всех процессов: веб-воркеры gunicorn и процесс планировщика (run_scheduler)
+# сбрасывают друг другу версии страниц и кеш курсов. По умолчанию - файловый кеш в BASE_DIR/cache,
+# можно указать CACHE_URL=filecache:///app/cache или CACHE_URL=dbcache://adnews_cache
+# (после python manage.py createcachetable). locmemcache:// подходит только для одного процесса
+CACHES = {
+    'default': env.cache('CACHE_URL', default=f"filecache://{BASE_DIR / 'cache'}"),
+}
+
+# Время жизни закешированной главной страницы (в секундах)
+MAIN_PAGE_CACHE_TIMEOUT = env.int('MAIN_PAGE_CACHE_TIMEOUT', default=300)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -253,6 +266,10 @@ OPENWEATHER_API_KEY = '5d5ce032c3e8e1e7fa1b3e7e1626821d'
 DEFAULT_CITY = os.environ.get('DEFAULT_CITY') or os.getenv('DEFAULT_CITY', 'Moscow')
 WEATHER_CACHE_TIMEOUT = int(os.environ.get('WEATHER_CACHE_TIMEOUT') or os.getenv('WEATHER_CACHE_TIMEOUT', 3600))
 
+# Фоновые задачи выполняет отдельный процесс: python manage.py run_scheduler.
+# Для локальной разработки планировщик можно запускать прямо в процессе runserver
+SCHEDULER_IN_WEB_PROCESS = env.bool('SCHEDULER_IN_WEB_PROCESS', default=False)
+
 # Настройки Django Compressor
 COMPRESS_ENABLED = True
 COMPRESS_PRECOMPILERS = (
@@ -0,0 +1,14 @@
+"""
+Настройки для запуска тестов: python manage.py test Ad --settings=core.test_settings
+(pytest использует их через pytest.ini).
+"""
+
+from .settings import *  # noqa
+
+# Кеш отключен, чтобы закешированные страницы и версии не переходили из одного теста в другой.
+# Тесты, проверяющие кеширование, включают локальный кеш сами через override_settings
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}